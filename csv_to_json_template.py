@@ -5,8 +5,13 @@
 import csv
 import json
 import argparse
+import os
 import re
-from typing import List, Optional
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
 
 
 # Под нумерацию подойдут: 1, 1., 1.0, 10.0, 001, " 3.0 "
@@ -43,11 +48,133 @@ def read_csv(path: str, delimiter: str, encoding: str) -> List[List[str]]:
         return [row for row in reader]
 
 
+# ---------- пакетный режим: вся папка CSV ----------
+# Ячейки и координаты берутся из RF200TableLoader (тот же однопроходный выбор разделителя и то же
+# авто-удаление нумерации, что у run-скриптов), поэтому шаблон совпадает по ячейкам с outputs/*.json
+# (index_base=1) и может быть предзаполнен сущностями из готового выхода NER.
+
+def _src_import():
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+
+def prefill_index(pred_path: str) -> Dict[Tuple[int, int, str], List[Dict]]:
+    """
+    (row, col, text) в 1-based координатах → сущности выхода NER (без kb_id).
+    """
+    _src_import()
+    from ner_common import clean_entities
+
+    with open(pred_path, encoding="utf-8") as f:
+        obj = json.load(f)
+    shift = 0 if int((obj.get("meta") or {}).get("index_base", 1)) == 1 else 1
+    out: Dict[Tuple[int, int, str], List[Dict]] = {}
+    for cell in obj.get("results", []):
+        key = (int(cell["row"]) + shift, int(cell["col"]) + shift, cell.get("text"))
+        out.setdefault(key, []).extend(clean_entities(cell.get("entities") or []))
+    return out
+
+
+def template_task(task: Tuple[str, str, Optional[bool], Optional[str], Optional[str], bool]) -> Tuple[str, str, str]:
+    """
+    Один CSV → шаблон. Возвращает (csv, статус, подробности); статус: written | skipped | stale | error.
+    """
+    csv_path, out_path, drop_first_col, prefill_path, prefill_system, force = task
+    _src_import()
+    from ner_common import build_results
+    from output_writer import validate_output, write_json_atomic
+    from table_load import RF200TableLoader
+
+    try:
+        if os.path.exists(out_path) and not force:
+            deps = [csv_path] + ([prefill_path] if prefill_path else [])
+            if os.path.getmtime(out_path) >= max(os.path.getmtime(p) for p in deps):
+                return csv_path, "skipped", "шаблон актуален"
+            with open(out_path, encoding="utf-8") as f:
+                old = json.load(f)
+            if (old.get("meta") or {}).get("prefill") is None and any(r.get("entities") for r in old.get("results", [])):
+                # в шаблоне уже есть ручная разметка — не затираем без --force
+                return csv_path, "stale", "CSV новее шаблона с разметкой (--force, чтобы пересоздать)"
+
+        _, cells = RF200TableLoader(os.path.dirname(csv_path), verbose=False).load_file(
+            csv_path, drop_first_col=drop_first_col, drop_header=True)
+        results = build_results(cells, [[] for _ in cells], index_base=1)
+
+        meta = {"source": os.path.basename(csv_path), "index_base": 1}
+        if prefill_path:
+            reason = validate_output(prefill_path)
+            if reason is not None:
+                return csv_path, "error", f"битый выход NER {prefill_path}: {reason}"
+            ents = prefill_index(prefill_path)
+            for r in results:
+                r["entities"] = list(ents.get((r["row"], r["col"], r["text"]), []))
+            meta["prefill"] = prefill_system
+
+        write_json_atomic(out_path, {
+            "table_name": os.path.splitext(os.path.basename(csv_path))[0],
+            "method": "manual",
+            "meta": meta,
+            "results": results,
+        })
+        filled = sum(1 for r in results if r["entities"])
+        return csv_path, "written", f"ячеек {len(results)}" + (f", предзаполнено {filled}" if prefill_path else "")
+    except Exception as e:  # один битый CSV не должен останавливать пакет
+        return csv_path, "error", f"{type(e).__name__}: {e}"
+
+
+def bulk_main(args) -> int:
+    _src_import()
+    from eval_ner import extract_table_id
+
+    drop_first_col = {"auto": None, "yes": True, "no": False}[args.drop_first_col]
+    csv_files = sorted(f for f in os.listdir(args.input_dir) if f.lower().endswith(".csv"))
+    if not csv_files:
+        print(f"[WARN] Нет CSV в {args.input_dir}")
+        return 0
+
+    tasks = []
+    no_prefill = 0
+    for name in csv_files:
+        prefill_path = None
+        if args.prefill:
+            tid = extract_table_id(name)
+            path = os.path.join(args.pred_dir, f"{tid}_{args.prefill}.json") if tid is not None else None
+            if path and os.path.exists(path):
+                prefill_path = path
+            else:
+                no_prefill += 1
+        tasks.append((
+            os.path.join(args.input_dir, name),
+            os.path.join(args.output_dir, os.path.splitext(name)[0] + ".json"),
+            drop_first_col, prefill_path, args.prefill, args.force,
+        ))
+
+    if args.workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as ex:
+            outcomes = list(ex.map(template_task, tasks))
+    else:
+        outcomes = [template_task(t) for t in tasks]
+
+    counts: Dict[str, int] = {}
+    for csv_path, status, detail in outcomes:
+        counts[status] = counts.get(status, 0) + 1
+        if status in ("stale", "error"):
+            print(f"[WARN] {csv_path}: {detail}")
+        elif status == "written" and not args.quiet:
+            print(f"[OK] {csv_path}: {detail}")
+
+    if no_prefill:
+        print(f"[INFO] Без выхода {args.prefill} в {args.pred_dir}: {no_prefill} CSV (шаблон без предзаполнения)")
+    print(f"[OK] Шаблонов записано: {counts.get('written', 0)}, актуальных: {counts.get('skipped', 0)}, "
+          f"с разметкой и устаревших: {counts.get('stale', 0)}, ошибок: {counts.get('error', 0)} → {args.output_dir}")
+    return 1 if counts.get("error") else 0
+
+
 def main():
     ap = argparse.ArgumentParser(
         description="Convert CSV to JSON template; drop header row and optionally drop numbering column."
     )
-    ap.add_argument("csv_path", help="Path to input CSV")
+    ap.add_argument("csv_path", nargs="?", help="Path to input CSV (not needed with --input-dir)")
     ap.add_argument("-o", "--out", default="out.json", help="Output JSON path (default: out.json)")
     ap.add_argument("-t", "--table-name", default="string", help='Value for "table_name" (default: "string")')
     ap.add_argument("-d", "--delimiter", default="|", help="CSV delimiter (default: |)")
@@ -77,8 +204,27 @@ def main():
         help="Row/col indexing base for ORIGINAL table coords (0 or 1). Default: 1",
     )
 
+    # Пакетный режим
+    ap.add_argument("--input-dir", default=None,
+                    help="Convert every CSV in this directory (loader's delimiter / numbering detection)")
+    ap.add_argument("--output-dir", default=os.path.join("data", "test_set"),
+                    help="Where to write <csv name>.json templates in --input-dir mode (default: data/test_set)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="Parallel processes in --input-dir mode (default: CPU count)")
+    ap.add_argument("--force", action="store_true",
+                    help="Rewrite templates even if up to date or already annotated")
+    ap.add_argument("--prefill", default=None,
+                    help="Pre-fill entities from NER outputs {table_id}_{system}.json, e.g. spacy | gigachat_few")
+    ap.add_argument("--pred-dir", default="outputs", help="Where to look for --prefill outputs (default: outputs)")
+    ap.add_argument("--quiet", action="store_true", help="Only print warnings and the summary")
+
     args = ap.parse_args()
 
+    if args.input_dir:
+        return bulk_main(args)
+    if not args.csv_path:
+        ap.error("csv_path or --input-dir is required")
+
     raw = read_csv(args.csv_path, args.delimiter, args.encoding)
 
     # Флаги удаления для корректного смещения координат
@@ -154,7 +300,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
 #py csv_to_json_template.py "data\all_tables\221_locations_table.csv" -o "data\test_set\221_locations_table.json" --drop-first-col yes
 #py csv_to_json_template.py "data\all_tables\222_locations_table.csv" -o "data\test_set\222_locations_table.json" --drop-first-col no
\ No newline at end of file
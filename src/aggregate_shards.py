@@ -0,0 +1,100 @@
+# aggregate_shards.py
+# Сборка результатов шардированного прогона: выходы выполненных задач из очереди work_queue.py
+# копируются из папок шардов в обычную раскладку outputs/{table_id}_{job}.json, битые выходы
+# возвращаются в очередь, по готовым системам NER запускается eval_ner.py.
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+from output_writer import copy_atomic, validate_output, write_json_atomic
+from shard_worker import NER_JOBS, SRC_DIR
+from work_queue import DEFAULT_QUEUE_PATH, DONE, WorkQueue
+
+DEFAULT_OUT_DIR = r".\outputs"
+DEFAULT_REPORTS_DIR = r".\reports"
+DEFAULT_TEST_SET_DIR = r".\data\test_set"
+
+
+def same_file(a: str, b: str) -> bool:
+    if not os.path.exists(b) or os.path.getsize(a) != os.path.getsize(b):
+        return False
+    with open(a, "rb") as fa, open(b, "rb") as fb:
+        return fa.read() == fb.read()
+
+
+def collect(queue: WorkQueue, out_dir: str) -> Dict[str, List]:
+    """
+    Копирует выходы done-задач в out_dir (атомарно, под блокировкой выхода).
+    """
+    summary: Dict[str, List] = {"copied": [], "unchanged": [], "requeued": []}
+    os.makedirs(out_dir, exist_ok=True)
+
+    for task in queue.tasks(status=DONE):
+        job, table_id, src = task["job"], task["table_id"], task["output"]
+        reason = validate_output(src) if src else "нет пути к выходу"
+        if reason is not None:
+            queue.requeue(job, table_id, reason=f"битый выход {src}: {reason}")
+            summary["requeued"].append([job, table_id])
+            continue
+
+        dst = os.path.join(out_dir, f"{table_id}_{job}.json")
+        if same_file(src, dst):
+            summary["unchanged"].append([job, table_id])
+            continue
+        copy_atomic(src, dst)
+        summary["copied"].append([job, table_id])
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка шардов в outputs/ и отчёты по системам NER")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="Файл очереди (SQLite)")
+    parser.add_argument("--out_dir", default=DEFAULT_OUT_DIR, help="Куда собрать {table_id}_{job}.json")
+    parser.add_argument("--eval", action="store_true", help="Запустить eval_ner.py по собранным системам NER")
+    parser.add_argument("--test_set_dir", default=DEFAULT_TEST_SET_DIR, help="Папка с test_set (JSON)")
+    parser.add_argument("--reports_dir", default=DEFAULT_REPORTS_DIR, help="Куда сохранять отчёты")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+    summary = collect(queue, args.out_dir)
+    status = queue.stats()
+
+    print(f"[OK] Скопировано: {len(summary['copied'])}, без изменений: {len(summary['unchanged'])}")
+    if summary["requeued"]:
+        print(f"[WARN] Возвращено в очередь (битый выход): {len(summary['requeued'])}")
+    for job, counts in sorted(status.items()):
+        print(f"{job:20} " + ", ".join(f"{k}: {v}" for k, v in sorted(counts.items())))
+
+    failed = [t for t in queue.tasks(status="failed")]
+    for t in failed:
+        print(f"[WARN] failed: {t['job']} {t['table_id']} (попыток {t['attempts']}): {t['error']}")
+
+    report_path = os.path.join(args.reports_dir, "shards_summary.json")
+    write_json_atomic(report_path, {
+        "queue": args.queue, "out_dir": args.out_dir, "status": status, **summary,
+        "failed": [{k: t[k] for k in ("job", "table_id", "attempts", "error")} for t in failed],
+    })
+    print(f"[OK] Сводка: {report_path}")
+
+    if args.eval:
+        systems = sorted(job for job in status if job in NER_JOBS and status[job].get(DONE))
+        if not systems:
+            print("[WARN] Нет выполненных задач NER для оценки")
+            return
+        cmd = [
+            sys.executable, os.path.join(SRC_DIR, "eval_ner.py"),
+            "--pred_dir", args.out_dir,
+            "--test_set_dir", args.test_set_dir,
+            "--reports_dir", args.reports_dir,
+            "--systems", ",".join(systems),
+        ]
+        res = subprocess.run(cmd)
+        if res.returncode != 0:
+            print(f"[WARN] eval_ner.py завершился с кодом {res.returncode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# aimd.py
+# Адаптивное ограничение числа одновременных запросов к внешним API (GigaChat, Wikidata):
+# аддитивное увеличение, пока задержка и ошибки в норме, мультипликативное уменьшение
+# при 429 / таймаутах / ошибках raise_for_status.
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+def error_status(exc: BaseException) -> Optional[int]:
+    """
+    HTTP-статус из исключения: response.status_code (requests/httpx), status_code,
+    либо args клиента gigachat — ResponseError(url, status_code, content, headers).
+    """
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None) or getattr(exc, "status_code", None)
+    if status is None and type(exc).__name__.endswith("ResponseError"):
+        args = getattr(exc, "args", ())
+        if len(args) >= 2 and isinstance(args[1], int):
+            status = args[1]
+    return status
+
+
+def is_backoff_error(exc: BaseException) -> bool:
+    """
+    Ошибки, на которые нужно сбросить темп: HTTP-статусы >= 400 (raise_for_status в requests/httpx,
+    ResponseError клиента gigachat), таймауты и обрывы соединения.
+    Определяем по атрибутам и именам классов, чтобы не импортировать сетевые библиотеки.
+    """
+    status = error_status(exc)
+    if status is not None:
+        return status >= 400
+    name = type(exc).__name__
+    return isinstance(exc, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Retry-After ответа (секунды или HTTP-дата) → секунды ожидания; None, если заголовка нет.
+    Заголовки — response.headers (requests/httpx) или args[3] ResponseError клиента gigachat.
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if headers is None and type(exc).__name__.endswith("ResponseError"):
+        args = getattr(exc, "args", ())
+        headers = args[3] if len(args) >= 4 else None
+    try:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+    except AttributeError:
+        return None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, exc: Optional[BaseException] = None,
+                  base: float = 1.0, cap: float = 30.0) -> float:
+    """
+    Пауза перед повтором номер attempt (с 0): Retry-After, если сервер его прислал,
+    иначе экспонента base * 2^attempt (не больше cap) со случайным джиттером 50–100%,
+    чтобы параллельные запросы не повторялись одновременно.
+    """
+    wait = retry_after(exc) if exc is not None else None
+    if wait is not None:
+        return wait
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class AIMDController:
+    """
+    Динамический семафор. Лимит растёт на increase за каждое "окно" из limit успешных
+    ответов (примерно +1 за RTT), пока сглаженная задержка не превышает latency_factor
+    от лучшей наблюдавшейся; при ошибке перегрузки лимит умножается на decrease
+    (не чаще одного раза за RTT, чтобы пачка ошибок одного окна не обнулила лимит).
+    """
+
+    def __init__(
+        self,
+        name: str = "api",
+        initial: int = 2,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_factor: float = 2.0,
+        ewma_alpha: float = 0.2,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.ewma_alpha = ewma_alpha
+
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+        self.ewma_latency: Optional[float] = None
+        self.best_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._started = time.perf_counter()
+
+        self.requests = 0
+        self.errors = 0
+        self.backoffs = 0
+        self.max_limit_seen = int(self.limit)
+
+    # ---------- семафор ----------
+
+    def _acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def _release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """
+        Обёртка вокруг одного запроса: ждёт свободного места, меряет задержку и исход.
+        """
+        self._acquire()
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self._on_error(e, time.perf_counter() - t0)
+            raise
+        else:
+            self._on_success(time.perf_counter() - t0)
+        finally:
+            self._release()
+
+    # ---------- обратная связь ----------
+
+    def _healthy(self) -> bool:
+        if self.best_latency is None or self.ewma_latency is None:
+            return True
+        return self.ewma_latency <= self.latency_factor * self.best_latency
+
+    def _on_success(self, latency: float):
+        with self._cond:
+            self.requests += 1
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency += self.ewma_alpha * (latency - self.ewma_latency)
+            if self.best_latency is None or self.ewma_latency < self.best_latency:
+                self.best_latency = self.ewma_latency
+
+            if self._healthy() and self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + self.increase / max(1.0, self.limit))
+                self.max_limit_seen = max(self.max_limit_seen, int(self.limit))
+            self._cond.notify_all()
+
+    def _on_error(self, exc: BaseException, latency: float):
+        with self._cond:
+            self.requests += 1
+            self.errors += 1
+            if not is_backoff_error(exc):
+                return
+            now = time.perf_counter()
+            if now - self._last_decrease >= (self.ewma_latency or latency):
+                self.limit = max(float(self.min_limit), self.limit * self.decrease)
+                self._last_decrease = now
+                self.backoffs += 1
+
+    # ---------- параллельное выполнение ----------
+
+    def map(self, fn: Callable, items: Iterable) -> List:
+        """
+        fn(item) для всех items в пуле из max_limit потоков, порядок результатов сохраняется.
+        Сколько запросов реально идёт одновременно, решает slot() внутри fn.
+        """
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(x) for x in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_limit, len(items))) as pool:
+            return list(pool.map(fn, items))
+
+    def stats(self) -> Dict:
+        elapsed = time.perf_counter() - self._started
+        ok = self.requests - self.errors
+        return {
+            "name": self.name,
+            "limit": int(self.limit),
+            "max_limit_seen": self.max_limit_seen,
+            "bounds": [self.min_limit, self.max_limit],
+            "requests": self.requests,
+            "errors": self.errors,
+            "backoffs": self.backoffs,
+            "ewma_latency_s": round(self.ewma_latency, 4) if self.ewma_latency is not None else None,
+            "throughput_rps": round(ok / elapsed, 2) if elapsed > 0 else 0.0,
+        }
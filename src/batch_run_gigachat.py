@@ -1,24 +1,98 @@
+import json
 import os
 import subprocess
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from output_writer import write_json_atomic
+
 TABLES_DIR = r".\data\all_tables"
 OUT_DIR = r".\outputs"
+REPORTS_DIR = r".\reports"      # сводка расхода — не в OUT_DIR, где batch_run_nel.py берёт все *.json
 
 os.makedirs(OUT_DIR, exist_ok=True)
 
 MODES = ["few"]          # ← ОБА РЕЖИМА
 TABLE_RANGE = range(211, 226)    # ← диапазон таблиц
+TABLE_MODE = False               # ← табличный режим: заголовки + целые строки в промпте
+ROWS_PER_CALL = 1                # ← строк таблицы на один запрос в табличном режиме
+CASSETTE = None                  # ← файл-кассета (например r".\outputs\cassettes\gigachat.jsonl")
+CASSETTE_MODE = "auto"           # ← record | replay | auto
+FEWSHOT_INDEX = None             # ← кэш индекса few-shot примеров (например r".\models\fewshot_index.pkl")
+BUDGET_TOKENS = None             # ← бюджет токенов на режим (None — без ограничения)
+ON_BUDGET_EXHAUSTED = "spacy"    # ← spacy — оставшиеся таблицы размечаются spaCy | stop — остановиться
+
+# выход запасной разметки spaCy: отдельный суффикс, чтобы не перезаписать выход системы spacy
+# и не смешать его с выходами GigaChat при оценке
+FALLBACK_SUFFIX = "_fallback_spacy"
+
+
+def plan_tables(mode):
+    """
+    Оценка стоимости (токены) и пользы (ячейки, которые не размечаются правилами) для каждой таблицы.
+    С бюджетом таблицы идут по убыванию пользы на токен.
+    """
+    from table_load import RF200TableLoader
+    from token_budget import estimate_table_tokens, table_value
+
+    loader = RF200TableLoader(tables_dir=TABLES_DIR, verbose=False)
+    plan = []
+    for table_id in TABLE_RANGE:
+        headers, cells = loader.load_table_with_header(table_id=table_id, drop_first_col=None, drop_header=True)
+        est = estimate_table_tokens(cells, headers, mode, table_mode=TABLE_MODE, rows_per_call=ROWS_PER_CALL)
+        plan.append({"table_id": table_id, "cells": len(cells), "value": table_value(cells), "est_tokens": est})
+
+    if BUDGET_TOKENS is not None:
+        plan.sort(key=lambda t: -t["value"] / max(1, t["est_tokens"]))
+    return plan
+
+
+def spent_tokens(out_file):
+    try:
+        with open(out_file, encoding="utf-8") as f:
+            return json.load(f).get("meta", {}).get("tokens", {}).get("total_tokens", 0)
+    except (OSError, ValueError):
+        return 0
+
 
 for mode in MODES:
     print(f"\n===== GIGACHAT MODE: {mode.upper()} =====\n")
 
-    for table_id in TABLE_RANGE:
+    spent = 0
+    summary = []
+    stopped = False
+
+    for item in plan_tables(mode):
+        table_id = item["table_id"]
+        suffix = "_table" if TABLE_MODE else ""
         out_file = os.path.join(
             OUT_DIR,
-            f"{table_id}_gigachat_{mode}.json"
+            f"{table_id}_gigachat_{mode}{suffix}.json"
         )
 
+        if BUDGET_TOKENS is not None and spent + item["est_tokens"] > BUDGET_TOKENS:
+            if stopped or ON_BUDGET_EXHAUSTED == "stop":
+                stopped = True
+                summary.append({**item, "backend": "skipped", "tokens": 0})
+                continue
+
+            # бюджет исчерпан — таблица размечается spaCy
+            print(f"=== Table {table_id} → spaCy (бюджет: потрачено {spent}, нужно ~{item['est_tokens']}) ===")
+            out_file = os.path.join(OUT_DIR, f"{table_id}_gigachat_{mode}{suffix}{FALLBACK_SUFFIX}.json")
+            cmd = [
+                sys.executable, r".\src\run.py",
+                "--tables_dir", TABLES_DIR,
+                "--table_id", str(table_id),
+                "--out", out_file,
+                "--drop_first_col", "auto",
+                "--drop_header", "true",
+                "--index_base", "1",
+                "--quiet",
+            ]
+            res = subprocess.run(cmd)
+            summary.append({**item, "backend": "spacy", "tokens": 0, "exit": res.returncode, "out": out_file})
+            continue
+
         print(f"=== Table {table_id} ({mode}) ===")
 
         cmd = [
@@ -33,8 +107,36 @@ for mode in MODES:
             "--index_base", "1",
             "--quiet",
         ]
+        if TABLE_MODE:
+            cmd += ["--table_mode", "--rows_per_call", str(ROWS_PER_CALL)]
+        if CASSETTE:
+            cmd += ["--cassette", CASSETTE, "--cassette_mode", CASSETTE_MODE]
+        if FEWSHOT_INDEX:
+            cmd += ["--fewshot_index", FEWSHOT_INDEX]
 
         res = subprocess.run(cmd)
 
         if res.returncode != 0:
             print(f"[WARN] Failed on table {table_id} ({mode}), exit={res.returncode}")
+
+        tokens = spent_tokens(out_file) if res.returncode == 0 else 0
+        spent += tokens
+        summary.append({**item, "backend": f"gigachat_{mode}", "tokens": tokens, "exit": res.returncode})
+
+    # --- итог по расходу ---
+    print(f"\n[OK] Режим {mode}: потрачено токенов {spent}" + (f" из {BUDGET_TOKENS}" if BUDGET_TOKENS else ""))
+    for s in summary:
+        print(f"  {s['table_id']}: {s['backend']:<14} токенов {s['tokens']:>7} (оценка {s['est_tokens']}, польза {s['value']})")
+
+    # таблицы без выхода GigaChat: eval_ner оценит gigachat_{mode} только по остальным
+    system = f"gigachat_{mode}{suffix}"
+    not_gigachat = sorted(s["table_id"] for s in summary if s["backend"] != f"gigachat_{mode}" or s.get("exit"))
+    if not_gigachat:
+        print(f"[WARN] {system}: нет выхода для {len(not_gigachat)} из {len(summary)} таблиц "
+              f"({', '.join(map(str, not_gigachat))}) — eval_ner оценит {system} без них; "
+              f"запасная разметка spaCy — *_{system}{FALLBACK_SUFFIX}.json")
+
+    summary_file = os.path.join(REPORTS_DIR, f"gigachat_{mode}_budget.json")
+    write_json_atomic(summary_file, {"mode": mode, "budget_tokens": BUDGET_TOKENS, "spent_tokens": spent,
+                                     "not_gigachat": not_gigachat, "tables": summary})
+    print(f"[OK] Сводка: {summary_file}")
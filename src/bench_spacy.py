@@ -0,0 +1,178 @@
+# bench_spacy.py
+# Бенчмарк spaCy-моделей и профилей пайплайна: время загрузки, память, ячеек/с и F1 по test_set.
+# Каждая комбинация модель × профиль запускается в отдельном процессе, чтобы загрузка и память
+# не зависели от предыдущих прогонов.
+#
+# python src/bench_spacy.py --tables_dir .\data\all_tables --models sm,md,lg --profiles full,ner
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_TABLES_DIR = r".\data\all_tables"
+DEFAULT_TEST_SET_DIR = r".\data\test_set"
+DEFAULT_OUT = r".\reports\spacy_bench.json"
+
+
+def rss_mb() -> Optional[float]:
+    """
+    Пиковая память процесса (МБ): psutil, если установлен, иначе resource (нет на Windows).
+    """
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / 2 ** 20, 1)
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux — КБ, macOS — байты
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def gold_files(test_set_dir: str, min_id: Optional[int], max_id: Optional[int],
+               max_tables: Optional[int]) -> Dict[int, str]:
+    from eval_ner import extract_table_id
+
+    out: Dict[int, str] = {}
+    for path in sorted(glob.glob(os.path.join(test_set_dir, "*.json"))):
+        tid = extract_table_id(path)
+        if tid is None or (min_id is not None and tid < min_id) or (max_id is not None and tid > max_id):
+            continue
+        out.setdefault(tid, path)
+    ids = sorted(out)[:max_tables] if max_tables else sorted(out)
+    return {tid: out[tid] for tid in ids}
+
+
+def run_worker(args) -> Dict:
+    """
+    Одна комбинация модель × профиль (в дочернем процессе): загрузка, NER по таблицам test_set, P/R/F1.
+    """
+    from eval_ner import build_index, load_json, metrics
+    from ner_common import build_results
+    from table_load import RF200TableLoader
+
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    import spacy  # noqa: F401 — импорт spaCy входит во время загрузки
+    from ner_spacy import SpacyNER
+    ner = SpacyNER(model_name=args.model, profile=args.profile)
+    load_s = time.perf_counter() - t0
+    rss_loaded = rss_mb()
+
+    loader = RF200TableLoader(tables_dir=args.tables_dir, verbose=False)
+    C = A = N = 0
+    cells_total = 0
+    ner_s = 0.0
+    for tid, gold_path in gold_files(args.test_set_dir, args.min_id, args.max_id, args.max_tables).items():
+        _, cells = loader.load_table_with_header(table_id=tid, drop_first_col=None, drop_header=True)
+        if not cells:
+            continue
+        t1 = time.perf_counter()
+        entities = ner.extract_entities_batch([c["text"] for c in cells])
+        ner_s += time.perf_counter() - t1
+        cells_total += len(cells)
+
+        # test_set размечен в 1-based координатах, как выходы batch_run.py
+        pred = build_index({"results": build_results(cells, entities, index_base=1)}, {}, set())
+        gold = build_index(load_json(gold_path), {}, set())
+        C += len(pred & gold)
+        A += len(pred)
+        N += len(gold)
+
+    p, r, f1 = metrics(C, A, N)
+    return {
+        "model": args.model,
+        "profile": args.profile,
+        "components": ner.components,
+        "load_s": round(load_s, 3),
+        "rss_before_mb": rss_before,
+        "rss_loaded_mb": rss_loaded,
+        "rss_peak_mb": rss_mb(),
+        "cells": cells_total,
+        "ner_s": round(ner_s, 3),
+        "cells_per_s": round(cells_total / ner_s, 1) if ner_s > 0 else None,
+        "precision": round(p, 4),
+        "recall": round(r, 4),
+        "f1": round(f1, 4),
+    }
+
+
+def bench_one(args, model: str, profile: str) -> Dict:
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--worker",
+        "--model", model, "--profile", profile,
+        "--tables_dir", args.tables_dir, "--test_set_dir", args.test_set_dir,
+    ]
+    for name in ("min_id", "max_id", "max_tables"):
+        value = getattr(args, name)
+        if value is not None:
+            cmd += [f"--{name}", str(value)]
+
+    res = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="replace")
+    lines = [ln for ln in res.stdout.splitlines() if ln.startswith("{")]
+    if res.returncode != 0 or not lines:
+        err = (res.stderr.strip().splitlines() or ["нет вывода"])[-1]
+        return {"model": model, "profile": profile, "error": err}
+    return json.loads(lines[-1])
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Бенчмарк spaCy: загрузка, память, ячеек/с и F1 для моделей и профилей")
+    parser.add_argument("--tables_dir", default=DEFAULT_TABLES_DIR, help="Путь к директории с CSV-файлами")
+    parser.add_argument("--test_set_dir", default=DEFAULT_TEST_SET_DIR, help="Папка с test_set (JSON)")
+    parser.add_argument("--models", default="sm,md,lg",
+                        help="Модели через запятую: sm, md, lg, full или имя/путь модели spaCy")
+    parser.add_argument("--profiles", default="full,ner", help="Профили пайплайна через запятую: full, ner")
+    parser.add_argument("--min_id", type=int, default=None, help="Минимальный table_id (включительно)")
+    parser.add_argument("--max_id", type=int, default=None, help="Максимальный table_id (включительно)")
+    parser.add_argument("--max_tables", type=int, default=None, help="Взять не больше N таблиц test_set")
+    parser.add_argument("--out", default=DEFAULT_OUT, help="Куда сохранить отчёт (JSON)")
+
+    # внутренний режим: одна комбинация в дочернем процессе
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--model", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--profile", default="full", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args), ensure_ascii=False))
+        return 0
+
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    if not gold_files(args.test_set_dir, args.min_id, args.max_id, args.max_tables):
+        print(f"[ERROR] В {args.test_set_dir} нет таблиц для оценки")
+        return 1
+
+    rows = []
+    print(f"{'модель':<18} {'профиль':<8} {'загрузка, с':>11} {'память, МБ':>10} {'ячеек/с':>9} {'F1':>7}")
+    for model in models:
+        for profile in profiles:
+            row = bench_one(args, model, profile)
+            rows.append(row)
+            if "error" in row:
+                print(f"{model:<18} {profile:<8} [ERROR] {row['error']}")
+                continue
+            mem = row["rss_peak_mb"] if row["rss_peak_mb"] is not None else "—"
+            print(f"{model:<18} {profile:<8} {row['load_s']:>11.2f} {mem:>10} "
+                  f"{row['cells_per_s'] or 0:>9.1f} {row['f1']:>7.4f}")
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"tables_dir": args.tables_dir, "test_set_dir": args.test_set_dir, "runs": rows},
+                  f, ensure_ascii=False, indent=2)
+    print(f"[OK] Отчёт сохранён: {args.out}")
+    return 0 if all("error" not in r for r in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# bench_startup.py
+# Бенчмарк времени старта CLI: --help и ошибка загрузки таблицы не должны импортировать spaCy / langchain.
+# Возвращает код 1, если какой-то сценарий медленнее порога, тянет тяжёлые модули или завершился с ошибкой.
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+HEAVY_MODULES = ("spacy", "langchain", "langchain_gigachat", "thinc", "torch")
+
+
+def scenarios(tables_dir: str, out_path: str) -> List[Tuple[str, List[str]]]:
+    return [
+        ("run.py --help", ["run.py", "--help"]),
+        ("run_gigachat.py --help", ["run_gigachat.py", "--help"]),
+        ("run_nel.py --help", ["run_nel.py", "--help"]),
+        ("run.py: нет таблицы", ["run.py", "--tables_dir", tables_dir, "--table_id", "999999",
+                                 "--out", out_path, "--quiet"]),
+        ("run_gigachat.py: нет таблицы", ["run_gigachat.py", "--tables_dir", tables_dir, "--table_id", "999999",
+                                          "--out", out_path, "--quiet"]),
+    ]
+
+
+def measure(script_args: List[str], repeat: int) -> Tuple[float, List[str], int]:
+    """
+    Лучшее время из repeat запусков + список тяжёлых модулей, попавших в импорт (по -X importtime)
+    + код возврата (первый ненулевой): скрипт, упавший при импорте, тоже стартует быстро.
+    """
+    best = float("inf")
+    heavy: List[str] = []
+    returncode = 0
+    script = os.path.join(SRC_DIR, script_args[0])
+
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = subprocess.run(
+            [sys.executable, "-X", "importtime", script, *script_args[1:]],
+            cwd=SRC_DIR,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        best = min(best, time.perf_counter() - t0)
+        returncode = returncode or res.returncode
+
+        imported = set()
+        for line in res.stderr.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            name = line.rsplit("|", 1)[-1].strip()
+            imported.add(name.split(".")[0])
+        heavy = sorted(m for m in HEAVY_MODULES if m in imported)
+
+    return best, heavy, returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк времени старта run-скриптов")
+    parser.add_argument("--tables_dir", default=os.path.join(SRC_DIR, "..", "data", "all_tables"))
+    parser.add_argument("--repeat", type=int, default=3, help="Сколько раз запускать каждый сценарий")
+    parser.add_argument("--max_s", type=float, default=1.0, help="Порог времени старта (сек)")
+    args = parser.parse_args()
+
+    out_path = os.path.join(SRC_DIR, "..", "outputs", "_bench_startup.json")
+    failed = 0
+
+    print(f"{'Сценарий':32} | {'Время, с':>9} | Тяжёлые импорты")
+    print("-" * 70)
+
+    for name, script_args in scenarios(args.tables_dir, out_path):
+        elapsed, heavy, returncode = measure(script_args, args.repeat)
+        ok = elapsed <= args.max_s and not heavy and returncode == 0
+        failed += 0 if ok else 1
+        print(f"{name:32} | {elapsed:9.3f} | {', '.join(heavy) or '-'}"
+              f"{f'  exit={returncode}' if returncode else ''}{'' if ok else '  <-- FAIL'}")
+
+    if failed:
+        print(f"\n[FAIL] сценариев с регрессией старта или ошибкой: {failed}")
+        sys.exit(1)
+    print("\n[OK] старт укладывается в порог, тяжёлые модули не импортируются")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# build_gazetteer.py
+# Сборка газеттира для ner_gazetteer.py и сохранение на диск (загрузка потом — один pickle.load)
+
+import argparse
+import time
+
+from ner_gazetteer import DEFAULT_GAZETTEER_PATH, build_gazetteer
+
+DEFAULT_GOLD_DIR = r".\data\test_set"
+DEFAULT_NEL_GLOB = r".\outputs\*_nel.json"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка газеттира (Ахо-Корасик) из test_set и outputs/*_nel.json")
+    parser.add_argument("--gold_dir", default=DEFAULT_GOLD_DIR, help="Папка с ручной разметкой (пусто — не использовать)")
+    parser.add_argument("--nel_glob", default=DEFAULT_NEL_GLOB,
+                        help="Файлы NEL, из которых берутся связанные сущности (пусто — не использовать)")
+    parser.add_argument("--out", default=DEFAULT_GAZETTEER_PATH, help="Куда сохранить газеттир")
+    parser.add_argument("--min_len", type=int, default=2, help="Минимальная длина поверхностной формы")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    gz = build_gazetteer(args.gold_dir or None, args.nel_glob or None, min_len=args.min_len)
+    gz.save(args.out)
+
+    print(f"[OK] Форм в газеттире: {len(gz)}, состояний автомата: {len(gz.goto)}")
+    if gz.trained_tables:
+        print(f"[WARN] В газеттир вошла ручная разметка таблиц {gz.trained_tables[0]}–{gz.trained_tables[-1]} "
+              f"({len(gz.trained_tables)} шт.): eval_ner.py отметит их в train_overlap")
+    print(f"[OK] Собрано за {time.time() - t0:.2f} с, сохранено: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
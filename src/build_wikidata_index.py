@@ -0,0 +1,30 @@
+# build_wikidata_index.py
+# Сборка офлайн-индекса меток Wikidata (SQLite) из дампа или его подмножества
+
+import argparse
+import time
+
+from wikidata_index import build_index
+
+DEFAULT_INDEX_PATH = r".\models\wikidata_ru.sqlite"
+
+
+def main():
+    p = argparse.ArgumentParser(description="Офлайн-индекс Wikidata: метки/алиасы → QID для run_nel.py --index")
+    p.add_argument("dumps", nargs="+", help="файлы дампа Wikidata (.json / .json.gz / .json.bz2, по сущности на строку)")
+    p.add_argument("--out", default=DEFAULT_INDEX_PATH, help="путь к SQLite-индексу")
+    p.add_argument("--language", default="ru", help="язык меток и алиасов")
+    p.add_argument("--min_sitelinks", type=int, default=0, help="пропускать сущности с меньшим числом sitelinks")
+    p.add_argument("--quiet", action="store_true")
+    args = p.parse_args()
+
+    t0 = time.time()
+    total = build_index(args.dumps, args.out, language=args.language,
+                        min_sitelinks=args.min_sitelinks, verbose=not args.quiet)
+
+    print(f"[OK] Сущностей в индексе: {total} ({time.time() - t0:.1f} с)")
+    print(f"[OK] Saved: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# cassette.py
+# Запись и воспроизведение трафика к внешним API (GigaChat, Wikidata): пары запрос → ответ
+# сохраняются в файл-кассету (JSON Lines) во время живого прогона, а затем отдаются офлайн
+# с настраиваемой имитацией задержки. Бенчмарки NER/NEL без сети и без платных ключей.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+MODES = ("record", "replay", "auto")
+
+# версия формата записей: меняется вместе с форматом ответа (GigaChat: {"content", "usage"});
+# записи другой версии при загрузке пропускаются — в auto они перезаписываются живыми ответами
+CASSETTE_VERSION = 2
+
+
+class CassetteMiss(LookupError):
+    """
+    Запроса нет на кассете, а режим replay не разрешает идти в сеть.
+    """
+
+
+def request_key(service: str, request: Dict[str, Any]) -> str:
+    payload = json.dumps({"service": service, "request": request}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    mode:
+      record — всегда живой запрос, ответ дописывается в кассету
+      replay — только кассета, промах → CassetteMiss
+      auto   — кассета, если запрос там есть, иначе живой запрос с записью
+
+    Задержка воспроизведения: latency_ms (фиксированная) или, если None, записанная
+    задержка живого запроса, умноженная на latency_scale.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", latency_ms: Optional[float] = None,
+                 latency_scale: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим кассеты: {mode} (ожидается {', '.join(MODES)})")
+        self.path = path
+        self.mode = mode
+        self.latency_ms = latency_ms
+        self.latency_scale = latency_scale
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0, "stale": 0}
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    if entry.get("version") != CASSETTE_VERSION:
+                        self.stats["stale"] += 1
+                        continue
+                    self.entries[entry["key"]] = entry
+            if self.stats["stale"]:
+                print(f"[WARN] Кассета {path}: пропущено записей другой версии формата: {self.stats['stale']} "
+                      f"(нужна {CASSETTE_VERSION}; перезапишите с --cassette_mode record / auto)")
+        elif mode == "replay":
+            raise FileNotFoundError(path)
+
+    @property
+    def live(self) -> bool:
+        """
+        Может ли кассета пойти в сеть (нужен ли настоящий клиент).
+        """
+        return self.mode != "replay"
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _replay(self, entry: Dict[str, Any]) -> Any:
+        if self.latency_ms is not None:
+            delay = self.latency_ms / 1000.0
+        else:
+            delay = float(entry.get("latency_s") or 0.0) * self.latency_scale
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            self.stats["hits"] += 1
+        return entry["response"]
+
+    def _record(self, key: str, service: str, request: Dict[str, Any], response: Any, latency_s: float):
+        entry = {
+            "version": CASSETTE_VERSION,
+            "key": key,
+            "service": service,
+            "request": request,
+            "response": response,
+            "latency_s": round(latency_s, 4),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self.entries[key] = entry
+            self.stats["recorded"] += 1
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def call(self, service: str, request: Dict[str, Any], fn: Callable[[], Any]) -> Any:
+        """
+        Ответ на request: с кассеты или от fn() (живой запрос; ответ должен сериализоваться в JSON).
+        Ошибки живого запроса не записываются.
+        """
+        key = request_key(service, request)
+
+        if self.mode != "record":
+            entry = self.entries.get(key)
+            if entry is not None:
+                return self._replay(entry)
+            if self.mode == "replay":
+                with self._lock:
+                    self.stats["misses"] += 1
+                raise CassetteMiss(f"{service}: запроса нет на кассете {self.path}")
+
+        t0 = time.perf_counter()
+        response = fn()
+        self._record(key, service, request, response, time.perf_counter() - t0)
+        return response
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "mode": self.mode,
+            "entries": len(self.entries),
+            "latency_ms": self.latency_ms,
+            **self.stats,
+        }
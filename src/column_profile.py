@@ -0,0 +1,220 @@
+# column_profile.py
+# Профилирование столбцов таблицы: по выборке ячеек и заголовку определяем семантический тип
+# столбца и решаем, как его размечать — правилом целиком, по выборке через модель или поячеечно.
+
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from fast_path import FastPathClassifier
+
+# метка fast path → тип столбца
+RULE_LABEL_TYPES = {
+    "QUANTITY": "numeric",
+    "DATE": "date",
+    "PERCENT": "percent",
+    "MONEY": "money",
+    "TIME": "time",
+}
+
+# подсказки по заголовку (нижний регистр, начало слова)
+HEADER_HINTS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("person", ("игрок", "тренер", "имя", "фамилия", "фио", "президент", "глава", "автор",
+                "капитан", "губернатор", "мэр", "министр", "руководитель", "персона")),
+    ("org", ("клуб", "команда", "организац", "компания", "партия", "университет", "издательство",
+             "телеканал", "банк")),
+    ("place", ("город", "округ", "центр", "страна", "регион", "столица", "место", "район", "область",
+               "провинция", "континент", "штат", "стадион", "населённый пункт", "населенный пункт")),
+    ("date", ("дата", "год", "период")),
+    ("numeric", ("площадь", "население", "плотность", "количество", "кол-во", "число", "км", "чел")),
+]
+
+# тип столбца (по заголовку) → ожидаемые метки сущностей: априорная подсказка для ColumnRouter
+TYPE_LABELS: Dict[str, Tuple[str, ...]] = {
+    "person": ("PER",),
+    "place": ("LOC", "GPE", "FAC"),
+    "org": ("ORG",),
+    "date": ("DATE",),
+    "numeric": ("QUANTITY",),
+}
+
+SPACE_RE = re.compile(r"\s+")
+
+# подсказка должна начинать слово: "министр" не должен находиться в "Административный"
+HEADER_HINT_RES = [
+    (col_type, re.compile("|".join(rf"(?<!\w){re.escape(h)}" for h in hints)))
+    for col_type, hints in HEADER_HINTS
+]
+
+
+def header_type(header: str) -> Optional[str]:
+    h = SPACE_RE.sub(" ", (header or "").lower())
+    for col_type, rx in HEADER_HINT_RES:
+        if rx.search(h):
+            return col_type
+    return None
+
+
+def sample_indices(n: int, k: int) -> List[int]:
+    """
+    k равномерно разнесённых позиций из n (начало, середина и конец столбца).
+    """
+    if n <= k:
+        return list(range(n))
+    step = n / k
+    return sorted({int(i * step) for i in range(k)})
+
+
+class ColumnProfiler:
+    """
+    Для каждого столбца:
+      type  — numeric | date | percent | money | time | person | place | org | text
+      route — rule   (почти все значения типизируются регулярками → размечаем правилом)
+              sample (модель на выборке; если выборка согласована — остальное по той же метке)
+              model  (поячеечно, как раньше)
+    """
+
+    def __init__(
+        self,
+        classifier: Optional[FastPathClassifier] = None,
+        sample_size: int = 8,
+        rule_threshold: float = 0.9,
+    ):
+        self.classifier = classifier or FastPathClassifier()
+        self.sample_size = sample_size
+        self.rule_threshold = rule_threshold
+
+    def profile(self, cells: List[Dict], headers: Dict[int, str]) -> Dict[int, Dict]:
+        by_col: Dict[int, List[int]] = defaultdict(list)
+        for i, cell in enumerate(cells):
+            by_col[int(cell["col"])].append(i)
+
+        profiles: Dict[int, Dict] = {}
+        for col, idxs in by_col.items():
+            sample = [idxs[j] for j in sample_indices(len(idxs), self.sample_size)]
+            rule_labels = Counter(
+                self.classifier.classify_label(cells[i]["text"]) for i in sample
+            )
+            rule_labels.pop(None, None)
+
+            header = headers.get(col, "")
+            rule_share = sum(rule_labels.values()) / len(sample) if sample else 0.0
+
+            if rule_labels and rule_share >= self.rule_threshold:
+                top_label = rule_labels.most_common(1)[0][0]
+                col_type, route = RULE_LABEL_TYPES[top_label], "rule"
+            else:
+                col_type = header_type(header) or "text"
+                route = "sample" if len(idxs) > len(sample) else "model"
+
+            profiles[col] = {
+                "col": col,
+                "header": header,
+                "type": col_type,
+                "route": route,
+                "cells": len(idxs),
+                "rule_share": round(rule_share, 3),
+                "sample": sample,
+            }
+
+        return profiles
+
+
+def whole_cell_label(text: str, entities: List[Dict]) -> Optional[str]:
+    """
+    Метка, если модель вернула ровно одну сущность на всю ячейку, иначе None.
+    """
+    if len(entities) != 1:
+        return None
+    if entities[0]["text"].strip() != text.strip():
+        return None
+    return entities[0]["label"]
+
+
+class ColumnRouter:
+    """
+    Разметка таблицы по столбцам поверх любого NER-бэкенда с extract_entities_batch.
+    Модель вызывается одним батчем для выборок и одним — для оставшихся ячеек.
+
+    Тип столбца по заголовку служит априорной меткой (TYPE_LABELS): если выборка согласна
+    с ним, для разметки всего столбца хватает prior_agreement; если модель стабильно даёт
+    метку, противоречащую заголовку, столбец размечается поячеечно.
+    """
+
+    def __init__(self, ner, profiler: Optional[ColumnProfiler] = None, agreement: float = 0.8,
+                 prior_agreement: float = 0.6):
+        self.ner = ner
+        self.profiler = profiler or ColumnProfiler()
+        self.agreement = agreement
+        self.prior_agreement = prior_agreement
+        self.cells = 0
+        self.model_calls = 0
+        self.columns: List[Dict] = []
+
+    def _run_model(self, cells: List[Dict], idxs: List[int], out: List[Optional[List[Dict]]]):
+        if not idxs:
+            return
+        model_out = self.ner.extract_entities_batch([cells[i]["text"] for i in idxs])
+        for i, ents in zip(idxs, model_out):
+            out[i] = ents
+        self.model_calls += len(idxs)
+
+    def extract_table(self, cells: List[Dict], headers: Dict[int, str]) -> List[List[Dict]]:
+        profiles = self.profiler.profile(cells, headers)
+        classifier = self.profiler.classifier
+        out: List[Optional[List[Dict]]] = [None] * len(cells)
+
+        by_col: Dict[int, List[int]] = defaultdict(list)
+        for i, cell in enumerate(cells):
+            by_col[int(cell["col"])].append(i)
+
+        # 1) столбцы-правила: размечаем регулярками, в модель — только нетипичные значения
+        for col, prof in profiles.items():
+            if prof["route"] != "rule":
+                continue
+            for i in by_col[col]:
+                out[i] = classifier.classify(cells[i]["text"])
+
+        # 2) выборки столбцов сущностей — одним батчем
+        sample_idx = [i for prof in profiles.values() if prof["route"] == "sample" for i in prof["sample"]]
+        self._run_model(cells, sample_idx, out)
+
+        for col, prof in profiles.items():
+            if prof["route"] != "sample":
+                continue
+            labels = Counter(whole_cell_label(cells[i]["text"], out[i] or []) for i in prof["sample"])
+            label, cnt = labels.most_common(1)[0]
+            prior = TYPE_LABELS.get(prof["type"])
+            if prior is not None:
+                prof["prior"] = list(prior)
+            if label is not None and prior is not None and label not in prior:
+                prof["route"] = "model"  # модель спорит с заголовком — не тиражируем её метку
+                prof["prior_conflict"] = label
+                continue
+            need = self.prior_agreement if prior is not None else self.agreement
+            if label is not None and cnt / len(prof["sample"]) >= need:
+                prof["label"] = label
+                for i in by_col[col]:
+                    if out[i] is None:
+                        out[i] = [{"text": cells[i]["text"].strip(), "label": label, "source": "column"}]
+            else:
+                prof["route"] = "model"  # выборка не согласована — размечаем столбец поячеечно
+
+        # 3) всё остальное — поячеечно одним батчем
+        rest = [i for i, ents in enumerate(out) if ents is None]
+        self._run_model(cells, rest, out)
+
+        self.cells += len(cells)
+        self.columns = [
+            {k: v for k, v in prof.items() if k != "sample"}
+            for _, prof in sorted(profiles.items())
+        ]
+        return [ents or [] for ents in out]
+
+    def stats(self) -> Dict:
+        return {
+            "cells": self.cells,
+            "model_calls": self.model_calls,
+            "model_calls_avoided": self.cells - self.model_calls,
+            "columns": self.columns,
+        }
@@ -3,17 +3,30 @@
 # Авто-режим: оценивает 3 набора (spacy / gigachat_zero / gigachat_few) и сохраняет в reports/
 
 import argparse
+import hashlib
 import json
 import os
 import glob
 import re
-from typing import Dict, Tuple, Set, Optional, Iterable
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 
 DEFAULT_PRED_DIR = r".\outputs"
 DEFAULT_TEST_SET_DIR = r".\data\test_set"
 DEFAULT_REPORTS_DIR = r".\reports"
 
+# системы по умолчанию: предсказания *_{system}.json → reports/ner_report_{system}.json
+DEFAULT_SYSTEMS = "spacy,gigachat_zero,gigachat_few"
+
+# кэш счётчиков пар pred ↔ test (reports/.eval_cache.json)
+EVAL_CACHE_NAME = ".eval_cache.json"
+EVAL_CACHE_VERSION = 2
+# режим сопоставления сущностей входит в ключ кэша: (row, col, нормализованный текст, метка) — точное совпадение
+MATCH_MODE = "exact"
+# записи кэша, которые не использовались дольше, удаляются
+EVAL_CACHE_TTL_S = 30 * 24 * 3600
+
 
 def norm_text(s: str) -> str:
     s = (s or "").strip().lower()
@@ -56,7 +69,10 @@ def apply_label_map(label: str, label_map: Dict[str, str]) -> str:
     return label_map.get(label, label)
 
 
-def iter_entities(obj: dict) -> Iterable[Tuple[int, int, str, str]]:
+def iter_links(obj: dict) -> Iterable[Tuple[int, int, str, str, Optional[str]]]:
+    """
+    Сущности с kb_id (None — сущность не связана).
+    """
     for cell in obj.get("results", []):
         row = cell.get("row")
         col = cell.get("col")
@@ -65,7 +81,13 @@ def iter_entities(obj: dict) -> Iterable[Tuple[int, int, str, str]]:
             label = ent.get("label")
             if row is None or col is None or text is None or label is None:
                 continue
-            yield int(row), int(col), str(text), str(label)
+            kb_id = ent.get("kb_id")
+            yield int(row), int(col), str(text), str(label), (str(kb_id) if kb_id else None)
+
+
+def iter_entities(obj: dict) -> Iterable[Tuple[int, int, str, str]]:
+    for row, col, text, label, _ in iter_links(obj):
+        yield row, col, text, label
 
 
 def build_index(obj: dict, label_map: Dict[str, str], exclude_labels: Set[str]) -> Set[Tuple[int, int, str, str]]:
@@ -78,6 +100,23 @@ def build_index(obj: dict, label_map: Dict[str, str], exclude_labels: Set[str])
     return out
 
 
+def build_link_index(obj: dict, label_map: Dict[str, str],
+                     exclude_labels: Set[str]) -> Dict[Tuple[int, int, str, str], Optional[str]]:
+    """
+    Ключи build_index → kb_id. Для повторяющейся сущности берётся наибольший kb_id (как MAX в results_db).
+    """
+    out: Dict[Tuple[int, int, str, str], Optional[str]] = {}
+    for row, col, text, label, kb_id in iter_links(obj):
+        label2 = apply_label_map(label, label_map)
+        if label2 in exclude_labels:
+            continue
+        key = (row, col, norm_text(text), label2)
+        prev = out.get(key)
+        if prev is None or (kb_id is not None and kb_id > prev):
+            out[key] = kb_id
+    return out
+
+
 def metrics(C: int, A: int, N: int) -> Tuple[float, float, float]:
     p = (C / A) if A else 0.0
     r = (C / N) if N else 0.0
@@ -85,34 +124,157 @@ def metrics(C: int, A: int, N: int) -> Tuple[float, float, float]:
     return p, r, f1
 
 
+def llm_calls_of(pred_obj: dict) -> int:
+    """
+    Число запросов к LLM для файла предсказаний: из meta.llm_calls, а для старых
+    выходов GigaChat без этого поля — один запрос на ячейку.
+    """
+    meta = pred_obj.get("meta") or {}
+    if "llm_calls" in meta:
+        return int(meta["llm_calls"] or 0)
+    if str(pred_obj.get("method", "")).startswith("gigachat"):
+        return len(pred_obj.get("results", []))
+    return 0
+
+
 def should_skip_pred_file(filename: str) -> bool:
     name = os.path.basename(filename).lower()
     return name.endswith("_nel.json") or "_nel" in name
 
 
-def evaluate_one(
-    pred_dir: str,
-    test_set_dir: str,
-    out_path: str,
-    pred_glob: str,
-    min_id: Optional[int],
-    max_id: Optional[int],
-    label_map: Dict[str, str],
-    exclude_labels: Set[str],
-    per_label: bool,
-    strict_test_id: bool,
-):
-    pred_files = sorted(glob.glob(os.path.join(pred_dir, pred_glob)))
-    pred_files = [p for p in pred_files if not should_skip_pred_file(p)]
+def label_counts(pred_idx: Set[Tuple], test_idx: Set[Tuple], correct: Set[Tuple]) -> Dict[str, Dict[str, int]]:
+    plc: Dict[str, Dict[str, int]] = {}
+    for _, _, _, lb in test_idx:
+        plc.setdefault(lb, {"C": 0, "A": 0, "N": 0})["N"] += 1
+    for _, _, _, lb in pred_idx:
+        plc.setdefault(lb, {"C": 0, "A": 0, "N": 0})["A"] += 1
+    for _, _, _, lb in correct:
+        plc.setdefault(lb, {"C": 0, "A": 0, "N": 0})["C"] += 1
+    return plc
+
+
+def pair_errors(fp: Iterable[Tuple[int, int, str, str]], fn: Iterable[Tuple[int, int, str, str]]) -> Dict[str, List]:
+    """
+    Ошибки пары: путаница меток (в ячейке есть сущность с тем же текстом, но другой меткой),
+    а также оставшиеся ложные срабатывания (FP) и пропуски (FN).
+    """
+    fp_labels: Dict[Tuple[int, int, str], List[str]] = {}
+    for r, c, t, lb in sorted(fp):
+        fp_labels.setdefault((r, c, t), []).append(lb)
+
+    confusion = []
+    confused = set()
+    for r, c, t, gold in sorted(fn):
+        for pred in fp_labels.get((r, c, t), []):
+            confusion.append([r, c, t, gold, pred])
+            confused.add((r, c, t))
+
+    return {
+        "FP": [[r, c, t, lb] for r, c, t, lb in sorted(fp) if (r, c, t) not in confused],
+        "FN": [[r, c, t, lb] for r, c, t, lb in sorted(fn) if (r, c, t) not in confused],
+        "confusion": confusion,
+    }
 
-    test_files = sorted(glob.glob(os.path.join(test_set_dir, "*.json")))
 
-    if not test_files:
-        print(f"[ERROR] Нет файлов test_set в {test_set_dir}")
-        return
+def pair_counts(pred_obj: dict, test_obj: dict, label_map: Dict[str, str], exclude_labels: Set[str],
+                errors: bool = False) -> Dict:
+    """
+    Счётчики для пары pred ↔ test: C/A/N (всего и по меткам) + стоимость (ячейки, запросы к LLM, время NER).
+    errors=True — в том же проходе списки ошибок (pair_errors).
+    """
+    pred_idx = build_index(pred_obj, label_map, exclude_labels)
+    test_idx = build_index(test_obj, label_map, exclude_labels)
+    correct = pred_idx & test_idx
+    timing = (pred_obj.get("meta") or {}).get("timing") or {}
+    out = {
+        "C": len(correct),
+        "A": len(pred_idx),
+        "N": len(test_idx),
+        "per_label": label_counts(pred_idx, test_idx, correct),
+        "cells": len(pred_obj.get("results", [])),
+        "llm_calls": llm_calls_of(pred_obj),
+        "ner_s": float(timing["ner_s"]) if timing.get("ner_s") is not None else None,
+    }
+    trained = (pred_obj.get("meta") or {}).get("model_trained_tables")
+    if trained is not None:
+        out["model_trained_tables"] = trained
+    if errors:
+        out["errors"] = pair_errors(pred_idx - correct, test_idx - correct)
+    return out
 
+
+class PairCache:
+    """
+    Счётчики pair_counts на диске. Ключ — хэши содержимого обоих файлов + label_map,
+    exclude_labels и режим сопоставления: пересчитываются только изменившиеся пары.
+    Хэш файла запоминается по (размер, mtime), чтобы не перечитывать неизменённые файлы.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, List] = {}
+        self.pairs: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            data = load_json(path)
+            if data.get("version") == EVAL_CACHE_VERSION:
+                self.files = data.get("files") or {}
+                self.pairs = data.get("pairs") or {}
+        except (OSError, ValueError):
+            pass
+
+    def file_hash(self, path: str) -> str:
+        key = os.path.abspath(path)
+        st = os.stat(path)
+        known = self.files.get(key)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self.files[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def key(self, pred_path: str, test_path: str, label_map: Dict[str, str], exclude_labels: Set[str]) -> str:
+        payload = json.dumps([
+            self.file_hash(pred_path),
+            self.file_hash(test_path),
+            sorted(label_map.items()),
+            sorted(exclude_labels),
+            MATCH_MODE,
+        ], ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def counts(self, pred_path: str, test_path: str, label_map: Dict[str, str], exclude_labels: Set[str],
+               errors: bool = False) -> Dict:
+        key = self.key(pred_path, test_path, label_map, exclude_labels)
+        entry = self.pairs.get(key)
+        if entry is not None and (not errors or "errors" in entry["counts"]):
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = {"counts": pair_counts(load_json(pred_path), load_json(test_path), label_map, exclude_labels,
+                                           errors=errors)}
+            self.pairs[key] = entry
+        entry["used"] = time.time()
+        return entry["counts"]
+
+    def save(self):
+        from output_writer import write_json_atomic
+
+        now = time.time()
+        pairs = {k: v for k, v in self.pairs.items() if now - v.get("used", 0) <= EVAL_CACHE_TTL_S}
+        files = {k: v for k, v in self.files.items() if os.path.exists(k)}
+        write_json_atomic(self.path, {"version": EVAL_CACHE_VERSION, "files": files, "pairs": pairs})
+
+
+def select_test_files(test_set_dir: str, min_id: Optional[int], max_id: Optional[int],
+                      strict_test_id: bool) -> Dict[int, str]:
     test_by_id: Dict[int, str] = {}
-    for f in test_files:
+    for f in sorted(glob.glob(os.path.join(test_set_dir, "*.json"))):
         tid = extract_table_id(f)
         if tid is None:
             continue
@@ -123,82 +285,53 @@ def evaluate_one(
         if strict_test_id and tid in test_by_id:
             raise RuntimeError(f"В test_set несколько файлов с table_id={tid}: '{test_by_id[tid]}' и '{f}'")
         test_by_id[tid] = f
-
-    total_C = 0
-    total_A = 0
-    total_N = 0
-    total_FP = 0
-    total_FN = 0
-
-    skipped_out_of_range = 0
-    skipped_no_test = 0
-
+    return test_by_id
+
+
+def build_report(config: Dict, pairs: List[Tuple[int, str, str, Dict]], skipped: Dict[str, int],
+                 per_label: bool) -> Dict:
+    """
+    Отчёт из счётчиков пар (table_id, pred_file, test_file, counts) — общий для оценки по файлам
+    и по базе results_db.py.
+    """
+    total_C = total_A = total_N = 0
+    total_cells = total_llm_calls = timed_cells = 0
+    total_ner_s = 0.0
     per_table = []
+    # таблицы, на которых обучалась модель предсказаний (meta.model_trained_tables от run.py)
+    train_overlap = []
 
-    for pred_path in pred_files:
-        tid = extract_table_id(pred_path)
-        if tid is None:
-            continue
-
-        if min_id is not None and tid < min_id:
-            skipped_out_of_range += 1
-            continue
-        if max_id is not None and tid > max_id:
-            skipped_out_of_range += 1
-            continue
-
-        test_path = test_by_id.get(tid)
-        if not test_path:
-            skipped_no_test += 1
-            continue
-
-        pred_obj = load_json(pred_path)
-        test_obj = load_json(test_path)
-
-        pred_idx = build_index(pred_obj, label_map, exclude_labels)
-        test_idx = build_index(test_obj, label_map, exclude_labels)
-
-        correct = pred_idx & test_idx
-        C = len(correct)
-        A = len(pred_idx)
-        N = len(test_idx)
-
-        FP = A - C
-        FN = N - C
-
+    for tid, pred_file, test_file, counts in pairs:
+        if tid in (counts.get("model_trained_tables") or []):
+            train_overlap.append(tid)
+        C, A, N = counts["C"], counts["A"], counts["N"]
         total_C += C
         total_A += A
         total_N += N
-        total_FP += FP
-        total_FN += FN
+        total_cells += counts["cells"]
+        total_llm_calls += counts["llm_calls"]
+        if counts["ner_s"] is not None:
+            timed_cells += counts["cells"]
+            total_ner_s += counts["ner_s"]
 
         p, r, f1 = metrics(C, A, N)
-
         row = {
             "table_id": tid,
-            "pred_file": os.path.basename(pred_path),
-            "test_file": os.path.basename(test_path),
+            "pred_file": pred_file,
+            "test_file": test_file,
             "C": C,
             "A": A,
             "N": N,
-            "FP": FP,
-            "FN": FN,
+            "FP": A - C,
+            "FN": N - C,
             "precision": p,
             "recall": r,
             "f1": f1,
         }
 
         if per_label:
-            plc: Dict[str, Dict[str, int]] = {}
-            for _, _, _, lb in test_idx:
-                plc.setdefault(lb, {"C": 0, "A": 0, "N": 0})["N"] += 1
-            for _, _, _, lb in pred_idx:
-                plc.setdefault(lb, {"C": 0, "A": 0, "N": 0})["A"] += 1
-            for _, _, _, lb in correct:
-                plc.setdefault(lb, {"C": 0, "A": 0, "N": 0})["C"] += 1
-
             per_label_report = {}
-            for lb, cnts in plc.items():
+            for lb, cnts in sorted(counts["per_label"].items()):
                 lp, lr, lf1 = metrics(cnts["C"], cnts["A"], cnts["N"])
                 per_label_report[lb] = {
                     "C": cnts["C"],
@@ -214,51 +347,217 @@ def evaluate_one(
 
     p, r, f1 = metrics(total_C, total_A, total_N)
 
-    report = {
-        "config": {
-            "pred_dir": os.path.abspath(pred_dir),
-            "test_set_dir": os.path.abspath(test_set_dir),
-            "min_id": min_id,
-            "max_id": max_id,
-            "label_map": label_map,
-            "exclude_labels": sorted(exclude_labels),
-            "per_label": per_label,
-            "pred_glob": pred_glob,
-        },
+    return {
+        "config": config,
         "per_table": per_table,
         "overall": {
             "C": total_C,
             "A": total_A,
             "N": total_N,
-            "FP": total_FP,
-            "FN": total_FN,
+            "FP": total_A - total_C,
+            "FN": total_N - total_C,
             "precision": p,
             "recall": r,
             "f1": f1,
         },
-        "skipped": {
-            "pred_out_of_range": skipped_out_of_range,
-            "pred_without_test": skipped_no_test,
+        "cost": {
+            "cells": total_cells,
+            "llm_calls": total_llm_calls,
+            "llm_calls_saved": total_cells - total_llm_calls,
+            # пропускная способность — только по файлам с meta.timing (старые выходы без замеров)
+            "timed_cells": timed_cells,
+            "ner_seconds": round(total_ner_s, 3),
+            "cells_per_s": round(timed_cells / total_ner_s, 1) if total_ner_s > 0 else None,
         },
+        "skipped": skipped,
+        "train_overlap": sorted(train_overlap),
     }
 
+
+def build_error_report(config: Dict, pairs: List[Tuple[int, str, str, Dict]]) -> Dict:
+    """
+    Ошибки всех пар, сгруппированные по таблице → столбцу → метке:
+      FP        {метка: [[row, текст], ...]}
+      FN        {метка: [[row, текст], ...]}
+      confusion {"GOLD>PRED": [[row, текст], ...]}
+    + сводка по меткам и парам путаницы.
+    """
+    tables: Dict[str, Dict] = {}
+    by_label: Dict[str, Dict[str, int]] = {}
+    confusion_pairs: Dict[str, int] = {}
+    totals = {"FP": 0, "FN": 0, "confusion": 0}
+
+    for tid, pred_file, test_file, counts in pairs:
+        errs = counts.get("errors")
+        if errs is None:
+            continue
+        cols: Dict[str, Dict] = {}
+        for kind in ("FP", "FN"):
+            for r, c, t, lb in errs[kind]:
+                cols.setdefault(str(c), {}).setdefault(kind, {}).setdefault(lb, []).append([r, t])
+                by_label.setdefault(lb, {"FP": 0, "FN": 0, "confused_as": 0})[kind] += 1
+                totals[kind] += 1
+        for r, c, t, gold, pred in errs["confusion"]:
+            key = f"{gold}>{pred}"
+            cols.setdefault(str(c), {}).setdefault("confusion", {}).setdefault(key, []).append([r, t])
+            by_label.setdefault(gold, {"FP": 0, "FN": 0, "confused_as": 0})["confused_as"] += 1
+            confusion_pairs[key] = confusion_pairs.get(key, 0) + 1
+            totals["confusion"] += 1
+        if cols:
+            tables[str(tid)] = {"pred_file": pred_file, "test_file": test_file,
+                                "cols": {c: cols[c] for c in sorted(cols, key=int)}}
+
+    return {
+        "config": config,
+        "summary": {
+            **totals,
+            "by_label": {lb: by_label[lb] for lb in sorted(by_label)},
+            "confusion_pairs": dict(sorted(confusion_pairs.items(), key=lambda kv: (-kv[1], kv[0]))),
+        },
+        "tables": tables,
+    }
+
+
+def save_errors(errors_report: Dict, out_path: str):
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(errors_report, f, ensure_ascii=False, separators=(",", ":"))
+    s = errors_report["summary"]
+    print(f"[OK] Ошибки: FP {s['FP']}, FN {s['FN']}, путаница меток {s['confusion']} → {out_path}")
+
+
+def save_report(report: Dict, out_path: str):
     os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(report, f, ensure_ascii=False, indent=2)
 
-    print(f"[OK] Таблиц оценено: {len(per_table)}")
-    if min_id is not None or max_id is not None:
-        print(f"[OK] Диапазон: {min_id}..{max_id}")
-    if exclude_labels:
-        print(f"[OK] Исключённые метки: {', '.join(sorted(exclude_labels))}")
-    if label_map:
-        print(f"[OK] label_map: {', '.join([f'{k}->{v}' for k, v in label_map.items()])}")
+    cfg = report["config"]
+    overall = report["overall"]
+    cost = report["cost"]
+    f1 = overall["f1"]
+    print(f"[OK] Таблиц оценено: {len(report['per_table'])}")
+    if cfg["min_id"] is not None or cfg["max_id"] is not None:
+        print(f"[OK] Диапазон: {cfg['min_id']}..{cfg['max_id']}")
+    if cfg["exclude_labels"]:
+        print(f"[OK] Исключённые метки: {', '.join(cfg['exclude_labels'])}")
+    if cfg["label_map"]:
+        print(f"[OK] label_map: {', '.join([f'{k}->{v}' for k, v in cfg['label_map'].items()])}")
     print(f"[OK] Overall F1 = {f1:.4f}")
+    if report.get("train_overlap"):
+        print(f"[WARN] Модель обучалась на оцениваемых таблицах {report['train_overlap']} — F1 завышен "
+              f"(исключите их: --min_id/--max_id, или переобучите модель / пересоберите газеттир без них)")
+    print(f"[OK] Запросов к LLM: {cost['llm_calls']} на {cost['cells']} ячеек")
+    if cost["cells_per_s"] is not None:
+        print(f"[OK] Скорость NER: {cost['cells_per_s']:.1f} ячеек/с (F1 = {f1:.4f})")
     print(f"[OK] Отчёт сохранён: {out_path}")
 
+
+def evaluate_one(
+    pred_dir: str,
+    test_set_dir: str,
+    out_path: str,
+    pred_glob: str,
+    min_id: Optional[int],
+    max_id: Optional[int],
+    label_map: Dict[str, str],
+    exclude_labels: Set[str],
+    per_label: bool,
+    strict_test_id: bool,
+    cache: Optional[PairCache] = None,
+    errors_path: Optional[str] = None,
+):
+    pred_files = sorted(glob.glob(os.path.join(pred_dir, pred_glob)))
+    pred_files = [p for p in pred_files if not should_skip_pred_file(p)]
+
+    if not glob.glob(os.path.join(test_set_dir, "*.json")):
+        print(f"[ERROR] Нет файлов test_set в {test_set_dir}")
+        return
+
+    test_by_id = select_test_files(test_set_dir, min_id, max_id, strict_test_id)
+
+    skipped_out_of_range = 0
+    skipped_no_test = 0
+    pairs = []
+
+    for pred_path in pred_files:
+        tid = extract_table_id(pred_path)
+        if tid is None:
+            continue
+
+        if min_id is not None and tid < min_id:
+            skipped_out_of_range += 1
+            continue
+        if max_id is not None and tid > max_id:
+            skipped_out_of_range += 1
+            continue
+
+        test_path = test_by_id.get(tid)
+        if not test_path:
+            skipped_no_test += 1
+            continue
+
+        errors = errors_path is not None
+        if cache is not None:
+            counts = cache.counts(pred_path, test_path, label_map, exclude_labels, errors=errors)
+        else:
+            counts = pair_counts(load_json(pred_path), load_json(test_path), label_map, exclude_labels, errors=errors)
+        pairs.append((tid, os.path.basename(pred_path), os.path.basename(test_path), counts))
+
+    config = {
+        "pred_dir": os.path.abspath(pred_dir),
+        "test_set_dir": os.path.abspath(test_set_dir),
+        "min_id": min_id,
+        "max_id": max_id,
+        "label_map": label_map,
+        "exclude_labels": sorted(exclude_labels),
+        "per_label": per_label,
+        "pred_glob": pred_glob,
+    }
+    report = build_report(
+        config,
+        pairs,
+        {"pred_out_of_range": skipped_out_of_range, "pred_without_test": skipped_no_test},
+        per_label,
+    )
+    save_report(report, out_path)
+    if errors_path is not None:
+        save_errors(build_error_report(config, pairs), errors_path)
     return report
 
 
+def evaluate_db(args, systems: List[str], label_map: Dict[str, str], exclude_labels: Set[str]):
+    """
+    Те же отчёты, что у evaluate_one, но счётчики C/A/N считаются запросами к results_db.
+    """
+    from results_db import connect, evaluation_pairs, ingest
+
+    con = connect(args.db)
+    ingest(con, args.pred_dir, args.test_set_dir)
+    if not con.execute("SELECT 1 FROM files WHERE kind = 'gold' LIMIT 1").fetchone():
+        print(f"[ERROR] Нет файлов test_set в {args.test_set_dir}")
+        return
+
+    for system in systems:
+        pairs, skipped = evaluation_pairs(con, system, args.min_id, args.max_id, label_map, exclude_labels,
+                                          args.strict_test_id, errors=args.errors)
+        config = {
+            "pred_dir": os.path.abspath(args.pred_dir),
+            "test_set_dir": os.path.abspath(args.test_set_dir),
+            "min_id": args.min_id,
+            "max_id": args.max_id,
+            "label_map": label_map,
+            "exclude_labels": sorted(exclude_labels),
+            "per_label": args.per_label,
+            "pred_glob": f"*_{system}.json",
+            "db": os.path.abspath(args.db),
+        }
+        report = build_report(config, pairs, skipped, args.per_label)
+        save_report(report, os.path.join(args.reports_dir, f"ner_report_{system}.json"))
+        if args.errors:
+            save_errors(build_error_report(config, pairs), os.path.join(args.reports_dir, f"ner_errors_{system}.json"))
+    con.close()
+
+
 def main():
     parser = argparse.ArgumentParser(description="Оценка качества NER по test_set (spacy / zero / few)")
 
@@ -271,6 +570,19 @@ def main():
     parser.add_argument("--label_map", default=None, help='Маппинг меток, например: "GPE=LOC,PER=PERSON"')
     parser.add_argument("--exclude_labels", default=None, help='Исключить метки, например: "QUANTITY,DATE"')
     parser.add_argument("--per_label", action="store_true", help="Добавить метрики по каждой метке")
+    parser.add_argument(
+        "--systems",
+        default=DEFAULT_SYSTEMS,
+        help='Какие системы оценивать (суффиксы файлов), например: "gigachat_few,gigachat_few_table"',
+    )
+    parser.add_argument("--db", default=None,
+                        help="Считать по базе results_db.py (SQLite) вместо разбора JSON; база синхронизируется "
+                             "с --pred_dir / --test_set_dir")
+    parser.add_argument("--errors", action="store_true",
+                        help="Сохранить списки FP / FN / путаницы меток по таблицам и столбцам: "
+                             "reports/ner_errors_{system}.json")
+    parser.add_argument("--no_cache", action="store_true",
+                        help=f"Не использовать кэш счётчиков ({{reports_dir}}/{EVAL_CACHE_NAME}): пересчитать все пары")
     parser.add_argument(
         "--strict_test_id",
         action="store_true",
@@ -284,44 +596,33 @@ def main():
 
     os.makedirs(args.reports_dir, exist_ok=True)
 
-    evaluate_one(
-        pred_dir=args.pred_dir,
-        test_set_dir=args.test_set_dir,
-        out_path=os.path.join(args.reports_dir, "ner_report_spacy.json"),
-        pred_glob="*_spacy.json",
-        min_id=args.min_id,
-        max_id=args.max_id,
-        label_map=label_map,
-        exclude_labels=exclude_labels,
-        per_label=args.per_label,
-        strict_test_id=args.strict_test_id,
-    )
+    systems = [p.strip() for p in args.systems.split(",") if p.strip()]
 
-    evaluate_one(
-        pred_dir=args.pred_dir,
-        test_set_dir=args.test_set_dir,
-        out_path=os.path.join(args.reports_dir, "ner_report_gigachat_zero.json"),
-        pred_glob="*_gigachat_zero.json",
-        min_id=args.min_id,
-        max_id=args.max_id,
-        label_map=label_map,
-        exclude_labels=exclude_labels,
-        per_label=args.per_label,
-        strict_test_id=args.strict_test_id,
-    )
+    if args.db:
+        evaluate_db(args, systems, label_map, exclude_labels)
+        return
 
-    evaluate_one(
-        pred_dir=args.pred_dir,
-        test_set_dir=args.test_set_dir,
-        out_path=os.path.join(args.reports_dir, "ner_report_gigachat_few.json"),
-        pred_glob="*_gigachat_few.json",
-        min_id=args.min_id,
-        max_id=args.max_id,
-        label_map=label_map,
-        exclude_labels=exclude_labels,
-        per_label=args.per_label,
-        strict_test_id=args.strict_test_id,
-    )
+    cache = None if args.no_cache else PairCache(os.path.join(args.reports_dir, EVAL_CACHE_NAME))
+
+    for system in systems:
+        evaluate_one(
+            pred_dir=args.pred_dir,
+            test_set_dir=args.test_set_dir,
+            out_path=os.path.join(args.reports_dir, f"ner_report_{system}.json"),
+            pred_glob=f"*_{system}.json",
+            min_id=args.min_id,
+            max_id=args.max_id,
+            label_map=label_map,
+            exclude_labels=exclude_labels,
+            per_label=args.per_label,
+            strict_test_id=args.strict_test_id,
+            cache=cache,
+            errors_path=os.path.join(args.reports_dir, f"ner_errors_{system}.json") if args.errors else None,
+        )
+
+    if cache is not None:
+        cache.save()
+        print(f"[OK] Кэш оценки: пересчитано пар {cache.misses}, из кэша {cache.hits}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+# fast_path.py
+# Быстрый путь перед NER-моделью: ячейки, целиком состоящие из числа, даты, процента,
+# денежной суммы или времени, размечаются регулярками без вызова spaCy / GigaChat.
+
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from ner_spacy import NUM_RE
+
+MONTHS_GEN = "января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря"
+MONTHS_NOM = "январь|февраль|март|апрель|май|июнь|июль|август|сентябрь|октябрь|ноябрь|декабрь"
+
+NUMBER = r"\d{1,3}(?:[ \u00A0]\d{3})*(?:[.,]\d+)?|\d+(?:[.,]\d+)?"
+
+YEAR_RE = re.compile(r"^(?:1[0-9]{3}|20[0-9]{2})$")
+
+# Порядок важен: первое совпадение определяет метку
+RULES: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("PERCENT", re.compile(rf"^[−-]?(?:{NUMBER})\s?%\.?$")),
+    ("MONEY", re.compile(
+        rf"^(?:[$€£₽]\s?(?:{NUMBER})(?:\s?(?:тыс|млн|млрд)\.?)?"
+        rf"|(?:{NUMBER})\s?(?:(?:тыс|млн|млрд)\.?\s?)?(?:₽|руб\.?|рублей|рубля|\$|€|£|долл\.?|долларов|евро))$",
+        re.IGNORECASE,
+    )),
+    ("TIME", re.compile(r"^(?:[01]?\d|2[0-3]):[0-5]\d(?::[0-5]\d)?$")),
+    ("DATE", re.compile(
+        rf"^(?:\d{{1,2}}[./]\d{{1,2}}[./](?:\d{{4}}|\d{{2}})"
+        rf"|\d{{1,2}}\s(?:{MONTHS_GEN})(?:\s\d{{4}})?(?:\s?(?:г\.?|года))?"
+        rf"|(?:{MONTHS_NOM})\s\d{{4}}(?:\s?(?:г\.?|года))?"
+        rf"|(?:1[0-9]{{3}}|20[0-9]{{2}})\s?[–—-]\s?(?:1[0-9]{{3}}|20[0-9]{{2}})"
+        rf"|(?:1[0-9]{{3}}|20[0-9]{{2}})\s?(?:г\.?|год|года|году))$",
+        re.IGNORECASE,
+    )),
+    ("QUANTITY", re.compile(
+        rf"^(?:{NUMBER})\s?(?:км²|км2|км|м²|м|см|мм|кг|г|т|га|л|чел\.?|лет|год|года)$",
+        re.IGNORECASE,
+    )),
+]
+
+
+class FastPathClassifier:
+    """
+    Классифицирует ячейку целиком. Возвращает список сущностей, если ячейка
+    тривиально типизируется регулярками, иначе None (ячейку нужно отдать модели).
+
+    year_as_date=True: голые годы ("2004") размечаются как DATE, как в ручной разметке
+    test_set; иначе — как QUANTITY, как это делало правило NUM_RE в SpacyNER.
+    """
+
+    def __init__(self, year_as_date: bool = True):
+        self.year_as_date = year_as_date
+
+    def classify_label(self, text: str) -> Optional[str]:
+        t = (text or "").strip()
+        if not t:
+            return None
+
+        if YEAR_RE.match(t):
+            return "DATE" if self.year_as_date else "QUANTITY"
+
+        for label, rx in RULES:
+            if rx.match(t):
+                return label
+
+        if NUM_RE.match(t):
+            return "QUANTITY"
+
+        return None
+
+    def classify(self, text: str) -> Optional[List[Dict]]:
+        label = self.classify_label(text)
+        if label is None:
+            return None
+        return [{"text": text.strip(), "label": label, "source": "rule"}]
+
+
+class FastPathNER:
+    """
+    Обёртка над любым NER-бэкендом (SpacyNER, GigaChatNER, NERClient ...):
+    модель вызывается только для ячеек, которые не разметил FastPathClassifier.
+    """
+
+    def __init__(self, ner, classifier: Optional[FastPathClassifier] = None):
+        self.ner = ner
+        self.classifier = classifier or FastPathClassifier()
+        self.cells = 0
+        self.model_calls = 0
+        self.by_label: Counter = Counter()
+
+    def extract_entities(self, text: str) -> List[Dict]:
+        self.cells += 1
+        entities = self.classifier.classify(text)
+        if entities is not None:
+            self.by_label[entities[0]["label"]] += 1
+            return entities
+
+        self.model_calls += 1
+        return self.ner.extract_entities(text)
+
+    def extract_entities_batch(self, texts: List[str]) -> List[List[Dict]]:
+        out: List[Optional[List[Dict]]] = [self.classifier.classify(t) for t in texts]
+        model_idx = [i for i, ents in enumerate(out) if ents is None]
+
+        self.cells += len(texts)
+        self.model_calls += len(model_idx)
+        for ents in out:
+            if ents is not None:
+                self.by_label[ents[0]["label"]] += 1
+
+        if model_idx:
+            model_out = self.ner.extract_entities_batch([texts[i] for i in model_idx])
+            for i, ents in zip(model_idx, model_out):
+                out[i] = ents
+
+        return [ents or [] for ents in out]
+
+    def extract_table(self, cells: List[Dict], headers: Dict[int, str], **kwargs) -> List[List[Dict]]:
+        """
+        Табличный режим (GigaChatNER.extract_table): в модель уходят только нетривиальные ячейки.
+        """
+        out: List[Optional[List[Dict]]] = [self.classifier.classify(c["text"]) for c in cells]
+        model_idx = [i for i, ents in enumerate(out) if ents is None]
+
+        self.cells += len(cells)
+        self.model_calls += len(model_idx)
+        for ents in out:
+            if ents is not None:
+                self.by_label[ents[0]["label"]] += 1
+
+        if model_idx:
+            model_out = self.ner.extract_table([cells[i] for i in model_idx], headers, **kwargs)
+            for i, ents in zip(model_idx, model_out):
+                out[i] = ents
+
+        return [ents or [] for ents in out]
+
+    def stats(self) -> Dict:
+        return {
+            "cells": self.cells,
+            "model_calls": self.model_calls,
+            "model_calls_avoided": self.cells - self.model_calls,
+            "rule_labels": dict(self.by_label),
+        }
@@ -0,0 +1,194 @@
+# fewshot_index.py
+# Динамический подбор few-shot примеров: размеченные ячейки data/test_set индексируются
+# по символьным n-граммам (TF-IDF, косинусная близость), в промпт GigaChat идут k самых похожих
+# примеров вместо фиксированного списка. Индекс кэшируется на диске и пересобирается,
+# если изменились файлы разметки.
+
+import glob
+import json
+import math
+import os
+import pickle
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+FEWSHOT_INDEX_VERSION = 1
+
+DEFAULT_FEWSHOT_INDEX_PATH = os.path.join("models", "fewshot_index.pkl")
+
+NGRAM = 3
+SPACE_RE = re.compile(r"\s+")
+TABLE_ID_RE = re.compile(r"(\d+)")
+
+
+def norm_text(text: str) -> str:
+    return SPACE_RE.sub(" ", (text or "").strip().lower().replace("ё", "е"))
+
+
+def char_ngrams(text: str, n: int = NGRAM) -> Counter:
+    t = f" {norm_text(text)} "
+    if len(t) <= n:
+        return Counter([t])
+    return Counter(t[i:i + n] for i in range(len(t) - n + 1))
+
+
+def table_id_of(path: str) -> Optional[int]:
+    m = TABLE_ID_RE.search(os.path.basename(path))
+    return int(m.group(1)) if m else None
+
+
+def sources_fingerprint(paths: Iterable[str]) -> List[Tuple[str, int, int]]:
+    return [(os.path.basename(p), os.path.getsize(p), int(os.path.getmtime(p))) for p in sorted(paths)]
+
+
+class FewShotIndex:
+    """
+    Пример — ячейка с ручной разметкой: текст, сущности и номер таблицы (чтобы при разметке
+    таблицы не подсказывать модели её же ответы).
+    """
+
+    def __init__(self):
+        self.examples: List[Dict] = []
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        self.idf: Dict[str, float] = {}
+        self.fingerprint: List[Tuple[str, int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.examples)
+
+    # ---------- сборка ----------
+
+    @classmethod
+    def build(cls, gold_dir: str) -> "FewShotIndex":
+        idx = cls()
+        paths = sorted(glob.glob(os.path.join(gold_dir, "*.json")))
+        idx.fingerprint = sources_fingerprint(paths)
+
+        seen = set()
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                obj = json.load(f)
+            tid = table_id_of(path)
+            for cell in obj.get("results", []):
+                text = (cell.get("text") or "").strip()
+                ents = [
+                    {"text": e["text"], "label": e["label"]}
+                    for e in cell.get("entities") or []
+                    if e.get("text") and e.get("label")
+                ]
+                key = (tid, norm_text(text))
+                if not text or not ents or key in seen:
+                    continue
+                seen.add(key)
+                idx.examples.append({"text": text, "entities": ents, "table_id": tid})
+
+        df: Counter = Counter()
+        vectors = []
+        for ex in idx.examples:
+            grams = char_ngrams(ex["text"])
+            vectors.append(grams)
+            df.update(grams.keys())
+
+        n = len(idx.examples)
+        idx.idf = {g: math.log((n + 1) / (c + 1)) + 1.0 for g, c in df.items()}
+
+        postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for i, grams in enumerate(vectors):
+            weights = {g: tf * idx.idf[g] for g, tf in grams.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for g, w in weights.items():
+                postings[g].append((i, w / norm))
+        idx.postings = dict(postings)
+        return idx
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump({
+                "version": FEWSHOT_INDEX_VERSION,
+                "examples": self.examples,
+                "postings": self.postings,
+                "idf": self.idf,
+                "fingerprint": self.fingerprint,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "FewShotIndex":
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != FEWSHOT_INDEX_VERSION:
+            raise ValueError(f"Индекс {path} собран другой версией ({data.get('version')})")
+        idx = cls()
+        idx.examples = data["examples"]
+        idx.postings = data["postings"]
+        idx.idf = data["idf"]
+        idx.fingerprint = data["fingerprint"]
+        return idx
+
+    @classmethod
+    def load_or_build(cls, path: str, gold_dir: str, verbose: bool = True) -> "FewShotIndex":
+        """
+        Кэш на диске: загружаем, если он собран из тех же файлов разметки, иначе пересобираем.
+        """
+        current = sources_fingerprint(glob.glob(os.path.join(gold_dir, "*.json")))
+        if os.path.exists(path):
+            try:
+                idx = cls.load(path)
+                if idx.fingerprint == current:
+                    return idx
+            except (OSError, ValueError, pickle.UnpicklingError, KeyError):
+                pass
+
+        idx = cls.build(gold_dir)
+        idx.save(path)
+        if verbose:
+            print(f"[INFO] Индекс few-shot примеров собран: {len(idx)} примеров → {path}")
+        return idx
+
+    # ---------- поиск ----------
+
+    def _scores(self, texts: Iterable[str]) -> Dict[int, float]:
+        scores: Dict[int, float] = defaultdict(float)
+        for text in texts:
+            grams = char_ngrams(text)
+            weights = {g: tf * self.idf[g] for g, tf in grams.items() if g in self.idf}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for g, w in weights.items():
+                for i, wi in self.postings[g]:
+                    scores[i] += wi * w / norm
+        return scores
+
+    def select(self, texts, k: int = 8, exclude_table: Optional[int] = None) -> List[Dict]:
+        """
+        k примеров, самых похожих на текст (или на набор текстов — для блока строк).
+        Повторяющиеся тексты и примеры из exclude_table не берутся.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        scores = self._scores(texts)
+
+        out: List[Dict] = []
+        seen = set()
+        for i, _ in sorted(scores.items(), key=lambda kv: (-kv[1], kv[0])):
+            ex = self.examples[i]
+            if exclude_table is not None and ex["table_id"] == exclude_table:
+                continue
+            key = norm_text(ex["text"])
+            if key in seen:
+                continue
+            seen.add(key)
+            out.append(ex)
+            if len(out) >= k:
+                break
+        return out
+
+
+def format_examples(examples: List[Dict]) -> str:
+    """
+    Примеры в формате FEW_SHOT_EXAMPLES из ner_gigachat.py.
+    """
+    return "\n".join(
+        f'{json.dumps(ex["text"], ensure_ascii=False)} -> {json.dumps(ex["entities"], ensure_ascii=False)}'
+        for ex in examples
+    )
@@ -1,58 +1,241 @@
+# nel_stats.py
+# Статистика NEL: один проход по каждому {table_id}_{system}_nel.json — покрытие связывания (доля сущностей
+# с kb_id) по системам, таблицам и меткам и точность связей по ручной разметке там, где в test_set есть kb_id.
+# Разбор файлов и индекс сущностей — общие с eval_ner.py (те же ключи, --label_map, --exclude_labels);
+# файлы обрабатываются параллельно.
+#
+# python src/nel_stats.py --pred_dir .\outputs --test_set_dir .\data\test_set --per_label
+
+import argparse
 import glob
-import json
 import os
-from collections import defaultdict
-
-
-OUT_DIR = r".\outputs"
-
-
-def load_json(path):
-    with open(path, encoding="utf-8") as f:
-        return json.load(f)
-
-
-def get_mode(filename: str) -> str:
-    name = filename.lower()
-    if "spacy" in name:
-        return "spacy"
-    if "zero" in name:
-        return "gigachat_zero"
-    if "few" in name:
-        return "gigachat_few"
-    return "unknown"
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from eval_ner import build_link_index, load_json, parse_label_map, parse_label_set, select_test_files
+from output_writer import write_json_atomic
+from results_db import system_of
+
+DEFAULT_PRED_DIR = r".\outputs"
+DEFAULT_TEST_SET_DIR = r".\data\test_set"
+DEFAULT_REPORTS_DIR = r".\reports"
+
+NEL_SUFFIX = "_nel"
+
+# total — сущностей, linked — с kb_id, gold — совпавших с test_set сущностей, у которых там есть kb_id,
+# checked — из них связанных системой, correct — связанных с тем же kb_id
+COUNTERS = ("total", "linked", "gold", "checked", "correct")
+
+
+def new_counts() -> Dict[str, int]:
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def add_counts(dst: Dict[str, int], src: Dict[str, int]):
+    for k in COUNTERS:
+        dst[k] += src[k]
+
+
+def with_rates(c: Dict[str, int]) -> Dict:
+    return {
+        **c,
+        "coverage": c["linked"] / c["total"] if c["total"] else 0.0,
+        "link_precision": c["correct"] / c["checked"] if c["checked"] else None,
+        "link_recall": c["correct"] / c["gold"] if c["gold"] else None,
+    }
+
+
+def file_stats(task: Tuple[str, Optional[str], Dict[str, str], Set[str]]) -> Dict[str, Dict[str, int]]:
+    """
+    Счётчики COUNTERS по меткам для одного файла *_nel.json (и его test_set, если есть).
+    """
+    pred_path, test_path, label_map, exclude_labels = task
+    links = build_link_index(load_json(pred_path), label_map, exclude_labels)
+    gold = build_link_index(load_json(test_path), label_map, exclude_labels) if test_path else {}
+
+    per_label: Dict[str, Dict[str, int]] = {}
+    for key, kb_id in links.items():
+        c = per_label.setdefault(key[3], new_counts())
+        c["total"] += 1
+        if kb_id is not None:
+            c["linked"] += 1
+        gold_kb = gold.get(key)
+        if gold_kb is not None:
+            c["gold"] += 1
+            if kb_id is not None:
+                c["checked"] += 1
+                c["correct"] += kb_id == gold_kb
+    return per_label
+
+
+def collect_files(pred_dir: str, test_set_dir: str, systems: Optional[List[str]], min_id: Optional[int],
+                  max_id: Optional[int]) -> Tuple[List[Tuple[str, int, str, Optional[str]]], int]:
+    """
+    (система, table_id, файл NEL, файл test_set | None) по точному разбору имени {table_id}_{system}_nel.json
+    + число файлов вне диапазона таблиц.
+    """
+    test_by_id = select_test_files(test_set_dir, min_id, max_id, strict_test_id=False) \
+        if os.path.isdir(test_set_dir) else {}
+    files = []
+    out_of_range = 0
+    for path in sorted(glob.glob(os.path.join(pred_dir, f"*{NEL_SUFFIX}.json"))):
+        parsed = system_of(path)
+        if parsed is None:
+            continue
+        tid, system = parsed[0], parsed[1][:-len(NEL_SUFFIX)]
+        if systems and system not in systems:
+            continue
+        if (min_id is not None and tid < min_id) or (max_id is not None and tid > max_id):
+            out_of_range += 1
+            continue
+        files.append((system, tid, path, test_by_id.get(tid)))
+    return files, out_of_range
+
+
+def stats_from_files(files: List[Tuple[str, int, str, Optional[str]]], label_map: Dict[str, str],
+                     exclude_labels: Set[str], workers: int) -> List[Tuple[str, int, Dict[str, Dict[str, int]]]]:
+    tasks = [(path, test_path, label_map, exclude_labels) for _, _, path, test_path in files]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(file_stats, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    else:
+        results = [file_stats(t) for t in tasks]
+    return [(system, tid, per_label) for (system, tid, _, _), per_label in zip(files, results)]
+
+
+def stats_from_db(db_path: str, pred_dir: str, test_set_dir: str, systems: Optional[List[str]],
+                  min_id: Optional[int], max_id: Optional[int], label_map: Dict[str, str],
+                  exclude_labels: Set[str]) -> Tuple[List[Tuple[str, int, Dict[str, Dict[str, int]]]], int]:
+    """
+    Те же счётчики запросом к results_db.py (база синхронизируется с pred_dir и test_set_dir).
+    """
+    from results_db import connect, ingest, nel_link_counts
+
+    con = connect(db_path)
+    ingest(con, pred_dir, test_set_dir if os.path.isdir(test_set_dir) else None)
+    # файлы без сущностей в запросе не появляются, поэтому список файлов — из таблицы files
+    by_file: Dict[Tuple[str, int], Dict[str, Dict[str, int]]] = {}
+    out_of_range = 0
+    for r in con.execute("SELECT system, table_id FROM files WHERE kind = 'pred' ORDER BY path"):
+        system, tid = r["system"], r["table_id"]
+        if not system.endswith(NEL_SUFFIX):
+            continue
+        system = system[:-len(NEL_SUFFIX)]
+        if systems and system not in systems:
+            continue
+        if (min_id is not None and tid < min_id) or (max_id is not None and tid > max_id):
+            out_of_range += 1
+            continue
+        by_file[(system, tid)] = {}
+    for r in nel_link_counts(con, label_map, exclude_labels):
+        per_label = by_file.get((r["system"], r["table_id"]))
+        if per_label is not None:
+            per_label[r["label"]] = {k: r[k] for k in COUNTERS}
+    con.close()
+    return [(system, tid, per_label) for (system, tid), per_label in sorted(by_file.items())], out_of_range
+
+
+def build_nel_report(config: Dict, rows: List[Tuple[str, int, Dict[str, Dict[str, int]]]],
+                     per_label: bool) -> Dict:
+    """
+    {system: {overall, tables: {table_id: ...}, per_label?: {метка: ...}}} — счётчики с coverage /
+    link_precision / link_recall (None, если в test_set нет kb_id для сверки).
+    """
+    acc: Dict[str, Dict] = {}
+    for system, tid, labels in rows:
+        s = acc.setdefault(system, {"overall": new_counts(), "tables": {}, "per_label": {}})
+        t = s["tables"].setdefault(tid, new_counts())
+        for lb, c in labels.items():
+            add_counts(s["overall"], c)
+            add_counts(t, c)
+            add_counts(s["per_label"].setdefault(lb, new_counts()), c)
+
+    systems = {}
+    for system in sorted(acc):
+        s = acc[system]
+        out = {
+            "overall": with_rates(s["overall"]),
+            "tables": {str(tid): with_rates(s["tables"][tid]) for tid in sorted(s["tables"])},
+        }
+        if per_label:
+            out["per_label"] = {lb: with_rates(s["per_label"][lb]) for lb in sorted(s["per_label"])}
+        systems[system] = out
+    return {"config": config, "systems": systems}
+
+
+def _pct(x: Optional[float]) -> str:
+    return f"{x * 100:9.2f}%" if x is not None else f"{'—':>10}"
+
+
+def print_report(report: Dict, per_label: bool):
+    print("\nNEL statistics:\n")
+    header = f"{'Model':15} | {'Total':>8} | {'Linked':>8} | {'Coverage %':>10} | {'Gold kb':>8} | {'Precision':>10}"
+    print(header)
+    print("-" * len(header))
+    for system, s in report["systems"].items():
+        rows = [(system, s["overall"])]
+        if per_label:
+            rows += [(f"  {lb}", c) for lb, c in s["per_label"].items()]
+        for name, c in rows:
+            print(f"{name:15} | {c['total']:8} | {c['linked']:8} | {_pct(c['coverage'])} | {c['gold']:8} | "
+                  f"{_pct(c['link_precision'])}")
 
 
 def main():
-    files = glob.glob(os.path.join(OUT_DIR, "*_nel.json"))
-
-    if not files:
-        print("[WARN] No *_nel.json files found in outputs/")
+    parser = argparse.ArgumentParser(description="Покрытие и точность NEL по системам, таблицам и меткам")
+    parser.add_argument("--pred_dir", "--out_dir", dest="pred_dir", default=DEFAULT_PRED_DIR,
+                        help="Папка с {table_id}_{system}_nel.json")
+    parser.add_argument("--test_set_dir", default=DEFAULT_TEST_SET_DIR,
+                        help="Папка с test_set (JSON): точность связей по kb_id ручной разметки")
+    parser.add_argument("--reports_dir", default=DEFAULT_REPORTS_DIR, help="Куда сохранять отчёт")
+    parser.add_argument("--systems", default=None,
+                        help="Какие системы считать, например: spacy,gigachat_few (по умолчанию все найденные)")
+    parser.add_argument("--min_id", type=int, default=None, help="Минимальный table_id (включительно)")
+    parser.add_argument("--max_id", type=int, default=None, help="Максимальный table_id (включительно)")
+    parser.add_argument("--label_map", default=None, help='Маппинг меток, например: "GPE=LOC,PER=PERSON"')
+    parser.add_argument("--exclude_labels", default=None, help='Исключить метки, например: "QUANTITY,DATE"')
+    parser.add_argument("--per_label", action="store_true", help="Добавить статистику по каждой метке")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Параллельных процессов для разбора файлов (1 — без параллелизма)")
+    parser.add_argument("--db", default=None, help="Считать по базе results_db.py (SQLite) вместо разбора JSON")
+    args = parser.parse_args()
+
+    label_map = parse_label_map(args.label_map)
+    exclude_labels = parse_label_set(args.exclude_labels)
+    systems = [s.strip() for s in args.systems.split(",") if s.strip()] if args.systems else None
+    if systems:
+        systems = [s[:-len(NEL_SUFFIX)] if s.endswith(NEL_SUFFIX) else s for s in systems]
+
+    if args.db:
+        rows, out_of_range = stats_from_db(args.db, args.pred_dir, args.test_set_dir, systems,
+                                           args.min_id, args.max_id, label_map, exclude_labels)
+    else:
+        files, out_of_range = collect_files(args.pred_dir, args.test_set_dir, systems, args.min_id, args.max_id)
+        rows = stats_from_files(files, label_map, exclude_labels, args.workers)
+
+    if not rows:
+        print(f"[WARN] No *_nel.json files found in {args.pred_dir}")
         return
 
-    stats = defaultdict(lambda: {"total": 0, "linked": 0})
-
-    for path in files:
-        mode = get_mode(os.path.basename(path))
-        obj = load_json(path)
-
-        for cell in obj.get("results", []):
-            for ent in cell.get("entities", []):
-                stats[mode]["total"] += 1
-                if ent.get("kb_id"):
-                    stats[mode]["linked"] += 1
-
-    print("\nNEL statistics:\n")
-    print(f"{'Model':15} | {'Total':>8} | {'Linked':>8} | {'Coverage %':>10}")
-    print("-" * 50)
-
-    for mode, s in stats.items():
-        total = s["total"]
-        linked = s["linked"]
-        coverage = (linked / total * 100) if total else 0.0
-        print(f"{mode:15} | {total:8} | {linked:8} | {coverage:9.2f}%")
-
-    print("\nDone.")
+    config = {
+        "pred_dir": os.path.abspath(args.pred_dir),
+        "test_set_dir": os.path.abspath(args.test_set_dir),
+        "min_id": args.min_id,
+        "max_id": args.max_id,
+        "label_map": label_map,
+        "exclude_labels": sorted(exclude_labels),
+        "per_label": args.per_label,
+        "files": len(rows),
+        "skipped_out_of_range": out_of_range,
+    }
+    if args.db:
+        config["db"] = os.path.abspath(args.db)
+    report = build_nel_report(config, rows, args.per_label)
+    print_report(report, args.per_label)
+
+    out_path = os.path.join(args.reports_dir, "nel_report.json")
+    write_json_atomic(out_path, report)
+    print(f"\n[OK] Отчёт: {out_path}")
 
 
 if __name__ == "__main__":
@@ -1,24 +1,152 @@
 import re
+import threading
 import time
-from typing import Dict, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-import requests
+from aimd import backoff_delay, is_backoff_error
 
 CYR_RE = re.compile(r"[А-Яа-яЁё]")
 
+WIKIDATA_API_URL = "https://www.wikidata.org/w/api.php"
+ENTITY_URI_PREFIX = "http://www.wikidata.org/entity/"
+
+# wbgetentities принимает не больше 50 ids за запрос
+WBGETENTITIES_BATCH = 50
+
+# классы Wikidata (P31 / P279), допустимые для метки NER
+TYPE_CONSTRAINTS: Dict[str, Set[str]] = {
+    "PER": {"Q5"},                                   # human
+    "LOC": {
+        "Q486972",   # human settlement
+        "Q515",      # city
+        "Q3957",     # town
+        "Q532",      # village
+        "Q6256",     # country
+        "Q7275",     # state
+        "Q56061",    # administrative territorial entity
+        "Q10864048", # first-level administrative country subdivision
+        "Q13220204", # second-level administrative country subdivision
+        "Q82794",    # geographic region
+        "Q2221906",  # geographic location
+        "Q618123",   # geographical feature
+        "Q5107",     # continent
+        "Q483110",   # stadium
+        "Q1248784",  # airport
+    },
+    "ORG": {
+        "Q43229",    # organization
+        "Q4830453",  # business
+        "Q476028",   # association football club
+        "Q847017",   # sports club
+        "Q12973014", # sports team
+        "Q6979593",  # national association football team
+        "Q7278",     # political party
+        "Q3918",     # university
+        "Q2085381",  # publisher
+        "Q15265344", # broadcaster
+    },
+}
+TYPE_CONSTRAINTS["GPE"] = TYPE_CONSTRAINTS["LOC"]
+TYPE_CONSTRAINTS["PERSON"] = TYPE_CONSTRAINTS["PER"]
+TYPE_CONSTRAINTS["ORGANIZATION"] = TYPE_CONSTRAINTS["ORG"]
+
+# служебные страницы, на которые нельзя ссылаться
+NON_ENTITY_TYPES = {
+    "Q4167410",   # Wikimedia disambiguation page
+    "Q22808320",  # Wikimedia human name disambiguation page
+    "Q4167836",   # Wikimedia category
+    "Q11266439",  # Wikimedia template
+}
+
 
 def is_russian(text: str) -> bool:
     return bool(CYR_RE.search(text or ""))
 
 
 class EntityLinker:
-    def __init__(self, language: str = "ru", limit: int = 1, sleep_s: float = 0.05):
+    def __init__(
+        self,
+        language: str = "ru",
+        limit: int = 1,
+        sleep_s: float = 0.05,
+        index_path: Optional[str] = None,
+        offline_only: bool = False,
+        api_url: str = WIKIDATA_API_URL,
+        controller=None,
+        cassette=None,
+    ):
         self.language = language
         self.limit = limit
         self.sleep_s = sleep_s
-        self.session = requests.Session()
-        self.session.headers.update({"User-Agent": "NER-NEL-Semester-Work/1.0"})
+        self.offline_only = offline_only
+        self.api_url = api_url
+        # AIMDController (aimd.py): адаптивное число параллельных запросов; None — последовательно
+        self.controller = controller
+        self.retries = 2
+        self._lock = threading.Lock()
+
+        # офлайн-индекс (wikidata_index.py) — сначала ищем в нём, онлайн-поиск остаётся запасным
+        self.index = None
+        if index_path:
+            from wikidata_index import WikidataIndex
+            self.index = WikidataIndex(index_path)
+
+        # Cassette (cassette.py): запись / воспроизведение ответов API; при воспроизведении сеть не нужна
+        self.cassette = cassette
+        self.online = not offline_only
+
+        self.session = None
+        if self.online and (cassette is None or cassette.live):
+            import requests  # импорт только при создании линкера
+
+            self.session = requests.Session()
+            self.session.headers.update({"User-Agent": "NER-NEL-Semester-Work/1.0"})
+
         self.cache: Dict[Tuple[str, int], Optional[str]] = {}
+        self.candidates_cache: Dict[Tuple[str, int], List[str]] = {}
+        self.types_cache: Dict[str, Set[str]] = {}
+        self.stats = {"offline_hits": 0, "online_requests": 0, "type_requests": 0, "type_errors": 0}
+
+    def _get(self, params: Dict) -> Dict:
+        with self._lock:
+            self.stats["online_requests"] += 1
+        if self.controller is None:
+            data = self._request(params)
+            time.sleep(self.sleep_s)
+        else:
+            # темп задаёт контроллер, фиксированная пауза не нужна; после отката лимита
+            # запрос повторяется (ошибка от перегрузки — не повод терять ссылку)
+            for attempt in range(self.retries + 1):
+                try:
+                    with self.controller.slot():
+                        data = self._request(params)
+                    break
+                except Exception as e:
+                    if attempt == self.retries or not is_backoff_error(e):
+                        raise
+                    time.sleep(backoff_delay(attempt, e))
+        return data
+
+    def _request(self, params: Dict) -> Dict:
+        if self.cassette is None:
+            return self._http_get(params)
+        return self.cassette.call("wikidata", params, lambda: self._http_get(params))
+
+    def _http_get(self, params: Dict) -> Dict:
+        resp = self.session.get(self.api_url, params=params, timeout=10)
+        resp.raise_for_status()
+        return resp.json()
+
+    def prefetch(self, queries: Iterable[str]):
+        """
+        Заполняет кэш search_wikidata для всех запросов сразу — параллельно, если задан controller.
+        """
+        todo = list(dict.fromkeys(q for q in queries if (q.strip().lower(), self.limit) not in self.cache))
+        if self.controller is None:
+            for q in todo:
+                self.search_wikidata(q)
+        else:
+            self.controller.map(self.search_wikidata, todo)
 
     def search_wikidata(self, query: str) -> Optional[str]:
         q = (query or "").strip()
@@ -29,7 +157,28 @@ class EntityLinker:
         if key in self.cache:
             return self.cache[key]
 
-        url = "https://www.wikidata.org/w/api.php"
+        if self.index is not None:
+            qids = self.index.search(q, limit=1)
+            if qids:
+                uri = ENTITY_URI_PREFIX + qids[0]
+                self.cache[key] = uri
+                with self._lock:
+                    self.stats["offline_hits"] += 1
+                return uri
+
+        if not self.online:
+            self.cache[key] = None
+            return None
+
+        uri = self._search_online(q)
+        self.cache[key] = uri
+        return uri
+
+    def _search_online(self, q: str) -> Optional[str]:
+        results = self._search_results(q)
+        return results[0]["concepturi"] if results else None
+
+    def _search_results(self, q: str) -> List[Dict]:
         params = {
             "action": "wbsearchentities",
             "search": q,
@@ -37,16 +186,134 @@ class EntityLinker:
             "format": "json",
             "limit": self.limit,
         }
+        try:
+            return self._get(params).get("search", [])
+        except Exception:
+            return []
+
+    # ---------- кандидаты и проверка типов ----------
+
+    def search_candidates(self, query: str) -> List[str]:
+        """
+        До limit кандидатов (QID) в порядке ранжирования поиска.
+        """
+        q = (query or "").strip()
+        if not q:
+            return []
+
+        key = (q.lower(), self.limit)
+        if key in self.candidates_cache:
+            return self.candidates_cache[key]
+
+        qids: List[str] = []
+        if self.index is not None:
+            qids = self.index.search(q, limit=self.limit)
+            if qids:
+                with self._lock:
+                    self.stats["offline_hits"] += 1
+
+        if not qids and self.online:
+            qids = [r["id"] for r in self._search_results(q) if r.get("id")]
+
+        self.candidates_cache[key] = qids
+        return qids
+
+    def search_candidates_many(self, queries: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        search_candidates для набора запросов — параллельно, если задан controller.
+        """
+        qs = list(dict.fromkeys(queries))
+        if self.controller is None:
+            return {q: self.search_candidates(q) for q in qs}
+        return dict(zip(qs, self.controller.map(self.search_candidates, qs)))
+
+    def fetch_types(self, qids: Iterable[str]) -> Dict[str, Set[str]]:
+        """
+        P31 ∪ P279 для каждого QID. Офлайн-индекс используется, если есть,
+        остальное добирается пакетами по 50 ids через wbgetentities.
+        """
+        qids = list(dict.fromkeys(qids))
+        # сортировка — чтобы пакеты wbgetentities не зависели от порядка обхода множеств (кассеты, кэши)
+        missing = sorted(q for q in qids if q not in self.types_cache)
+
+        if missing and self.index is not None:
+            for qid, types in self.index.types(missing).items():
+                if types:
+                    self.types_cache[qid] = set(types)
+            missing = [q for q in missing if q not in self.types_cache]
+
+        if missing and self.online:
+            chunks = [missing[i:i + WBGETENTITIES_BATCH] for i in range(0, len(missing), WBGETENTITIES_BATCH)]
+            if self.controller is not None:
+                self.controller.map(self._fetch_chunk, chunks)
+            else:
+                for chunk in chunks:
+                    self._fetch_chunk(chunk)
+
+        return {q: self.types_cache.get(q, set()) for q in qids}
 
+    def _fetch_chunk(self, chunk: List[str]):
+        params = {
+            "action": "wbgetentities",
+            "ids": "|".join(chunk),
+            "props": "claims",
+            "format": "json",
+        }
+        with self._lock:
+            self.stats["type_requests"] += 1
         try:
-            resp = self.session.get(url, params=params, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            results = data.get("search", [])
-            uri = results[0]["concepturi"] if results else None
-            self.cache[key] = uri
-            time.sleep(self.sleep_s)
-            return uri
+            entities = self._get(params).get("entities", {})
         except Exception:
-            self.cache[key] = None
-            return None
+            # неудачный запрос не кэшируется: пустые типы отсекли бы кандидатов до конца прогона,
+            # а при следующем fetch_types эти QID будут запрошены снова
+            with self._lock:
+                self.stats["type_errors"] += 1
+            return
+        for qid in chunk:
+            self.types_cache[qid] = self._claim_types(entities.get(qid) or {})
+
+    @staticmethod
+    def _claim_types(entity: Dict) -> Set[str]:
+        out: Set[str] = set()
+        claims = entity.get("claims") or {}
+        for prop in ("P31", "P279"):
+            for claim in claims.get(prop, []):
+                value = (((claim.get("mainsnak") or {}).get("datavalue") or {}).get("value") or {})
+                if isinstance(value, dict) and value.get("id"):
+                    out.add(value["id"])
+        return out
+
+    def expanded_types(self, qids: Iterable[str], depth: int = 1) -> Dict[str, Set[str]]:
+        """
+        Типы кандидатов + надклассы этих типов на depth уровней (тоже пакетами).
+        """
+        types = {q: set(t) for q, t in self.fetch_types(qids).items()}
+        frontier = {q: set(t) for q, t in types.items()}
+
+        for _ in range(depth):
+            parents = self.fetch_types({t for ts in frontier.values() for t in ts})
+            frontier = {q: {p for t in ts for p in parents.get(t, set())} for q, ts in frontier.items()}
+            for q, ps in frontier.items():
+                types[q] |= ps
+
+        return types
+
+    @staticmethod
+    def type_fits(label: str, types: Set[str]) -> bool:
+        if types & NON_ENTITY_TYPES:
+            return False
+        allowed = TYPE_CONSTRAINTS.get(label)
+        if allowed is None:
+            return True
+        return bool(types & allowed)
+
+    def pick_verified(self, label: str, candidates: List[str], types: Dict[str, Set[str]],
+                      fallback_first: bool = False) -> Optional[str]:
+        for qid in candidates:
+            if self.type_fits(label, types.get(qid, set())):
+                return ENTITY_URI_PREFIX + qid
+        if fallback_first:
+            for qid in candidates:
+                if not types.get(qid, set()) & NON_ENTITY_TYPES:
+                    return ENTITY_URI_PREFIX + qid
+        return None
@@ -0,0 +1,120 @@
+# ner_cascade.py
+# Каскад spaCy → GigaChat: дешёвая разметка (правила + spaCy) для всех ячеек,
+# в LLM уходят только ячейки, где spaCy явно не справился.
+
+from collections import Counter
+from typing import Dict, List, Optional
+
+from column_profile import ColumnProfiler, RULE_LABEL_TYPES
+from fast_path import FastPathClassifier
+
+# типы столбцов, значения которых spaCy разметить не может (нужны DATE / MONEY / ...)
+NON_SPACY_COLUMN_TYPES = set(RULE_LABEL_TYPES.values()) - {"numeric"}
+
+
+def coverage(text: str, entities: List[Dict]) -> float:
+    """
+    Доля символов ячейки, покрытая найденными сущностями (0..1).
+    """
+    t = text.strip()
+    if not t:
+        return 1.0
+    covered = sum(len((e.get("text") or "").strip()) for e in entities)
+    return min(1.0, covered / len(t))
+
+
+class CascadeNER:
+    """
+    Эскалация в LLM (настраивается):
+      empty       — spaCy и правила ничего не нашли (escalate_empty)
+      fragment    — сущности покрывают меньше min_coverage текста ячейки
+      column_type — столбец по профилю требует меток вне PER/LOC/ORG (DATE, MONEY, ...),
+                    а правило fast path ячейку не разметило
+    max_escalation_share ограничивает долю ячеек таблицы, уходящих в LLM.
+    """
+
+    def __init__(
+        self,
+        spacy_ner,
+        llm_ner,
+        escalate_empty: bool = True,
+        min_coverage: float = 0.5,
+        escalate_column_type: bool = True,
+        max_escalation_share: float = 1.0,
+        profiler: Optional[ColumnProfiler] = None,
+    ):
+        self.spacy_ner = spacy_ner
+        self.llm_ner = llm_ner
+        self.escalate_empty = escalate_empty
+        self.min_coverage = min_coverage
+        self.escalate_column_type = escalate_column_type
+        self.max_escalation_share = max_escalation_share
+        self.profiler = profiler or ColumnProfiler()
+        self.classifier: FastPathClassifier = self.profiler.classifier
+
+        self.cells = 0
+        self.rule_cells = 0
+        self.llm_calls = 0
+        self.reasons: Counter = Counter()
+
+    def _reason(self, text: str, entities: List[Dict], col_type: str) -> Optional[str]:
+        if not entities:
+            return "empty" if self.escalate_empty else None
+        if self.escalate_column_type and col_type in NON_SPACY_COLUMN_TYPES:
+            return "column_type"
+        if coverage(text, entities) < self.min_coverage:
+            return "fragment"
+        return None
+
+    def extract_table(self, cells: List[Dict], headers: Dict[int, str]) -> List[List[Dict]]:
+        profiles = self.profiler.profile(cells, headers)
+        out: List[Optional[List[Dict]]] = [self.classifier.classify(c["text"]) for c in cells]
+
+        # 1) spaCy для всего, что не разметили правила
+        spacy_idx = [i for i, ents in enumerate(out) if ents is None]
+        if spacy_idx:
+            for i, ents in zip(spacy_idx, self.spacy_ner.extract_entities_batch([cells[i]["text"] for i in spacy_idx])):
+                out[i] = ents
+
+        # 2) кандидаты на эскалацию
+        escalate: List[int] = []
+        for i in spacy_idx:
+            col_type = profiles[int(cells[i]["col"])]["type"]
+            reason = self._reason(cells[i]["text"], out[i] or [], col_type)
+            if reason is not None:
+                escalate.append(i)
+                self.reasons[reason] += 1
+
+        limit = int(len(cells) * self.max_escalation_share)
+        if len(escalate) > limit:
+            # сначала пустые ячейки, затем самые фрагментарные
+            escalate.sort(key=lambda i: (bool(out[i]), coverage(cells[i]["text"], out[i] or [])))
+            self.reasons["capped"] += len(escalate) - limit
+            escalate = sorted(escalate[:limit])
+
+        # 3) LLM только для эскалированных ячеек; пустой ответ LLM не затирает spaCy
+        if escalate:
+            llm_out = self.llm_ner.extract_entities_batch([cells[i]["text"] for i in escalate])
+            for i, ents in zip(escalate, llm_out):
+                if ents:
+                    out[i] = ents
+
+        self.cells += len(cells)
+        self.rule_cells += len(cells) - len(spacy_idx)
+        self.llm_calls += len(escalate)
+        return [ents or [] for ents in out]
+
+    def stats(self) -> Dict:
+        return {
+            "cells": self.cells,
+            "rule_cells": self.rule_cells,
+            "llm_calls": self.llm_calls,
+            "llm_calls_saved": self.cells - self.llm_calls,
+            "escalation_reasons": dict(self.reasons),
+            "thresholds": {
+                "escalate_empty": self.escalate_empty,
+                "min_coverage": self.min_coverage,
+                "escalate_column_type": self.escalate_column_type,
+                "max_escalation_share": self.max_escalation_share,
+            },
+        }
@@ -0,0 +1,45 @@
+# ner_common.py
+# Общие функции для run-скриптов и NER-сервера: формирование results в едином JSON-формате
+from typing import List, Dict
+
+
+def clean_entities(entities: List[Dict]) -> List[Dict]:
+    """
+    Оставляет в сущностях только поля, которые попадают в выходной JSON.
+    """
+    return [{"text": e["text"], "label": e["label"]} for e in entities]
+
+
+def make_result(cell: Dict, entities: List[Dict], index_base: int = 0) -> Dict:
+    """
+    Одна запись results: координаты ячейки (с учётом index_base), текст и сущности.
+    """
+    r = int(cell["row"])
+    c = int(cell["col"])
+
+    # если хотим 1-based — сдвигаем
+    if index_base == 1:
+        r += 1
+        c += 1
+
+    return {
+        "row": r,
+        "col": c,
+        "text": cell["text"],
+        "entities": clean_entities(entities)
+    }
+
+
+def build_results(cells: List[Dict], entities_per_cell: List[List[Dict]], index_base: int = 0) -> List[Dict]:
+    return [make_result(cell, ents, index_base) for cell, ents in zip(cells, entities_per_cell)]
+
+
+def parse_drop_first_col(value: str):
+    """
+    auto | true | false → None | True | False
+    """
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    return None  # auto
@@ -0,0 +1,244 @@
+# ner_gazetteer.py
+# NER по газеттиру: поверхностные формы из ручной разметки (data/test_set) и связанных
+# сущностей из outputs/*_nel.json компилируются в автомат Ахо-Корасик,
+# ячейка размечается за линейное время по правилу "самое левое, затем самое длинное совпадение".
+
+import glob
+import json
+import os
+import pickle
+import re
+from collections import Counter, defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fast_path import FastPathClassifier
+
+GAZETTEER_VERSION = 2
+
+TABLE_ID_RE = re.compile(r"(\d+)")
+
+DEFAULT_GAZETTEER_PATH = os.path.join("models", "gazetteer.pkl")
+
+
+def norm_char(ch: str) -> str:
+    """
+    Нормализация по одному символу — длина строки сохраняется, поэтому
+    позиции совпадений в нормализованном тексте совпадают с позициями в исходном.
+    """
+    ch = ch.lower()
+    if ch == "ё":
+        return "е"
+    if ch.isspace():
+        return " "
+    return ch
+
+
+def norm_surface(text: str) -> str:
+    return "".join(norm_char(ch) for ch in (text or "").strip())
+
+
+class Gazetteer:
+    def __init__(self, min_len: int = 2):
+        self.min_len = min_len
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[Optional[Tuple[int, str]]] = [None]   # (длина шаблона, метка) если состояние конечное
+        self.dict_link: List[int] = [0]                       # ближайшее конечное состояние по fail-цепочке
+        self.label_counts: Dict[str, Counter] = defaultdict(Counter)
+        # таблицы ручной разметки, из которых взяты формы — eval_ner.py предупредит об их оценке
+        self.trained_tables: List[int] = []
+        self.built = False
+
+    def __len__(self) -> int:
+        return sum(1 for o in self.out if o is not None)
+
+    def add(self, surface: str, label: str, count: int = 1):
+        key = norm_surface(surface)
+        if len(key) < self.min_len:
+            return
+        self.label_counts[key][label] += count
+        self.built = False
+
+    def build(self):
+        """
+        Компилирует накопленные формы в автомат. Для формы с несколькими метками
+        берётся самая частая.
+        """
+        self.goto, self.fail, self.out, self.dict_link = [{}], [0], [None], [0]
+
+        for key, labels in self.label_counts.items():
+            state = 0
+            for ch in key:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(None)
+                    self.dict_link.append(0)
+                state = nxt
+            self.out[state] = (len(key), labels.most_common(1)[0][0])
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                cand = self.goto[f].get(ch, 0)
+                self.fail[nxt] = cand if cand != nxt else 0
+                self.dict_link[nxt] = self.fail[nxt] if self.out[self.fail[nxt]] else self.dict_link[self.fail[nxt]]
+                queue.append(nxt)
+
+        self.built = True
+
+    def _matches(self, key: str) -> Iterable[Tuple[int, int, str]]:
+        state = 0
+        for i, ch in enumerate(key):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+
+            s = state if self.out[state] else self.dict_link[state]
+            while s:
+                length, label = self.out[s]
+                yield i + 1 - length, i + 1, label
+                s = self.dict_link[s]
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Непересекающиеся совпадения (start, end, label) по границам слов:
+        самое левое, при равном начале — самое длинное.
+        """
+        if not self.built:
+            self.build()
+
+        key = "".join(norm_char(ch) for ch in text)
+
+        def boundary(pos: int) -> bool:
+            return pos <= 0 or pos >= len(key) or not key[pos].isalnum() or not key[pos - 1].isalnum()
+
+        cands = [
+            (start, end, label) for start, end, label in self._matches(key)
+            if boundary(start) and boundary(end)
+        ]
+        cands.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+
+        result: List[Tuple[int, int, str]] = []
+        last_end = 0
+        for start, end, label in cands:
+            if start >= last_end:
+                result.append((start, end, label))
+                last_end = end
+        return result
+
+    def save(self, path: str):
+        if not self.built:
+            self.build()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump({
+                "version": GAZETTEER_VERSION,
+                "min_len": self.min_len,
+                "goto": self.goto,
+                "fail": self.fail,
+                "out": self.out,
+                "dict_link": self.dict_link,
+                "label_counts": {k: dict(v) for k, v in self.label_counts.items()},
+                "trained_tables": self.trained_tables,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "Gazetteer":
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != GAZETTEER_VERSION:
+            raise ValueError(f"Газеттир {path} собран другой версией ({data.get('version')}), пересоберите его")
+
+        gz = cls(min_len=data["min_len"])
+        gz.goto = data["goto"]
+        gz.fail = data["fail"]
+        gz.out = data["out"]
+        gz.dict_link = data["dict_link"]
+        gz.label_counts = defaultdict(Counter, {k: Counter(v) for k, v in data["label_counts"].items()})
+        gz.trained_tables = data["trained_tables"]
+        gz.built = True
+        return gz
+
+
+def iter_labelled(path: str, linked_only: bool) -> Iterable[Tuple[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        obj = json.load(f)
+    for cell in obj.get("results", []):
+        for ent in cell.get("entities") or []:
+            text, label = ent.get("text"), ent.get("label")
+            if not text or not label:
+                continue
+            if linked_only and not ent.get("kb_id"):
+                continue
+            yield str(text), str(label)
+
+
+def build_gazetteer(gold_dir: Optional[str], nel_glob: Optional[str], min_len: int = 2,
+                    skip_rule_typed: bool = True) -> Gazetteer:
+    """
+    Собирает газеттир: все сущности из gold_dir/*.json и связанные (kb_id != null)
+    сущности из файлов по nel_glob. Числа/даты, которые и так размечает fast path, пропускаются.
+    Номера таблиц gold_dir сохраняются в gz.trained_tables.
+    """
+    gz = Gazetteer(min_len=min_len)
+    classifier = FastPathClassifier()
+
+    sources: List[Tuple[str, bool]] = []
+    if gold_dir:
+        gold_paths = sorted(glob.glob(os.path.join(gold_dir, "*.json")))
+        sources += [(p, False) for p in gold_paths]
+        ids = (TABLE_ID_RE.search(os.path.basename(p)) for p in gold_paths)
+        gz.trained_tables = sorted({int(m.group(1)) for m in ids if m})
+    if nel_glob:
+        sources += [(p, True) for p in sorted(glob.glob(nel_glob))]
+
+    for path, linked_only in sources:
+        try:
+            pairs = list(iter_labelled(path, linked_only))
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Пропуск {path}: {e}")
+            continue
+        for text, label in pairs:
+            if skip_rule_typed and classifier.classify_label(text) is not None:
+                continue
+            gz.add(text, label)
+
+    gz.build()
+    return gz
+
+
+class GazetteerNER:
+    """
+    Бэкенд с интерфейсом SpacyNER: правила fast path для тривиальных ячеек + газеттир.
+    """
+
+    def __init__(self, path: str = DEFAULT_GAZETTEER_PATH):
+        self.gazetteer = Gazetteer.load(path)
+        self.classifier = FastPathClassifier()
+
+    @property
+    def trained_tables(self) -> List[int]:
+        """
+        Таблицы ручной разметки, вошедшие в газеттир (пишутся в meta.model_trained_tables).
+        """
+        return self.gazetteer.trained_tables
+
+    def extract_entities(self, text: str) -> List[Dict]:
+        rule = self.classifier.classify(text)
+        if rule is not None:
+            return rule
+        return [
+            {"text": text[start:end], "label": label, "source": "gazetteer"}
+            for start, end, label in self.gazetteer.find(text)
+        ]
+
+    def extract_entities_batch(self, texts: List[str]) -> List[List[Dict]]:
+        return [self.extract_entities(t) for t in texts]
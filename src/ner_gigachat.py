@@ -1,29 +1,20 @@
-from typing import List, Dict
-from langchain_gigachat.chat_models import GigaChat
-from langchain.schema import HumanMessage
+from collections import defaultdict
+from typing import List, Dict, Optional
 import json
+import os
 import re
+import threading
+import time
 
-gigachat_api_key = 'MDE5YTZiZjMtM2FlZS03ZjQ1LTkwNDMtMmJkNjBhZGNmY2Y3OjkyMmVkMmIxLTMyMGUtNDU1YS1hMWU0LThjM2RlNmUxY2Q1Mw=='
+from aimd import backoff_delay, is_backoff_error
+from token_budget import TokenMeter, estimate_tokens, usage_from_response
 
-class GigaChatNER:
-    def __init__(self, mode="zero"):
-        self.mode = mode
-        self.source = f"gigachat_{mode}"
-        self.model = GigaChat(
-            credentials=gigachat_api_key,
-            verify_ssl_certs=False,
-            model="GigaChat",
-            temperature=0.1,
-            timeout=120
-        )
+CODE_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
 
-    def _build_prompt(self, text: str) -> str:
-        if self.mode == "zero":
-            return f"""
-Ты — система распознавания именованных сущностей (NER) на русском языке. 
-Твоя задача — найти в тексте все значимые сущности и классифицировать их по следующим категориям:
+# ключ берётся из аргумента credentials или переменной окружения
+GIGACHAT_API_KEY_ENV = "GIGACHAT_API_KEY"
 
+LABELS_BLOCK = """\
 - PER — имя человека
 - ORG — организация, компания, учреждение
 - LOC — конкретное место (город, деревня, объект)
@@ -40,71 +31,216 @@ class GigaChatNER:
 - LANGUAGE — языки
 - NORP — национальности, религия, политические группы
 - FAC — здания, сооружения, аэропорты
-- MISC — прочие значимые объекты
+- MISC — прочие значимые объекты"""
+
+FEW_SHOT_EXAMPLES = """\
+"Иван Иванов" -> [{"text": "Иван Иванов", "label": "PER"}]  
+"Первый канал" -> [{"text": "Первый канал", "label": "ORG"}]  
+"Москва" -> [{"text": "Москва", "label": "LOC"}]  
+"Россия" -> [{"text": "Россия", "label": "GPE"}]  
+"12 декабря 2020" -> [{"text": "12 декабря 2020", "label": "DATE"}]  
+"15:30" -> [{"text": "15:30", "label": "TIME"}]  
+"100 млн ₽" -> [{"text": "100 млн ₽", "label": "MONEY"}]  
+"10%" -> [{"text": "10%", "label": "PERCENT"}]  
+"5 кг" -> [{"text": "5 кг", "label": "QUANTITY"}]
+"14 215" -> [{"text":"14 215","label":"QUANTITY"}]  
+"Чемпионат мира по футболу 2018" -> [{"text": "Чемпионат мира по футболу 2018", "label": "EVENT"}]  
+"Война и мир" -> [{"text": "Война и мир", "label": "WORK_OF_ART"}]  
+"iPhone 14" -> [{"text": "iPhone 14", "label": "PRODUCT"}]  
+"Федеральный закон №123-ФЗ" -> [{"text": "Федеральный закон №123-ФЗ", "label": "LAW"}]  
+"русский" -> [{"text": "русский", "label": "LANGUAGE"}]  
+"русские" -> [{"text": "русские", "label": "NORP"}]  
+"МГУ" -> [{"text": "МГУ", "label": "FAC"}]  
+"ВГТРК" -> [{"text": "ВГТРК", "label": "MISC"}]"""
+
+
+def build_cell_prompt(mode: str, text: str, examples: str = FEW_SHOT_EXAMPLES) -> str:
+    if mode == "zero":
+        return f"""
+Ты — система распознавания именованных сущностей (NER) на русском языке. 
+Твоя задача — найти в тексте все значимые сущности и классифицировать их по следующим категориям:
+
+{LABELS_BLOCK}
 
 Выводи результат строго в формате JSON: [{{"text": "...", "label": "..."}}]  
 Если сущностей нет — верни пустой список [].
 
 Текст для анализа: "{text}"
 """
-        elif self.mode == "few":
-            return f"""
+    elif mode == "few":
+        return f"""
 Ты — система распознавания именованных сущностей (NER) на русском языке. 
 Твоя задача — найти в тексте все значимые сущности и классифицировать их по следующим категориям:
 
-- PER — имя человека
-- ORG — организация, компания, учреждение
-- LOC — конкретное место (город, деревня, объект)
-- GPE — геополитическая территория (страна, регион)
-- DATE — дата, год, период времени
-- TIME — время
-- MONEY — денежные суммы
-- PERCENT — проценты
-- QUANTITY — количество или мера
-- EVENT — событие
-- WORK_OF_ART — произведение искусства
-- PRODUCT — продукты, товары
-- LAW — законы и нормативные акты
-- LANGUAGE — языки
-- NORP — национальности, религия, политические группы
-- FAC — здания, сооружения, аэропорты
-- MISC — прочие значимые объекты
+{LABELS_BLOCK}
 
 Примеры:
 
-"Иван Иванов" -> [{{"text": "Иван Иванов", "label": "PER"}}]  
-"Первый канал" -> [{{"text": "Первый канал", "label": "ORG"}}]  
-"Москва" -> [{{"text": "Москва", "label": "LOC"}}]  
-"Россия" -> [{{"text": "Россия", "label": "GPE"}}]  
-"12 декабря 2020" -> [{{"text": "12 декабря 2020", "label": "DATE"}}]  
-"15:30" -> [{{"text": "15:30", "label": "TIME"}}]  
-"100 млн ₽" -> [{{"text": "100 млн ₽", "label": "MONEY"}}]  
-"10%" -> [{{"text": "10%", "label": "PERCENT"}}]  
-"5 кг" -> [{{"text": "5 кг", "label": "QUANTITY"}}]
-"14 215" -> [{{"text":"14 215","label":"QUANTITY"}}]  
-"Чемпионат мира по футболу 2018" -> [{{"text": "Чемпионат мира по футболу 2018", "label": "EVENT"}}]  
-"Война и мир" -> [{{"text": "Война и мир", "label": "WORK_OF_ART"}}]  
-"iPhone 14" -> [{{"text": "iPhone 14", "label": "PRODUCT"}}]  
-"Федеральный закон №123-ФЗ" -> [{{"text": "Федеральный закон №123-ФЗ", "label": "LAW"}}]  
-"русский" -> [{{"text": "русский", "label": "LANGUAGE"}}]  
-"русские" -> [{{"text": "русские", "label": "NORP"}}]  
-"МГУ" -> [{{"text": "МГУ", "label": "FAC"}}]  
-"ВГТРК" -> [{{"text": "ВГТРК", "label": "MISC"}}]
+{examples}
 
 Выведи результат строго в формате JSON: [{{"text": "...", "label": "..."}}]  
 Если сущностей нет — верни пустой список [].
 
 Текст для анализа: "{text}"
 """
-    def extract_entities(self, text: str) -> List[Dict]:
-        prompt = self._build_prompt(text)
-        response = self.model.invoke([HumanMessage(content=prompt)])
 
+
+def build_table_prompt(mode: str, headers: Dict[int, str], block: List[Dict],
+                       examples: str = FEW_SHOT_EXAMPLES) -> str:
+    """
+    Промпт табличного режима: заголовки столбцов + блок строк целиком,
+    ответ — сущности для каждой ячейки по её id.
+    """
+    header_line = " | ".join(h for _, h in sorted(headers.items()) if h) or "(нет)"
+    cells_json = json.dumps(
+        [
+            {"id": i, "row": cell["row"], "column": headers.get(int(cell["col"]), ""), "text": cell["text"]}
+            for i, cell in enumerate(block)
+        ],
+        ensure_ascii=False,
+    )
+    examples_block = ""
+    if mode == "few":
+        examples_block = f"""
+Примеры разметки отдельных значений:
+
+{examples}
+"""
+    return f"""
+Ты — система распознавания именованных сущностей (NER) на русском языке.
+Тебе дан фрагмент таблицы. Используй заголовки столбцов и соседние ячейки строки как контекст,
+но сущности ищи только внутри текста каждой ячейки. Категории:
+
+{LABELS_BLOCK}
+{examples_block}
+Заголовки столбцов: {header_line}
+
+Ячейки (JSON): {cells_json}
+
+Для КАЖДОЙ ячейки выведи результат строго в формате JSON:
+[{{"id": 0, "entities": [{{"text": "...", "label": "..."}}]}}, ...]
+Если в ячейке сущностей нет — "entities": [].
+"""
+
+
+class GigaChatNER:
+    def __init__(self, mode="zero", controller=None, credentials: Optional[str] = None, cassette=None,
+                 fewshot=None, fewshot_k: int = 8, fewshot_exclude_table: Optional[int] = None):
+        self.mode = mode
+        self.source = f"gigachat_{mode}"
+        # FewShotIndex (fewshot_index.py): в режиме few примеры подбираются под ячейку; None — фиксированные
+        self.fewshot = fewshot
+        self.fewshot_k = fewshot_k
+        self.fewshot_exclude_table = fewshot_exclude_table
+        # AIMDController (aimd.py): адаптивное число параллельных запросов; None — последовательно
+        self.controller = controller
+        # Cassette (cassette.py): запись / воспроизведение ответов модели; None — всегда живой запрос
+        self.cassette = cassette
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.tokens = TokenMeter()
+        # повторы запроса после ошибки перегрузки (is_backoff_error) с паузой backoff_delay, как в nel_wikidata
+        self.retries = 2
+        # ячейки / блоки строк, оставшиеся без ответа после повторов: [(текст или номер блока, ошибка)]
+        self.failed: List[tuple] = []
+
+        self.model = None
+        if cassette is not None and not cassette.live:
+            return  # воспроизведение с кассеты: ни ключ, ни langchain не нужны
+
+        credentials = credentials or os.environ.get(GIGACHAT_API_KEY_ENV)
+        if not credentials:
+            raise ValueError(f"Не задан ключ GigaChat: передайте credentials (--credentials) "
+                             f"или переменную окружения {GIGACHAT_API_KEY_ENV}")
+
+        # langchain тяжёлый — импортируем только когда модель действительно нужна
+        from langchain_gigachat.chat_models import GigaChat
+        from langchain.schema import HumanMessage
+
+        self._message_cls = HumanMessage
+        self.model = GigaChat(
+            credentials=credentials,
+            verify_ssl_certs=False,
+            model="GigaChat",
+            temperature=0.1,
+            timeout=120
+        )
+
+    def _examples(self, texts: List[str]) -> str:
+        if self.fewshot is None:
+            return FEW_SHOT_EXAMPLES
+        from fewshot_index import format_examples
+
+        examples = self.fewshot.select(texts, k=self.fewshot_k, exclude_table=self.fewshot_exclude_table)
+        return format_examples(examples) if examples else FEW_SHOT_EXAMPLES
+
+    def _build_prompt(self, text: str) -> str:
+        if self.mode != "few":
+            return build_cell_prompt(self.mode, text)
+        return build_cell_prompt(self.mode, text, examples=self._examples([text]))
+
+    def _invoke(self, prompt: str) -> str:
+        for attempt in range(self.retries + 1):
+            with self._lock:
+                self.calls += 1
+            try:
+                if self.controller is None:
+                    return self._ask(prompt)
+                # после отката лимита контроллером запрос повторяется
+                with self.controller.slot():
+                    return self._ask(prompt)
+            except Exception as e:
+                if attempt == self.retries or not is_backoff_error(e):
+                    raise
+                time.sleep(backoff_delay(attempt, e))
+
+    def _map_isolated(self, fn, items: List, key, empty):
+        """
+        fn по всем items (параллельно, если задан controller); ошибка одного элемента
+        не роняет остальные — он получает empty и попадает в self.failed.
+        Если не удалось ни одного элемента, первая ошибка пробрасывается (таблицу не сохраняем пустой).
+        """
+        errors: List[Exception] = []
+
+        def safe(item):
+            try:
+                return fn(item)
+            except Exception as e:
+                with self._lock:
+                    errors.append(e)
+                    self.failed.append((key(item), f"{type(e).__name__}: {e}"))
+                return empty
+
+        out = self.controller.map(safe, items) if self.controller is not None else [safe(x) for x in items]
+        if errors and len(errors) == len(items):
+            raise errors[0]
+        return out
+
+    def _ask(self, prompt: str) -> str:
+        if self.cassette is None:
+            answer = self._ask_model(prompt)
+        else:
+            answer = self.cassette.call("gigachat", {"prompt": prompt}, lambda: self._ask_model(prompt))
+
+        # токены: из метаданных ответа, иначе локальная оценка по длине
+        usage = answer.get("usage")
+        if usage:
+            self.tokens.add(usage["prompt"], usage["completion"])
+        else:
+            self.tokens.add(estimate_tokens(prompt), estimate_tokens(answer["content"]), estimated=True)
+        return answer["content"]
+
+    def _ask_model(self, prompt: str) -> Dict:
+        response = self.model.invoke([self._message_cls(content=prompt)])
+        return {"content": response.content, "usage": usage_from_response(response)}
+
+    def _parse_json(self, content: str):
         try:
-            data = json.loads(response.content)
+            return json.loads(CODE_FENCE_RE.sub("", content.strip()))
         except Exception:
-            return []
+            return None
 
+    def _to_entities(self, data) -> List[Dict]:
         if not isinstance(data, list):
             return []
 
@@ -117,4 +253,66 @@ class GigaChatNER:
                     "source": f"gigachat_{self.mode}"
                 })
 
-        return entities
\ No newline at end of file
+        return entities
+
+    def extract_entities(self, text: str) -> List[Dict]:
+        prompt = self._build_prompt(text)
+        return self._to_entities(self._parse_json(self._invoke(prompt)))
+
+    def extract_entities_batch(self, texts: List[str]) -> List[List[Dict]]:
+        """
+        Пакетный интерфейс, совместимый со SpacyNER: один запрос к GigaChat на ячейку
+        (параллельно, если задан controller).
+        """
+        return self._map_isolated(self.extract_entities, texts, key=lambda t: t, empty=[])
+
+    def _build_table_prompt(self, headers: Dict[int, str], block: List[Dict]) -> str:
+        if self.mode != "few":
+            return build_table_prompt(self.mode, headers, block)
+        examples = self._examples([cell["text"] for cell in block])
+        return build_table_prompt(self.mode, headers, block, examples=examples)
+
+    def extract_table(
+        self,
+        cells: List[Dict],
+        headers: Dict[int, str],
+        rows_per_call: int = 1,
+    ) -> List[List[Dict]]:
+        """
+        Табличный режим: один запрос к GigaChat на блок из rows_per_call строк.
+        Возвращает сущности для каждой ячейки в порядке cells.
+        """
+        if rows_per_call < 1:
+            raise ValueError(f"rows_per_call должен быть >= 1, получено {rows_per_call}")
+
+        by_row: Dict[int, List[int]] = defaultdict(list)
+        for i, cell in enumerate(cells):
+            by_row[int(cell["row"])].append(i)
+
+        rows = sorted(by_row)
+        out: List[Optional[List[Dict]]] = [None] * len(cells)
+
+        blocks = [
+            [i for r in rows[start:start + rows_per_call] for i in by_row[r]]
+            for start in range(0, len(rows), rows_per_call)
+        ]
+
+        def ask(idxs: List[int]):
+            block = [cells[i] for i in idxs]
+            return self._parse_json(self._invoke(self._build_table_prompt(headers, block)))
+
+        answers = self._map_isolated(ask, blocks, key=lambda idxs: int(cells[idxs[0]]["row"]), empty=None)
+
+        for idxs, data in zip(blocks, answers):
+            if isinstance(data, list):
+                for item in data:
+                    if not isinstance(item, dict):
+                        continue
+                    try:
+                        j = int(item.get("id"))
+                    except (TypeError, ValueError):
+                        continue
+                    if 0 <= j < len(idxs):
+                        out[idxs[j]] = self._to_entities(item.get("entities"))
+
+        return [ents or [] for ents in out]
@@ -0,0 +1,289 @@
+# ner_server.py
+# Резидентный NER-сервер: модели загружаются один раз и остаются "тёплыми",
+# запросы (ячейка / пакет ячеек / целый CSV) принимаются по HTTP и склеиваются в микро-батчи.
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib import request as urlrequest
+
+from ner_common import build_results, clean_entities, parse_drop_first_col
+from table_load import RF200TableLoader
+
+BACKENDS = ("spacy", "gigachat_zero", "gigachat_few")
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+def create_backend(name: str, spacy_model: str = "ru_core_news_lg", spacy_profile: str = "full"):
+    if name == "spacy":
+        from ner_spacy import SpacyNER
+        return SpacyNER(model_name=spacy_model, profile=spacy_profile)
+    if name in ("gigachat_zero", "gigachat_few"):
+        from ner_gigachat import GigaChatNER
+        return GigaChatNER(mode=name.split("_", 1)[1])
+    raise ValueError(f"Неизвестный backend: {name}")
+
+
+class MicroBatcher:
+    """
+    Очередь ячеек к одной модели. Ячейки из параллельных запросов собираются
+    в батч размером до max_batch или пока не истечёт max_wait_ms после первой.
+    Модель вызывается из одного потока — так безопасно и для spaCy, и для GigaChat.
+    """
+
+    def __init__(self, ner, max_batch: int = 64, max_wait_ms: float = 10.0):
+        self.ner = ner
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.queue: "asyncio.Queue[Tuple[str, asyncio.Future]]" = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stats = {"cells": 0, "batches": 0, "max_batch_seen": 0}
+
+    async def submit(self, texts: List[str]) -> List[List[Dict]]:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            fut = loop.create_future()
+            self.queue.put_nowait((text, fut))
+            futures.append(fut)
+        return list(await asyncio.gather(*futures))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait_s
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                out = await loop.run_in_executor(self.executor, self.ner.extract_entities_batch, texts)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            self.stats["cells"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+
+            for (_, fut), entities in zip(batch, out):
+                if not fut.done():
+                    fut.set_result(entities)
+
+
+class NERServer:
+    def __init__(self, batchers: Dict[str, MicroBatcher]):
+        self.batchers = batchers
+        self.loader = RF200TableLoader(tables_dir=".", verbose=False)
+        self.started = time.time()
+        self.requests = 0
+
+    async def handle_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Форматы запроса (POST /ner):
+          {"backend": "spacy", "text": "..."}                       → {"entities": [...]}
+          {"backend": "spacy", "texts": ["...", ...]}               → {"entities": [[...], ...]}
+          {"backend": "spacy", "cells": [{"row", "col", "text"}]}   → {"results": [...]}
+          {"backend": "spacy", "csv": "...", "table_id": 201, ...}  → объект как в outputs/*.json
+        """
+        backend = payload.get("backend", "spacy")
+        batcher = self.batchers.get(backend)
+        if batcher is None:
+            raise ValueError(f"backend '{backend}' не загружен (доступны: {', '.join(self.batchers)})")
+
+        index_base = int(payload.get("index_base", 0))
+
+        if "text" in payload:
+            entities = (await batcher.submit([str(payload["text"])]))[0]
+            return {"entities": clean_entities(entities)}
+
+        if "texts" in payload:
+            out = await batcher.submit([str(t) for t in payload["texts"]])
+            return {"entities": [clean_entities(e) for e in out]}
+
+        if "cells" in payload:
+            cells = payload["cells"]
+            out = await batcher.submit([str(c["text"]) for c in cells])
+            return {"results": build_results(cells, out, index_base)}
+
+        if "csv" in payload:
+            table_id = int(payload.get("table_id", 0))
+            drop_first_col = payload.get("drop_first_col", "auto")
+            if not isinstance(drop_first_col, bool):
+                drop_first_col = parse_drop_first_col(str(drop_first_col).lower())
+            drop_header = payload.get("drop_header", True)
+            if not isinstance(drop_header, bool):
+                drop_header = str(drop_header).lower() == "true"
+
+            cells = self.loader.load_table_from_text(
+                table_id=table_id,
+                text=payload["csv"],
+                drop_first_col=drop_first_col,
+                drop_header=drop_header
+            )
+            out = await batcher.submit([c["text"] for c in cells])
+            return {
+                "table_name": payload.get("table_name") or f"{table_id}.csv",
+                "method": backend,
+                "meta": {
+                    "drop_header": drop_header,
+                    "drop_first_col": drop_first_col,
+                    "index_base": index_base,
+                },
+                "results": build_results(cells, out, index_base)
+            }
+
+        raise ValueError("ожидается одно из полей: text | texts | cells | csv")
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "backends": {name: b.stats for name, b in self.batchers.items()},
+        }
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                writer.close()
+                return
+            method, path, _ = (request_line.split(" ") + ["", ""])[:3]
+
+            headers: Dict[str, str] = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1")
+                if line in ("\r\n", "\n", ""):
+                    break
+                k, _, v = line.partition(":")
+                headers[k.strip().lower()] = v.strip()
+
+            length = int(headers.get("content-length", "0") or 0)
+            body = await reader.readexactly(length) if length else b""
+
+            status, obj = await self.route(method, path, body)
+        except Exception as e:
+            status, obj = 500, {"error": str(e)}
+
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def route(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        if method == "GET" and path == "/health":
+            return 200, self.health()
+
+        if method == "POST" and path == "/ner":
+            self.requests += 1
+            try:
+                payload = json.loads(body.decode("utf-8") or "{}")
+                return 200, await self.handle_payload(payload)
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, {"error": str(e)}
+
+        return 404, {"error": f"{method} {path} не поддерживается"}
+
+
+class NERClient:
+    """
+    Тонкий клиент к ner_server.py с тем же интерфейсом, что у SpacyNER / GigaChatNER.
+    """
+
+    def __init__(self, url: str, backend: str = "spacy", timeout: float = 600.0):
+        self.url = url.rstrip("/")
+        self.backend = backend
+        self.timeout = timeout
+
+    def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        req = urlrequest.Request(
+            f"{self.url}/ner",
+            data=data,
+            headers={"Content-Type": "application/json; charset=utf-8"},
+            method="POST",
+        )
+        with urlrequest.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def extract_entities(self, text: str) -> List[Dict]:
+        return self._post({"backend": self.backend, "text": text})["entities"]
+
+    def extract_entities_batch(self, texts: List[str]) -> List[List[Dict]]:
+        return self._post({"backend": self.backend, "texts": texts})["entities"]
+
+
+async def serve(args, backends: List[str]):
+    batchers: Dict[str, MicroBatcher] = {}
+    for name in backends:
+        t0 = time.time()
+        ner = create_backend(name, spacy_model=args.model, spacy_profile=args.spacy_profile)
+        batchers[name] = MicroBatcher(ner, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+        if not args.quiet:
+            print(f"[OK] backend {name} загружен за {time.time() - t0:.1f} с")
+
+    server = NERServer(batchers)
+    workers = [asyncio.create_task(b.run()) for b in batchers.values()]
+
+    srv = await asyncio.start_server(server.handle_connection, args.host, args.port)
+    if not args.quiet:
+        print(f"[OK] NER-сервер слушает http://{args.host}:{args.port} (POST /ner, GET /health)")
+
+    try:
+        async with srv:
+            await srv.serve_forever()
+    finally:
+        for w in workers:
+            w.cancel()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Резидентный NER-сервер (spaCy / GigaChat) с микро-батчингом")
+    parser.add_argument("--backends", default="spacy",
+                        help=f"Какие модели держать загруженными, через запятую: {', '.join(BACKENDS)}")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--model", default="ru_core_news_lg", help="spaCy модель (по умолчанию ru_core_news_lg)")
+    parser.add_argument("--spacy_profile", choices=["full", "ner"], default="full",
+                        help="full — все компоненты spaCy | ner — только NER")
+    parser.add_argument("--max_batch", type=int, default=64, help="Максимальный размер микро-батча (ячеек)")
+    parser.add_argument("--max_wait_ms", type=float, default=10.0,
+                        help="Сколько ждать добора батча после первой ячейки (мс)")
+    parser.add_argument("--quiet", action="store_true", help="Отключить вывод в консоль")
+    args = parser.parse_args(argv)
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = [b for b in backends if b not in BACKENDS]
+    if unknown:
+        parser.error(f"неизвестные backends: {', '.join(unknown)}")
+
+    try:
+        asyncio.run(serve(args, backends))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
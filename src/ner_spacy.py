@@ -1,19 +1,107 @@
 # ner_spacy.py
-from typing import List, Dict
-import spacy
+from typing import List, Dict, Optional
 import os
 import re
 
 NUM_RE = re.compile(r"^\d{1,3}(?:[ \u00A0]\d{3})*(?:[.,]\d+)?$|^\d+(?:[.,]\d+)?$")
 
+# локальные модели проекта: --model full → модель с 17 метками (train_spacy_ner.py);
+# sm / md / lg — короткие имена пакетов ru_core_news_*
+MODEL_ALIASES = {
+    "full": os.path.join("models", "spacy_ner_full", "model-best"),
+    "sm": "ru_core_news_sm",
+    "md": "ru_core_news_md",
+    "lg": "ru_core_news_lg",
+}
+
+# профили пайплайна:
+#   full — все компоненты модели (как раньше)
+#   ner  — только ner и то, от чего он зависит; теггер, парсер, лемматизатор и т.п. не загружаются
+PROFILES = ("full", "ner")
+
+# компоненты, результаты которых extract_entities не читает (читается только doc.ents)
+NON_NER_COMPONENTS = ["tagger", "morphologizer", "parser", "attribute_ruler", "lemmatizer", "senter", "sentencizer"]
+
+# бюджет символов на батч nlp.pipe: короткие числа идут сотнями, длинные названия — по несколько,
+# память на батч ограничена независимо от размера таблицы
+DEFAULT_BATCH_CHARS = 4000
+
+
+def length_batches(texts: List[str], batch_size: int, max_chars: int) -> List[List[int]]:
+    """
+    Индексы texts, отсортированные по длине и нарезанные на батчи не длиннее batch_size ячеек
+    и max_chars символов (ячейка длиннее бюджета идёт отдельным батчем).
+    """
+    order = sorted(range(len(texts)), key=lambda i: (len(texts[i]), i))
+    batches: List[List[int]] = []
+    cur: List[int] = []
+    cur_chars = 0
+    for i in order:
+        n = len(texts[i])
+        if cur and (len(cur) >= batch_size or cur_chars + n > max_chars):
+            batches.append(cur)
+            cur, cur_chars = [], 0
+        cur.append(i)
+        cur_chars += n
+    if cur:
+        batches.append(cur)
+    return batches
+
+
 class SpacyNER:
-    def __init__(self, model_name: str = "ru_core_news_lg"):
+    def __init__(self, model_name: str = "ru_core_news_lg", profile: str = "full",
+                 batch_chars: int = DEFAULT_BATCH_CHARS):
+        # spaCy импортируется только при создании модели: --help и ошибки загрузки таблицы
+        # не должны платить секунды за импорт
+        import spacy
+
+        if profile not in PROFILES:
+            raise ValueError(f"Неизвестный профиль spaCy: {profile} (ожидается {', '.join(PROFILES)})")
+        self.profile = profile
+        self.batch_chars = batch_chars
+
+        model_name = MODEL_ALIASES.get(model_name, model_name)
+        self.model_name = model_name
+        if os.path.sep in model_name or "/" in model_name:
+            # локальная модель: скачивать нечего
+            if not os.path.isdir(model_name):
+                raise FileNotFoundError(f"Модель {model_name} не найдена (обучите: python src/train_spacy_ner.py)")
+            self.nlp = self._load(spacy, model_name)
+            return
+
         try:
-            self.nlp = spacy.load(model_name)
+            self.nlp = self._load(spacy, model_name)
         except OSError:
             print(f"[INFO] Модель {model_name} не найдена. Скачиваем...")
             os.system(f"python -m spacy download {model_name}")
-            self.nlp = spacy.load(model_name)
+            self.nlp = self._load(spacy, model_name)
+
+    def _load(self, spacy, model_name: str):
+        if self.profile == "full":
+            return spacy.load(model_name)
+
+        nlp = spacy.load(model_name, exclude=NON_NER_COMPONENTS)
+        # общий tok2vec оставляем, только если ner его слушает (в ru_core_news у ner свой tok2vec,
+        # в модели train_spacy_ner.py — общий)
+        if "tok2vec" in nlp.pipe_names:
+            listeners = getattr(nlp.get_pipe("tok2vec"), "listening_components", None)
+            if listeners is not None and "ner" not in listeners:
+                nlp.remove_pipe("tok2vec")
+        return nlp
+
+    @property
+    def components(self) -> List[str]:
+        return list(self.nlp.pipe_names)
+
+    @property
+    def trained_tables(self) -> Optional[List[int]]:
+        """
+        Таблицы train + dev модели train_spacy_ner.py (meta.json → table_split); None для прочих моделей.
+        """
+        split = self.nlp.meta.get("table_split")
+        if not split:
+            return None
+        return sorted(set(split.get("train", [])) | set(split.get("dev", [])))
 
     def extract_entities(self, text: str) -> List[Dict]:
         """
@@ -21,8 +109,23 @@ class SpacyNER:
         + дополнительное правило: если ячейка — число (с пробелами как в '14 215'),
           добавляем сущность QUANTITY.
         """
-        doc = self.nlp(text)
+        return self._doc_entities(self.nlp(text), text)
+
+    def extract_entities_batch(self, texts: List[str], batch_size: int = 64) -> List[List[Dict]]:
+        """
+        То же, что extract_entities, но для списка ячеек через nlp.pipe.
+        Ячейки группируются по длине в батчи до batch_size ячеек / batch_chars символов
+        (меньше паддинга, память на батч ограничена); Doc сразу превращаются в сущности.
+        Порядок результата совпадает с порядком texts.
+        """
+        out: List[List[Dict]] = [[] for _ in texts]
+        for batch in length_batches(texts, batch_size, self.batch_chars):
+            docs = self.nlp.pipe([texts[i] for i in batch], batch_size=len(batch))
+            for i, doc in zip(batch, docs):
+                out[i] = self._doc_entities(doc, texts[i])
+        return out
 
+    def _doc_entities(self, doc, text: str) -> List[Dict]:
         entities: List[Dict] = []
         for ent in doc.ents:
             entities.append({
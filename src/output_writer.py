@@ -0,0 +1,271 @@
+# output_writer.py
+# Запись выходных JSON без полуфабрикатов: временный файл в той же папке → fsync → os.replace
+# (прерванный прогон не оставляет обрезанный JSON под итоговым именем), блокировка на каждый
+# выход (параллельные воркеры не пишут один файл одновременно) и проверка уже записанных
+# выходов: битые откладываются в *.corrupt и возвращаются в очередь work_queue.py.
+#
+# python src/output_writer.py --out_dir .\outputs --quarantine [--queue .\outputs\queue.sqlite]
+
+import argparse
+import glob
+import json
+import os
+import re
+import socket
+import sys
+import tempfile
+import time
+from typing import Any, List, Optional, Tuple
+
+DEFAULT_OUT_DIR = r".\outputs"
+
+LOCK_SUFFIX = ".lock"
+CORRUPT_SUFFIX = ".corrupt"
+TMP_SUFFIX = ".tmp"
+
+# {table_id}_{job}.json → задача (job, table_id) в очереди
+OUTPUT_NAME_RE = re.compile(r"^(\d+)_(.+)\.json$")
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # без сторонних модулей на Windows не проверить — считаем живым, остаётся проверка по возрасту
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class OutputLock:
+    """
+    Блокировка <path>.lock (создание с O_EXCL работает и на общих дисках).
+    Блокировка считается брошенной, если её процесс на этой машине умер
+    или она старше stale_s; тогда её можно забрать.
+    """
+
+    def __init__(self, path: str, timeout: float = 120.0, stale_s: float = 600.0, poll: float = 0.1):
+        self.path = path + LOCK_SUFFIX
+        self.timeout = timeout
+        self.stale_s = stale_s
+        self.poll = poll
+
+    def _stale(self) -> bool:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                owner = json.load(f)
+            age = time.time() - os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError):
+            # владелец ещё не дописал содержимое — смотрим только на возраст
+            try:
+                return time.time() - os.path.getmtime(self.path) > self.stale_s
+            except OSError:
+                return False
+        if age > self.stale_s:
+            return True
+        return owner.get("host") == socket.gethostname() and not _pid_alive(int(owner.get("pid", 0)))
+
+    def acquire(self):
+        deadline = time.time() + self.timeout
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._stale():
+                    try:
+                        os.remove(self.path)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if time.time() >= deadline:
+                    raise TimeoutError(f"Выход занят другим процессом: {self.path}")
+                time.sleep(self.poll)
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}, f)
+            return
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _file_mode(path: str) -> int:
+    """
+    Права итогового файла: как у существующего выхода, иначе как у open(..., "w") (0666 & ~umask).
+    mkstemp создаёт файл с 0600, и без chmod выходы на общем диске были бы видны только владельцу.
+    """
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_json_atomic(path: str, obj: Any, lock: bool = True):
+    """
+    Пишет obj в path целиком или никак. С lock=True — под блокировкой path.lock.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    def _write():
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(obj, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, _file_mode(path))
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    if lock:
+        with OutputLock(path):
+            _write()
+    else:
+        _write()
+
+
+def copy_atomic(src: str, dst: str):
+    """
+    Копия файла с той же гарантией, что у write_json_atomic.
+    """
+    with open(src, encoding="utf-8") as f:
+        obj = json.load(f)
+    write_json_atomic(dst, obj)
+
+
+# ---------- проверка выходов ----------
+
+def validate_output(path: str) -> Optional[str]:
+    """
+    None, если файл — выход в формате run-скриптов; иначе причина, почему он битый.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            obj = json.load(f)
+    except OSError as e:
+        return f"не читается: {e}"
+    except ValueError as e:
+        return f"не JSON: {e}"
+
+    if not isinstance(obj, dict):
+        return "верхний уровень не объект"
+    results = obj.get("results")
+    if not isinstance(results, list):
+        return "нет списка results"
+    for i, cell in enumerate(results):
+        if not isinstance(cell, dict):
+            return f"results[{i}] не объект"
+        if not isinstance(cell.get("row"), int) or not isinstance(cell.get("col"), int):
+            return f"results[{i}]: нет row/col"
+        if not isinstance(cell.get("entities", []), list):
+            return f"results[{i}]: entities не список"
+    return None
+
+
+def is_valid_output(path: str) -> bool:
+    return validate_output(path) is None
+
+
+def scan_outputs(out_dir: str, pattern: str = "[0-9]*.json") -> List[Tuple[str, str]]:
+    """
+    (путь, причина) для каждого битого выхода в out_dir.
+    """
+    bad = []
+    for path in sorted(glob.glob(os.path.join(out_dir, pattern))):
+        reason = validate_output(path)
+        if reason is not None:
+            bad.append((path, reason))
+    return bad
+
+
+def task_of(path: str) -> Optional[Tuple[str, int]]:
+    """
+    outputs/201_spacy_nel.json → ("spacy_nel", 201)
+    """
+    m = OUTPUT_NAME_RE.match(os.path.basename(path))
+    return (m.group(2), int(m.group(1))) if m else None
+
+
+def clean_stale_tmp(out_dir: str, stale_s: float = 600.0) -> List[str]:
+    """
+    Удаляет временные файлы прерванных записей, которые старше stale_s.
+    """
+    removed = []
+    now = time.time()
+    for path in glob.glob(os.path.join(out_dir, f".*{TMP_SUFFIX}")):
+        try:
+            if now - os.path.getmtime(path) > stale_s:
+                os.remove(path)
+                removed.append(path)
+        except OSError:
+            continue
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка выходных JSON: поиск битых, карантин и возврат в очередь")
+    parser.add_argument("--out_dir", default=DEFAULT_OUT_DIR, help="Папка с выходами")
+    parser.add_argument("--pattern", default="[0-9]*.json", help="Какие файлы проверять (по умолчанию выходы {table_id}_*.json)")
+    parser.add_argument("--quarantine", action="store_true",
+                        help=f"Переименовать битые выходы в *{CORRUPT_SUFFIX}, чтобы их не читали eval_ner / run_nel")
+    parser.add_argument("--queue", default=None,
+                        help="Очередь work_queue.py: вернуть задачи битых выходов ({table_id}_{job}.json)")
+    args = parser.parse_args()
+
+    removed = clean_stale_tmp(args.out_dir)
+    if removed:
+        print(f"[INFO] Удалено временных файлов прерванных записей: {len(removed)}")
+
+    bad = scan_outputs(args.out_dir, args.pattern)
+    if not bad:
+        print(f"[OK] Битых выходов нет: {args.out_dir}")
+        return 0
+
+    queue = None
+    if args.queue:
+        from work_queue import WorkQueue
+        queue = WorkQueue(args.queue)
+
+    requeued = 0
+    for path, reason in bad:
+        print(f"[WARN] {path}: {reason}")
+        if args.quarantine:
+            with OutputLock(path):
+                os.replace(path, path + CORRUPT_SUFFIX)
+        task = task_of(path)
+        if queue is not None and task is not None:
+            if queue.requeue(task[0], task[1], reason=f"битый выход: {reason}"):
+                requeued += 1
+
+    print(f"[WARN] Битых выходов: {len(bad)}"
+          + (f", в карантине: {len(bad)}" if args.quarantine else "")
+          + (f", возвращено в очередь: {requeued}" if queue is not None else ""))
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
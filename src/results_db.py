@@ -0,0 +1,345 @@
+# results_db.py
+# Хранилище результатов: выходы NER/NEL (outputs/*.json) и ручная разметка (data/test_set)
+# загружаются в индексированные таблицы SQLite — одна строка на сущность (system, table_id, row, col,
+# text, label, kb_id). Повторная загрузка перечитывает только изменившиеся файлы.
+# eval_ner.py --db и nel_stats.py --db считают статистику запросами вместо разбора JSON.
+#
+# python src/results_db.py --db .\outputs\results.sqlite
+# python src/results_db.py --sql "SELECT system, COUNT(*) FROM v_entities WHERE label = 'ORG' AND kb_id IS NULL GROUP BY system"
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+from typing import Dict, List, Optional, Set, Tuple
+
+DEFAULT_DB_PATH = r".\outputs\results.sqlite"
+DEFAULT_PRED_DIR = r".\outputs"
+DEFAULT_TEST_SET_DIR = r".\data\test_set"
+
+# система ручной разметки
+GOLD_SYSTEM = "gold"
+
+# {table_id}_{system}.json
+PRED_NAME_RE = re.compile(r"^(\d+)_(.+)\.json$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,            -- pred | gold
+    system TEXT NOT NULL,          -- spacy, gigachat_few_nel, ... | gold
+    table_id INTEGER,
+    table_name TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    cells INTEGER,
+    llm_calls INTEGER,
+    ner_s REAL,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS entities (
+    file_id INTEGER NOT NULL REFERENCES files(file_id) ON DELETE CASCADE,
+    system TEXT NOT NULL,
+    table_id INTEGER,
+    row INTEGER NOT NULL,
+    col INTEGER NOT NULL,
+    cell_text TEXT,
+    text TEXT NOT NULL,
+    norm_text TEXT NOT NULL,
+    label TEXT NOT NULL,
+    kb_id TEXT
+);
+CREATE INDEX IF NOT EXISTS files_system ON files (system, table_id);
+CREATE INDEX IF NOT EXISTS entities_file ON entities (file_id);
+CREATE INDEX IF NOT EXISTS entities_system ON entities (system, table_id, label);
+CREATE INDEX IF NOT EXISTS entities_label ON entities (label);
+CREATE INDEX IF NOT EXISTS entities_kb ON entities (kb_id);
+CREATE VIEW IF NOT EXISTS v_entities AS
+    SELECT e.*, f.kind, f.table_name, f.path FROM entities e JOIN files f USING (file_id);
+"""
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    con = sqlite3.connect(db_path)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA foreign_keys = ON")
+    con.executescript(SCHEMA)
+    return con
+
+
+def system_of(path: str) -> Optional[Tuple[int, str]]:
+    """
+    outputs/201_gigachat_few_nel.json → (201, "gigachat_few_nel")
+    """
+    m = PRED_NAME_RE.match(os.path.basename(path))
+    return (int(m.group(1)), m.group(2)) if m else None
+
+
+def _ingest_file(con: sqlite3.Connection, path: str, kind: str, system: str, table_id: Optional[int]):
+    from eval_ner import llm_calls_of, load_json, norm_text
+
+    st = os.stat(path)
+    obj = load_json(path)
+    meta = obj.get("meta") or {}
+    timing = meta.get("timing") or {}
+
+    cur = con.execute(
+        "INSERT INTO files (path, kind, system, table_id, table_name, size, mtime_ns, cells, llm_calls, ner_s, meta) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            path, kind, system, table_id, obj.get("table_name"), st.st_size, st.st_mtime_ns,
+            len(obj.get("results", [])),
+            llm_calls_of(obj) if kind == "pred" else 0,
+            float(timing["ner_s"]) if timing.get("ner_s") is not None else None,
+            json.dumps(meta, ensure_ascii=False) if meta else None,
+        ),
+    )
+    file_id = cur.lastrowid
+
+    # тот же фильтр неполных записей, что в eval_ner.iter_entities, но с kb_id
+    rows = []
+    for cell in obj.get("results", []):
+        row, col = cell.get("row"), cell.get("col")
+        for ent in cell.get("entities") or []:
+            text, label = ent.get("text"), ent.get("label")
+            if row is None or col is None or text is None or label is None:
+                continue
+            rows.append((file_id, system, table_id, int(row), int(col), cell.get("text"),
+                         str(text), norm_text(str(text)), str(label), ent.get("kb_id")))
+    con.executemany(
+        "INSERT INTO entities (file_id, system, table_id, row, col, cell_text, text, norm_text, label, kb_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def ingest(con: sqlite3.Connection, pred_dir: Optional[str], test_set_dir: Optional[str],
+           verbose: bool = True) -> Dict[str, int]:
+    """
+    Синхронизирует базу с файлами: новые и изменившиеся (размер / mtime) перечитываются,
+    удалённые удаляются, битые пропускаются. Папка None — этот вид файлов (pred / gold) не трогается.
+    Возвращает {"added", "updated", "unchanged", "removed", "invalid"}.
+    """
+    from eval_ner import extract_table_id
+    from output_writer import validate_output
+
+    wanted: Dict[str, Tuple[str, str, Optional[int]]] = {}
+    kinds = []
+    if pred_dir is not None:
+        kinds.append("pred")
+        for path in sorted(glob.glob(os.path.join(pred_dir, "*.json"))):
+            parsed = system_of(path)
+            if parsed is not None:
+                wanted[os.path.abspath(path)] = ("pred", parsed[1], parsed[0])
+    if test_set_dir is not None:
+        kinds.append("gold")
+        for path in sorted(glob.glob(os.path.join(test_set_dir, "*.json"))):
+            wanted[os.path.abspath(path)] = ("gold", GOLD_SYSTEM, extract_table_id(path))
+
+    known = {r["path"]: r for r in con.execute("SELECT file_id, path, size, mtime_ns, kind FROM files")
+             if r["kind"] in kinds}
+    stats = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0, "invalid": 0}
+
+    with con:
+        for path in set(known) - set(wanted):
+            con.execute("DELETE FROM files WHERE file_id = ?", (known[path]["file_id"],))
+            stats["removed"] += 1
+
+        for path, (kind, system, table_id) in wanted.items():
+            st = os.stat(path)
+            old = known.get(path)
+            if old is not None and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                stats["unchanged"] += 1
+                continue
+            if old is not None:
+                con.execute("DELETE FROM files WHERE file_id = ?", (old["file_id"],))
+            reason = validate_output(path)
+            if reason is not None:
+                if verbose:
+                    print(f"[WARN] Пропущен битый файл {path}: {reason}")
+                stats["invalid"] += 1
+                continue
+            _ingest_file(con, path, kind, system, table_id)
+            stats["updated" if old is not None else "added"] += 1
+    return stats
+
+
+# ---------- запросы для eval_ner.py ----------
+
+# C/A/N по меткам для пары файлов: множества (row, col, norm_text, label) как в eval_ner.build_index
+PAIR_SPANS_SQL = """
+    SELECT row, col, norm_text, label, MAX(src = 'p') AS in_p, MAX(src = 'g') AS in_g FROM (
+        SELECT 'p' AS src, row, col, norm_text, COALESCE(m.dst, e.label) AS label
+            FROM entities e LEFT JOIN temp.label_map m ON m.src = e.label WHERE e.file_id = :pred
+        UNION ALL
+        SELECT 'g', row, col, norm_text, COALESCE(m.dst, e.label)
+            FROM entities e LEFT JOIN temp.label_map m ON m.src = e.label WHERE e.file_id = :gold
+    )
+    WHERE label NOT IN (SELECT label FROM temp.exclude_labels)
+    GROUP BY row, col, norm_text, label
+"""
+
+PAIR_COUNTS_SQL = f"""
+SELECT label, SUM(in_p) AS A, SUM(in_g) AS N, SUM(in_p * in_g) AS C FROM ({PAIR_SPANS_SQL})
+GROUP BY label
+"""
+
+# FP (есть только в pred) и FN (только в test)
+PAIR_ERRORS_SQL = f"SELECT * FROM ({PAIR_SPANS_SQL}) WHERE in_p + in_g = 1"
+
+
+def _set_label_filters(con: sqlite3.Connection, label_map: Dict[str, str], exclude_labels: Set[str]):
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS label_map (src TEXT PRIMARY KEY, dst TEXT)")
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS exclude_labels (label TEXT PRIMARY KEY)")
+    con.execute("DELETE FROM temp.label_map")
+    con.execute("DELETE FROM temp.exclude_labels")
+    con.executemany("INSERT INTO temp.label_map VALUES (?, ?)", list(label_map.items()))
+    con.executemany("INSERT INTO temp.exclude_labels VALUES (?)", [(lb,) for lb in exclude_labels])
+
+
+def pair_counts_db(con: sqlite3.Connection, pred_file_id: int, gold_file_id: int) -> Dict:
+    """
+    То же, что eval_ner.pair_counts, но запросом к базе (фильтры меток — _set_label_filters).
+    """
+    per_label: Dict[str, Dict[str, int]] = {}
+    for r in con.execute(PAIR_COUNTS_SQL, {"pred": pred_file_id, "gold": gold_file_id}):
+        per_label[r["label"]] = {"C": r["C"], "A": r["A"], "N": r["N"]}
+    f = con.execute("SELECT cells, llm_calls, ner_s, meta FROM files WHERE file_id = ?", (pred_file_id,)).fetchone()
+    trained = json.loads(f["meta"]).get("model_trained_tables") if f["meta"] else None
+    return {
+        "C": sum(c["C"] for c in per_label.values()),
+        "A": sum(c["A"] for c in per_label.values()),
+        "N": sum(c["N"] for c in per_label.values()),
+        "per_label": per_label,
+        "cells": f["cells"],
+        "llm_calls": f["llm_calls"],
+        "ner_s": f["ner_s"],
+        **({"model_trained_tables": trained} if trained is not None else {}),
+    }
+
+
+def pair_errors_db(con: sqlite3.Connection, pred_file_id: int, gold_file_id: int) -> Dict[str, List]:
+    """
+    eval_ner.pair_errors по тем же множествам, что PAIR_COUNTS_SQL.
+    """
+    from eval_ner import pair_errors
+
+    fp, fn = [], []
+    for r in con.execute(PAIR_ERRORS_SQL, {"pred": pred_file_id, "gold": gold_file_id}):
+        (fp if r["in_p"] else fn).append((r["row"], r["col"], r["norm_text"], r["label"]))
+    return pair_errors(fp, fn)
+
+
+def evaluation_pairs(con: sqlite3.Connection, system: str, min_id: Optional[int], max_id: Optional[int],
+                     label_map: Dict[str, str], exclude_labels: Set[str], strict_test_id: bool,
+                     errors: bool = False) -> Tuple[List[Tuple[int, str, str, Dict]], Dict[str, int]]:
+    """
+    Пары (table_id, pred_file, test_file, counts) для системы + счётчики пропусков —
+    вход для eval_ner.build_report.
+    """
+    gold_by_id: Dict[int, sqlite3.Row] = {}
+    for r in con.execute("SELECT file_id, path, table_id FROM files WHERE kind = 'gold' ORDER BY path"):
+        tid = r["table_id"]
+        if tid is None or (min_id is not None and tid < min_id) or (max_id is not None and tid > max_id):
+            continue
+        if strict_test_id and tid in gold_by_id:
+            raise RuntimeError(f"В test_set несколько файлов с table_id={tid}: "
+                               f"'{gold_by_id[tid]['path']}' и '{r['path']}'")
+        gold_by_id[tid] = r
+
+    _set_label_filters(con, label_map, exclude_labels)
+    pairs = []
+    skipped = {"pred_out_of_range": 0, "pred_without_test": 0}
+    for r in con.execute("SELECT file_id, path, table_id FROM files WHERE kind = 'pred' AND system = ? ORDER BY path",
+                         (system,)).fetchall():
+        tid = r["table_id"]
+        if (min_id is not None and tid < min_id) or (max_id is not None and tid > max_id):
+            skipped["pred_out_of_range"] += 1
+            continue
+        gold = gold_by_id.get(tid)
+        if gold is None:
+            skipped["pred_without_test"] += 1
+            continue
+        counts = pair_counts_db(con, r["file_id"], gold["file_id"])
+        if errors:
+            counts["errors"] = pair_errors_db(con, r["file_id"], gold["file_id"])
+        pairs.append((tid, os.path.basename(r["path"]), os.path.basename(gold["path"]), counts))
+    return pairs, skipped
+
+
+# ---------- запросы для nel_stats.py ----------
+
+# счётчики nel_stats.file_stats по (система, таблица, метка): ключи как в eval_ner.build_link_index,
+# связь сверяется с kb_id ручной разметки той же таблицы (при нескольких файлах — последний по пути)
+NEL_LINK_COUNTS_SQL = r"""
+WITH p AS (
+    SELECT e.system, e.table_id, e.row, e.col, e.norm_text, COALESCE(m.dst, e.label) AS label,
+           MAX(NULLIF(e.kb_id, '')) AS kb_id
+    FROM entities e LEFT JOIN temp.label_map m ON m.src = e.label
+    WHERE e.system LIKE '%\_nel' ESCAPE '\'
+    GROUP BY e.system, e.table_id, e.row, e.col, e.norm_text, 6
+), g AS (
+    SELECT e.table_id, e.row, e.col, e.norm_text, COALESCE(m.dst, e.label) AS label,
+           MAX(NULLIF(e.kb_id, '')) AS kb_id
+    FROM entities e LEFT JOIN temp.label_map m ON m.src = e.label
+    WHERE e.file_id IN (SELECT f.file_id FROM files f WHERE f.kind = 'gold' AND f.path =
+                        (SELECT MAX(f2.path) FROM files f2 WHERE f2.kind = 'gold' AND f2.table_id = f.table_id))
+    GROUP BY e.table_id, e.row, e.col, e.norm_text, 5
+)
+SELECT substr(p.system, 1, length(p.system) - 4) AS system, p.table_id, p.label,
+       COUNT(*) AS total,
+       COUNT(p.kb_id) AS linked,
+       COUNT(g.kb_id) AS gold,
+       COUNT(CASE WHEN p.kb_id IS NOT NULL AND g.kb_id IS NOT NULL THEN 1 END) AS checked,
+       COUNT(CASE WHEN p.kb_id = g.kb_id THEN 1 END) AS correct
+FROM p LEFT JOIN g USING (table_id, row, col, norm_text, label)
+WHERE p.label NOT IN (SELECT label FROM temp.exclude_labels)
+GROUP BY p.system, p.table_id, p.label
+ORDER BY p.system, p.table_id, p.label
+"""
+
+
+def nel_link_counts(con: sqlite3.Connection, label_map: Dict[str, str],
+                    exclude_labels: Set[str]) -> List[sqlite3.Row]:
+    """
+    Покрытие и точность связывания систем *_nel по таблицам и меткам (вход для nel_stats.build_nel_report).
+    """
+    _set_label_filters(con, label_map, exclude_labels)
+    return con.execute(NEL_LINK_COUNTS_SQL).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка выходов NER/NEL и test_set в SQLite и запросы к ним")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Файл базы (SQLite)")
+    parser.add_argument("--pred_dir", default=DEFAULT_PRED_DIR, help="Папка с выходами {table_id}_{system}.json")
+    parser.add_argument("--test_set_dir", default=DEFAULT_TEST_SET_DIR, help="Папка с test_set (JSON)")
+    parser.add_argument("--no_ingest", action="store_true", help="Не синхронизировать базу с файлами")
+    parser.add_argument("--sql", default=None, help="Выполнить запрос и напечатать результат (таблицы files, "
+                                                    "entities, представление v_entities)")
+    args = parser.parse_args()
+
+    con = connect(args.db)
+    if not args.no_ingest:
+        st = ingest(con, args.pred_dir, args.test_set_dir)
+        n = con.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+        print(f"[OK] {args.db}: новых {st['added']}, обновлено {st['updated']}, без изменений {st['unchanged']}, "
+              f"удалено {st['removed']}; сущностей {n}")
+
+    if args.sql:
+        cur = con.execute(args.sql)
+        cols = [d[0] for d in cur.description or []]
+        if cols:
+            print("\t".join(cols))
+        for r in cur:
+            print("\t".join("" if v is None else str(v) for v in r))
+    con.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
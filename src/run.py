@@ -1,15 +1,17 @@
 # run.py
 import argparse
-import json
 import os
+import time
 
 from table_load import RF200TableLoader
 from ner_spacy import SpacyNER
+from ner_common import build_results, parse_drop_first_col
+from output_writer import write_json_atomic
 
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Запуск spaCy NER для таблиц RF-200 (CSV → JSON)"
+        description="Запуск spaCy NER (или каскада spaCy → GigaChat) для таблиц RF-200 (CSV → JSON)"
     )
 
     # --- обязательные аргументы ---
@@ -18,8 +20,42 @@ def main():
     parser.add_argument("--out", required=True, help="Путь к выходному JSON-файлу")
 
     # --- опциональные аргументы ---
-    parser.add_argument("--model", default="ru_core_news_lg", help="spaCy модель (по умолчанию ru_core_news_lg)")
+    parser.add_argument("--backend", choices=["spacy", "cascade", "gazetteer"], default="spacy",
+                        help="spacy | cascade (spaCy + правила, сложные ячейки → GigaChat) | "
+                             "gazetteer (правила + словарь форм, см. build_gazetteer.py)")
+    parser.add_argument("--gazetteer", default=None,
+                        help="Путь к газеттиру для --backend gazetteer (по умолчанию models/gazetteer.pkl)")
+    parser.add_argument("--model", default="ru_core_news_lg",
+                        help="spaCy модель (по умолчанию ru_core_news_lg; sm/md/lg — ru_core_news_*; "
+                             "full — обученная train_spacy_ner.py, 17 меток)")
+    parser.add_argument("--spacy_profile", choices=["full", "ner"], default="full",
+                        help="full — все компоненты модели | ner — только NER (без теггера, парсера, лемматизатора)")
+    parser.add_argument("--batch_chars", type=int, default=4000,
+                        help="Бюджет символов на батч spaCy (ячейки группируются по длине)")
     parser.add_argument("--quiet", action="store_true", help="Отключить вывод в консоль")
+    parser.add_argument("--fast_path", action="store_true",
+                        help="Размечать числа/даты/проценты/деньги/время регулярками без вызова модели")
+    parser.add_argument("--column_routing", action="store_true",
+                        help="Профилировать столбцы: числовые размечать правилом, столбцы сущностей — по выборке")
+    parser.add_argument("--column_sample", type=int, default=8, help="Размер выборки ячеек на столбец")
+    parser.add_argument("--column_agreement", type=float, default=0.8,
+                        help="Доля выборки с одной и той же меткой на всю ячейку, чтобы разметить весь столбец")
+    parser.add_argument("--column_prior_agreement", type=float, default=0.6,
+                        help="Та же доля, если метка совпадает с типом столбца по заголовку (Имя → PER, Город → LOC)")
+    parser.add_argument("--server", default=None,
+                        help="URL запущенного ner_server.py (например http://127.0.0.1:8765) — "
+                             "тогда модель локально не загружается")
+
+    # --- каскад spaCy → GigaChat ---
+    parser.add_argument("--llm_mode", choices=["zero", "few"], default="few", help="Режим промпта GigaChat в каскаде")
+    parser.add_argument("--escalate_empty", choices=["true", "false"], default="true",
+                        help="Эскалировать ячейки, где spaCy ничего не нашёл")
+    parser.add_argument("--min_coverage", type=float, default=0.5,
+                        help="Эскалировать, если сущности spaCy покрывают меньшую долю текста ячейки")
+    parser.add_argument("--escalate_column_type", choices=["true", "false"], default="true",
+                        help="Эскалировать ячейки столбцов, которым нужны метки вне PER/LOC/ORG")
+    parser.add_argument("--max_escalation_share", type=float, default=1.0,
+                        help="Максимальная доля ячеек таблицы, отправляемых в GigaChat")
 
     # --- управление предобработкой таблицы ---
     parser.add_argument("--drop_first_col", choices=["auto", "true", "false"], default="auto",
@@ -33,13 +69,13 @@ def main():
 
     args = parser.parse_args()
 
+    if args.backend == "cascade" and (args.fast_path or args.column_routing):
+        parser.error("--backend cascade уже включает правила и профили столбцов")
+    if args.backend == "gazetteer" and args.server:
+        parser.error("--backend gazetteer работает локально, --server не нужен")
+
     # --- преобразование аргументов ---
-    if args.drop_first_col == "true":
-        drop_first_col = True
-    elif args.drop_first_col == "false":
-        drop_first_col = False
-    else:
-        drop_first_col = None  # auto
+    drop_first_col = parse_drop_first_col(args.drop_first_col)
 
     drop_header = args.drop_header == "true"
     index_base = int(args.index_base)  # 0 или 1
@@ -50,7 +86,7 @@ def main():
         verbose=not args.quiet
     )
 
-    cells = loader.load_table(
+    headers, cells = loader.load_table_with_header(
         table_id=args.table_id,
         drop_first_col=drop_first_col,
         drop_header=drop_header
@@ -60,48 +96,92 @@ def main():
         print("[ERROR] Таблица не загружена или пуста")
         return
 
-    # --- инициализация spaCy ---
-    ner = SpacyNER(model_name=args.model)
+    # --- инициализация spaCy (или клиент к тёплому серверу, или газеттир) ---
+    if args.backend == "gazetteer":
+        from ner_gazetteer import DEFAULT_GAZETTEER_PATH, GazetteerNER
+        gazetteer_path = args.gazetteer or DEFAULT_GAZETTEER_PATH
+        if not os.path.exists(gazetteer_path):
+            print(f"[ERROR] Газеттир не найден: {gazetteer_path} (соберите: python src/build_gazetteer.py)")
+            return
+        ner = GazetteerNER(gazetteer_path)
+    elif args.server:
+        from ner_server import NERClient
+        ner = NERClient(args.server, backend="spacy")
+    else:
+        ner = SpacyNER(model_name=args.model, profile=args.spacy_profile, batch_chars=args.batch_chars)
+
+    # таблицы, на которых обучалась модель (train_spacy_ner.py) — для проверки в eval_ner.py;
+    # берутся до обёртки FastPathNER, у которой этого свойства нет
+    trained_tables = getattr(ner, "trained_tables", None)
+
+    if args.fast_path:
+        from fast_path import FastPathNER
+        ner = FastPathNER(ner)
+
+    cascade = None
+    if args.backend == "cascade":
+        from ner_cascade import CascadeNER
+        from ner_gigachat import GigaChatNER
+        cascade = CascadeNER(
+            ner,
+            GigaChatNER(mode=args.llm_mode),
+            escalate_empty=args.escalate_empty == "true",
+            min_coverage=args.min_coverage,
+            escalate_column_type=args.escalate_column_type == "true",
+            max_escalation_share=args.max_escalation_share,
+        )
+
+    router = None
+    if args.column_routing:
+        from column_profile import ColumnProfiler, ColumnRouter
+        router = ColumnRouter(ner, ColumnProfiler(sample_size=args.column_sample), agreement=args.column_agreement,
+                              prior_agreement=args.column_prior_agreement)
 
     # --- NER для всех ячеек ---
-    results = []
-    for cell in cells:
-        entities = ner.extract_entities(cell["text"])
-        entities_clean = [{"text": e["text"], "label": e["label"]} for e in entities]
-
-        r = int(cell["row"])
-        c = int(cell["col"])
-
-        # если хотим 1-based — сдвигаем
-        if index_base == 1:
-            r += 1
-            c += 1
-
-        results.append({
-            "row": r,
-            "col": c,
-            "text": cell["text"],
-            "entities": entities_clean
-        })
+    t0 = time.perf_counter()
+    if cascade is not None:
+        entities_per_cell = cascade.extract_table(cells, headers)
+    elif router is not None:
+        entities_per_cell = router.extract_table(cells, headers)
+    else:
+        entities_per_cell = ner.extract_entities_batch([cell["text"] for cell in cells])
+    ner_s = time.perf_counter() - t0
+    results = build_results(cells, entities_per_cell, index_base)
 
     table_file = loader._find_table_file(args.table_id)
     output_obj = {
         "table_name": os.path.basename(table_file) if table_file else f"{args.table_id}.csv",
-        "method": "spacy",
+        "method": args.backend,
         "meta": {
             "drop_header": drop_header,
             "drop_first_col": drop_first_col,
             "index_base": index_base,
+            "model": args.model,
+            "spacy_profile": args.spacy_profile,
+            **({"model_trained_tables": trained_tables} if trained_tables is not None else {}),
+            "timing": {"ner_s": round(ner_s, 3), "cells_per_s": round(len(cells) / ner_s, 1) if ner_s > 0 else None},
+            **({"server": args.server} if args.server else {}),
+            **({"fast_path": ner.stats()} if args.fast_path else {}),
+            **({"column_routing": router.stats()} if router is not None else {}),
+            **({"llm_calls": cascade.llm_calls, "cascade": cascade.stats(),
+                "tokens": cascade.llm_ner.tokens.summary()} if cascade is not None else {}),
         },
         "results": results
     }
 
-    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(output_obj, f, ensure_ascii=False, indent=2)
+    write_json_atomic(args.out, output_obj)
 
     if not args.quiet:
         print(f"[OK] Ячеек обработано: {len(results)}")
+        if args.fast_path:
+            st = ner.stats()
+            print(f"[OK] fast path: вызовов модели {st['model_calls']}, сэкономлено {st['model_calls_avoided']}")
+        if router is not None:
+            st = router.stats()
+            print(f"[OK] column routing: вызовов модели {st['model_calls']}, сэкономлено {st['model_calls_avoided']}")
+        if cascade is not None:
+            st = cascade.stats()
+            print(f"[OK] cascade: запросов к GigaChat {st['llm_calls']}, сэкономлено {st['llm_calls_saved']}")
         print(f"[OK] Результат сохранён: {args.out}")
 
 
@@ -1,9 +1,11 @@
 import argparse
-import json
 import os
+import time
 
 from table_load import RF200TableLoader
 from ner_gigachat import GigaChatNER
+from ner_common import build_results, parse_drop_first_col
+from output_writer import write_json_atomic
 
 
 def main():
@@ -20,6 +22,40 @@ def main():
     parser.add_argument("--mode", choices=["zero", "few"], default="zero", help="Режим промпта: zero | few")
     parser.add_argument("--credentials", default=None, help="API key (если не задан GIGACHAT_API_KEY)")
     parser.add_argument("--quiet", action="store_true", help="Отключить вывод в консоль")
+    parser.add_argument("--fast_path", action="store_true",
+                        help="Размечать числа/даты/проценты/деньги/время регулярками без вызова модели")
+    parser.add_argument("--column_routing", action="store_true",
+                        help="Профилировать столбцы: числовые размечать правилом, столбцы сущностей — по выборке")
+    parser.add_argument("--column_sample", type=int, default=8, help="Размер выборки ячеек на столбец")
+    parser.add_argument("--column_agreement", type=float, default=0.8,
+                        help="Доля выборки с одной и той же меткой на всю ячейку, чтобы разметить весь столбец")
+    parser.add_argument("--column_prior_agreement", type=float, default=0.6,
+                        help="Та же доля, если метка совпадает с типом столбца по заголовку (Имя → PER, Город → LOC)")
+
+    parser.add_argument("--table_mode", action="store_true",
+                        help="Табличный режим: в промпт идут заголовки и целые строки, один запрос на блок строк")
+    parser.add_argument("--rows_per_call", type=int, default=1, help="Сколько строк таблицы в одном запросе (--table_mode)")
+
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Параллельные запросы к GigaChat с адаптивным (AIMD) лимитом")
+    parser.add_argument("--max_concurrency", type=int, default=8, help="Верхняя граница лимита для --adaptive")
+    parser.add_argument("--token_log", default=None,
+                        help="Сохранить токены каждого вызова [prompt, completion] в отдельный JSON "
+                             "(в meta.tokens выхода — только итоги)")
+
+    # динамические few-shot примеры
+    parser.add_argument("--fewshot_index", default=None,
+                        help="Кэш индекса примеров (например models/fewshot_index.pkl): в режиме few "
+                             "подбирать k похожих размеченных ячеек вместо фиксированных примеров")
+    parser.add_argument("--fewshot_gold_dir", default=r".\data\test_set", help="Размеченные таблицы для индекса примеров")
+    parser.add_argument("--fewshot_k", type=int, default=8, help="Сколько примеров класть в промпт")
+
+    # запись / воспроизведение ответов GigaChat
+    parser.add_argument("--cassette", default=None, help="Файл-кассета с ответами GigaChat (JSON Lines)")
+    parser.add_argument("--cassette_mode", choices=["record", "replay", "auto"], default="replay",
+                        help="record — живые запросы с записью | replay — только кассета | auto — кассета, иначе запрос")
+    parser.add_argument("--replay_latency_ms", type=float, default=None,
+                        help="Имитируемая задержка ответа при воспроизведении (по умолчанию — записанная)")
 
     # предобработка таблицы
     parser.add_argument("--drop_first_col", choices=["auto", "true", "false"], default="auto",
@@ -33,20 +69,20 @@ def main():
 
     args = parser.parse_args()
 
+    if args.table_mode and args.column_routing:
+        parser.error("--table_mode и --column_routing нельзя использовать вместе")
+    if args.rows_per_call < 1:
+        parser.error("--rows_per_call должен быть >= 1")
+
     # аргументы → bool/None
-    if args.drop_first_col == "true":
-        drop_first_col = True
-    elif args.drop_first_col == "false":
-        drop_first_col = False
-    else:
-        drop_first_col = None
+    drop_first_col = parse_drop_first_col(args.drop_first_col)
 
     drop_header = args.drop_header == "true"
     index_base = int(args.index_base)
 
     # загрузка
     loader = RF200TableLoader(tables_dir=args.tables_dir, verbose=not args.quiet)
-    cells = loader.load_table(
+    headers, cells = loader.load_table_with_header(
         table_id=args.table_id,
         drop_first_col=drop_first_col,
         drop_header=drop_header
@@ -56,25 +92,50 @@ def main():
         return
 
     # gigachat ner
-    ner = GigaChatNER(mode=args.mode)
-
-    results = []
-    for cell in cells:
-        entities = ner.extract_entities(cell["text"])
-        entities_clean = [{"text": e["text"], "label": e["label"]} for e in entities]
-
-        r = int(cell["row"])
-        c = int(cell["col"])
-        if index_base == 1:
-            r += 1
-            c += 1
-
-        results.append({
-            "row": r,
-            "col": c,
-            "text": cell["text"],
-            "entities": entities_clean
-        })
+    controller = None
+    if args.adaptive:
+        from aimd import AIMDController
+        controller = AIMDController(name="gigachat", max_limit=args.max_concurrency)
+
+    cassette = None
+    if args.cassette:
+        from cassette import Cassette
+        cassette = Cassette(args.cassette, mode=args.cassette_mode, latency_ms=args.replay_latency_ms)
+
+    fewshot = None
+    if args.fewshot_index and args.mode == "few":
+        from fewshot_index import FewShotIndex
+        fewshot = FewShotIndex.load_or_build(args.fewshot_index, args.fewshot_gold_dir, verbose=not args.quiet)
+
+    giga = GigaChatNER(
+        mode=args.mode,
+        controller=controller,
+        credentials=args.credentials,
+        cassette=cassette,
+        fewshot=fewshot,
+        fewshot_k=args.fewshot_k,
+        fewshot_exclude_table=args.table_id,  # без подсказок из размечаемой таблицы
+    )
+    ner = giga
+    if args.fast_path:
+        from fast_path import FastPathNER
+        ner = FastPathNER(ner)
+
+    router = None
+    if args.column_routing:
+        from column_profile import ColumnProfiler, ColumnRouter
+        router = ColumnRouter(ner, ColumnProfiler(sample_size=args.column_sample), agreement=args.column_agreement,
+                              prior_agreement=args.column_prior_agreement)
+
+    t0 = time.perf_counter()
+    if args.table_mode:
+        entities_per_cell = ner.extract_table(cells, headers, rows_per_call=args.rows_per_call)
+    elif router is not None:
+        entities_per_cell = router.extract_table(cells, headers)
+    else:
+        entities_per_cell = ner.extract_entities_batch([cell["text"] for cell in cells])
+    ner_s = time.perf_counter() - t0
+    results = build_results(cells, entities_per_cell, index_base)
 
     table_file = loader._find_table_file(args.table_id)
     output_obj = {
@@ -85,16 +146,43 @@ def main():
             "drop_first_col": drop_first_col,
             "index_base": index_base,
             "mode": args.mode,
+            "llm_calls": giga.calls,
+            "timing": {"ner_s": round(ner_s, 3), "cells_per_s": round(len(cells) / ner_s, 1) if ner_s > 0 else None},
+            "tokens": giga.tokens.summary(),
+            **({"failed": [{"item": k, "error": e} for k, e in giga.failed]} if giga.failed else {}),
+            **({"fast_path": ner.stats()} if args.fast_path else {}),
+            **({"column_routing": router.stats()} if router is not None else {}),
+            **({"table_mode": {"rows_per_call": args.rows_per_call}} if args.table_mode else {}),
+            **({"concurrency": controller.stats()} if controller is not None else {}),
+            **({"cassette": cassette.summary()} if cassette is not None else {}),
+            **({"fewshot": {"index": args.fewshot_index, "examples": len(fewshot), "k": args.fewshot_k}}
+               if fewshot is not None else {}),
         },
         "results": results
     }
 
-    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(output_obj, f, ensure_ascii=False, indent=2)
+    write_json_atomic(args.out, output_obj)
+    if args.token_log:
+        write_json_atomic(args.token_log, {"out": args.out, **giga.tokens.summary(per_call=True)})
+
+    if giga.failed:
+        print(f"[WARN] Без ответа GigaChat после повторов: {len(giga.failed)} (ячеек / блоков строк), "
+              f"сущности для них пустые — см. meta.failed")
 
     if not args.quiet:
-        print(f"[OK] Ячеек обработано: {len(results)}")
+        tokens = giga.tokens.summary()
+        print(f"[OK] Ячеек обработано: {len(results)}, запросов к GigaChat: {giga.calls}, "
+              f"токенов: {tokens['total_tokens']} (оценка для {tokens['estimated_calls']} вызовов)")
+        if controller is not None:
+            st = controller.stats()
+            print(f"[OK] AIMD: лимит {st['limit']} (макс. {st['max_limit_seen']}), "
+                  f"{st['throughput_rps']} запр/с, откатов {st['backoffs']}")
+        if args.fast_path:
+            st = ner.stats()
+            print(f"[OK] fast path: вызовов модели {st['model_calls']}, сэкономлено {st['model_calls_avoided']}")
+        if router is not None:
+            st = router.stats()
+            print(f"[OK] column routing: вызовов модели {st['model_calls']}, сэкономлено {st['model_calls_avoided']}")
         print(f"[OK] Результат сохранён: {args.out}")
 
 
@@ -1,9 +1,12 @@
 import argparse
 import json
-import os
-from typing import Any, Dict, Tuple
+import sys
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
 
-from nel_wikidata import EntityLinker, is_russian
+from column_profile import sample_indices
+from nel_wikidata import ENTITY_URI_PREFIX, WIKIDATA_API_URL, EntityLinker, is_russian
+from output_writer import validate_output, write_json_atomic
 
 LINK_LABELS = {"LOC", "GPE", "PER", "PERSON", "ORG", "ORGANIZATION"}
 
@@ -14,38 +17,184 @@ def load_json(path: str) -> Dict[str, Any]:
 
 
 def save_json(path: str, obj: Dict[str, Any]):
-    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+    write_json_atomic(path, obj)
+
+
+def link_entities(entities: List[Dict[str, Any]], linker: EntityLinker) -> Tuple[int, int, int]:
+    """
+    Проставляет kb_id сущностям одной ячейки. Возвращает (linked, attempted, total).
+    """
+    linked = 0
+    attempted = 0
+    total = 0
+
+    for ent in entities:
+        total += 1
+        label = (ent.get("label") or "").upper()
+        text = (ent.get("text") or "").strip()
+
+        if label not in LINK_LABELS:
+            ent["kb_id"] = None
+            continue
+
+        if not is_russian(text):
+            ent["kb_id"] = None
+            continue
+
+        attempted += 1
+        kb_id = linker.search_wikidata(text)
+        ent["kb_id"] = kb_id
+        if kb_id:
+            linked += 1
+
+    return linked, attempted, total
 
 
 def add_nel(obj: Dict[str, Any], linker: EntityLinker) -> Tuple[int, int, int]:
+    if linker.controller is not None:
+        # все уникальные запросы — параллельно, дальше проход по ячейкам идёт из кэша
+        targets, _ = link_targets(obj)
+        linker.prefetch(text for _, _, text, _ in targets)
+
     linked = 0
     attempted = 0
     total = 0
 
     for cell in obj.get("results", []):
-        entities = cell.get("entities") or []
-        for ent in entities:
+        l, a, t = link_entities(cell.get("entities") or [], linker)
+        linked += l
+        attempted += a
+        total += t
+
+    return linked, attempted, total
+
+
+def link_targets(obj: Dict[str, Any]) -> Tuple[List[Tuple[Dict[str, Any], str, str, Any]], int]:
+    """
+    Сущности, которые имеет смысл связывать: (ent, label, text, col). Остальным сразу ставится kb_id=None.
+    """
+    targets = []
+    total = 0
+    for cell in obj.get("results", []):
+        for ent in cell.get("entities") or []:
             total += 1
             label = (ent.get("label") or "").upper()
             text = (ent.get("text") or "").strip()
-
-            if label not in LINK_LABELS:
+            if label not in LINK_LABELS or not is_russian(text):
                 ent["kb_id"] = None
                 continue
+            targets.append((ent, label, text, cell.get("col")))
+    return targets, total
+
+
+def add_nel_verified(
+    obj: Dict[str, Any],
+    linker: EntityLinker,
+    type_depth: int = 1,
+    fallback_first: bool = False,
+) -> Tuple[int, int, int]:
+    """
+    NEL с проверкой типов: кандидаты (--limit) для всех сущностей файла,
+    затем P31/P279 всех кандидатов пакетами wbgetentities, затем выбор первого
+    кандидата, чей тип подходит к метке NER.
+    """
+    targets, total = link_targets(obj)
+
+    candidates = linker.search_candidates_many(text for _, _, text, _ in targets)
+    all_qids = [q for qids in candidates.values() for q in qids]
+    types = linker.expanded_types(all_qids, depth=type_depth)
 
-            if not is_russian(text):
+    linked = 0
+    for ent, label, text, _ in targets:
+        kb_id = linker.pick_verified(label, candidates[text], types, fallback_first=fallback_first)
+        ent["kb_id"] = kb_id
+        if kb_id:
+            linked += 1
+
+    return linked, len(targets), total
+
+
+def dominant_type(qids: List[str], direct_types: Dict[str, set], agreement: float) -> Optional[str]:
+    """
+    Самый частый класс среди связанных сущностей выборки, если он есть хотя бы у agreement из них.
+    """
+    counts: Counter = Counter(t for q in qids for t in direct_types.get(q, set()))
+    if not counts:
+        return None
+    type_qid, cnt = counts.most_common(1)[0]
+    return type_qid if cnt / len(qids) >= agreement else None
+
+
+def add_nel_columns(
+    obj: Dict[str, Any],
+    linker: EntityLinker,
+    sample_size: int = 8,
+    agreement: float = 0.6,
+    type_depth: int = 1,
+) -> Tuple[int, int, int, List[Dict[str, Any]]]:
+    """
+    NEL по столбцам: ячейки одного столбца RF200 (например, "Административный центр") однотипны.
+      1) выборка уникальных значений столбца связывается с проверкой типа по метке NER;
+      2) если в выборке ничего не связалось — столбец пропускается целиком (без запросов);
+      3) иначе доминирующий класс выборки (P31/P279) ограничивает и ранжирует кандидатов
+         для остальных значений; без доминирующего класса — обычная проверка по метке.
+    """
+    targets, total = link_targets(obj)
+
+    by_col: Dict[Any, List[Tuple[Dict[str, Any], str, str]]] = defaultdict(list)
+    for ent, label, text, col in targets:
+        by_col[col].append((ent, label, text))
+
+    linked = 0
+    attempted = 0
+    columns: List[Dict[str, Any]] = []
+
+    for col, items in by_col.items():
+        # уникальные (текст, метка) в порядке появления
+        values = list(dict.fromkeys((text, label) for _, label, text in items))
+        sample = [values[i] for i in sample_indices(len(values), sample_size)]
+
+        cands = linker.search_candidates_many(text for text, _ in sample)
+        types = linker.expanded_types([q for qids in cands.values() for q in qids], depth=type_depth)
+        picked = {
+            (text, label): linker.pick_verified(label, cands[text], types)
+            for text, label in sample
+        }
+        sample_qids = [uri[len(ENTITY_URI_PREFIX):] for uri in picked.values() if uri]
+
+        info = {"col": col, "values": len(values), "sample": len(sample), "sample_linked": len(sample_qids)}
+        columns.append(info)
+
+        if not sample_qids:
+            info["skipped"] = True
+            for ent, label, text in items:
                 ent["kb_id"] = None
+                if (text, label) in picked:
+                    attempted += 1
+            continue
+
+        col_type = dominant_type(sample_qids, linker.fetch_types(sample_qids), agreement)
+        info["type"] = col_type
+
+        rest = [(text, label) for text, label in values if (text, label) not in picked]
+        cands.update(linker.search_candidates_many(text for text, _ in rest))
+        types.update(linker.expanded_types([q for text, _ in rest for q in cands[text]], depth=type_depth))
+        attempted += len(items)
+
+        for text, label in rest:
+            if col_type is None:
+                picked[(text, label)] = linker.pick_verified(label, cands[text], types)
                 continue
+            # ограничение: только кандидаты доминирующего класса, в порядке ранжирования поиска
+            fit = [q for q in cands[text] if col_type in types.get(q, set())]
+            picked[(text, label)] = linker.pick_verified(label, fit, types, fallback_first=True)
 
-            attempted += 1
-            kb_id = linker.search_wikidata(text)
-            ent["kb_id"] = kb_id
-            if kb_id:
+        for ent, label, text in items:
+            ent["kb_id"] = picked.get((text, label))
+            if ent["kb_id"]:
                 linked += 1
 
-    return linked, attempted, total
+    return linked, attempted, total, columns
 
 
 def main():
@@ -54,13 +203,67 @@ def main():
     p.add_argument("--out", required=True, help="выходной JSON (NER+NEL)")
     p.add_argument("--limit", type=int, default=1, help="сколько кандидатов брать из Wikidata")
     p.add_argument("--sleep", type=float, default=0.05, help="пауза между запросами (сек)")
+    p.add_argument("--index", default=None, help="офлайн-индекс Wikidata (SQLite, см. build_wikidata_index.py)")
+    p.add_argument("--offline", action="store_true", help="не обращаться к wikidata.org, только офлайн-индекс")
+    p.add_argument("--verify_types", action="store_true",
+                   help="проверять тип кандидатов (P31/P279) по метке NER, пакетами wbgetentities")
+    p.add_argument("--type_depth", type=int, default=1, help="сколько уровней надклассов (P279) учитывать")
+    p.add_argument("--verify_fallback", choices=["none", "first"], default="none",
+                   help="если ни один кандидат не подошёл по типу: none — не связывать, first — первый кандидат")
+    p.add_argument("--column_nel", action="store_true",
+                   help="NEL по столбцам: выборка → доминирующий тип столбца → остальные значения")
+    p.add_argument("--column_sample", type=int, default=8, help="размер выборки значений столбца")
+    p.add_argument("--column_agreement", type=float, default=0.6,
+                   help="доля связанных значений выборки с общим классом, чтобы считать его типом столбца")
+    p.add_argument("--adaptive", action="store_true",
+                   help="параллельные запросы с адаптивным (AIMD) лимитом вместо фиксированной паузы --sleep")
+    p.add_argument("--max_concurrency", type=int, default=16, help="верхняя граница лимита для --adaptive")
+    p.add_argument("--cassette", default=None, help="файл-кассета с ответами Wikidata API (JSON Lines)")
+    p.add_argument("--cassette_mode", choices=["record", "replay", "auto"], default="replay",
+                   help="record — живые запросы с записью | replay — только кассета | auto — кассета, иначе запрос")
+    p.add_argument("--replay_latency_ms", type=float, default=None,
+                   help="имитируемая задержка ответа при воспроизведении (по умолчанию — записанная)")
+    p.add_argument("--api_url", default=WIKIDATA_API_URL, help="URL Wikidata API (например, локальный mock)")
     p.add_argument("--quiet", action="store_true")
     args = p.parse_args()
 
+    if args.offline and not args.index:
+        p.error("--offline требует --index")
+
+    reason = validate_output(args.in_ner)
+    if reason is not None:
+        print(f"[ERROR] Входной JSON не годится ({args.in_ner}): {reason}")
+        sys.exit(1)
     obj = load_json(args.in_ner)
 
-    linker = EntityLinker(limit=args.limit, sleep_s=args.sleep)
-    linked, attempted, total = add_nel(obj, linker)
+    controller = None
+    if args.adaptive:
+        from aimd import AIMDController
+        controller = AIMDController(name="wikidata", max_limit=args.max_concurrency)
+
+    cassette = None
+    if args.cassette:
+        from cassette import Cassette
+        cassette = Cassette(args.cassette, mode=args.cassette_mode, latency_ms=args.replay_latency_ms)
+
+    try:
+        linker = EntityLinker(limit=args.limit, sleep_s=args.sleep, index_path=args.index,
+                              offline_only=args.offline, api_url=args.api_url,
+                              controller=controller, cassette=cassette)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    columns = None
+    if args.column_nel:
+        linked, attempted, total, columns = add_nel_columns(
+            obj, linker, sample_size=args.column_sample, agreement=args.column_agreement,
+            type_depth=args.type_depth,
+        )
+    elif args.verify_types:
+        linked, attempted, total = add_nel_verified(obj, linker, type_depth=args.type_depth,
+                                                    fallback_first=args.verify_fallback == "first")
+    else:
+        linked, attempted, total = add_nel(obj, linker)
 
     obj["nel"] = {
         "kb": "wikidata",
@@ -68,10 +271,25 @@ def main():
         "attempted": attempted,
         "total": total,
         "limit": args.limit,
+        "index": args.index,
+        "offline_hits": linker.stats["offline_hits"],
+        "online_requests": linker.stats["online_requests"],
+        "verify_types": args.verify_types,
+        "type_requests": linker.stats["type_requests"],
+        "type_errors": linker.stats["type_errors"],
     }
+    if columns is not None:
+        obj["nel"]["columns"] = columns
+    if controller is not None:
+        obj["nel"]["concurrency"] = controller.stats()
+    if cassette is not None:
+        obj["nel"]["cassette"] = cassette.summary()
 
     save_json(args.out, obj)
 
+    if linker.stats["type_errors"]:
+        print(f"[WARN] Запросов типов с ошибкой: {linker.stats['type_errors']} "
+              f"(кандидаты без типов не проверены)")
     if not args.quiet:
         print(f"[OK] Linked {linked}/{attempted} (attempted), total entities {total}")
         print(f"[OK] Saved: {args.out}")
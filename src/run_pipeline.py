@@ -0,0 +1,237 @@
+# run_pipeline.py
+# Потоковый конвейер NER → NEL для одной таблицы: NER размечает ячейки порциями и кладёт их
+# в ограниченную очередь, линкер параллельно забирает готовые порции и сразу ходит в Wikidata.
+# Время инференса модели и сетевые задержки перекрываются, на выходе сразу *_nel.json.
+
+import argparse
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ner_common import make_result, parse_drop_first_col
+from nel_wikidata import WIKIDATA_API_URL, EntityLinker, is_russian
+from run_nel import LINK_LABELS, link_entities, save_json
+from table_load import RF200TableLoader
+
+BACKENDS = ["spacy", "gazetteer", "gigachat_zero", "gigachat_few"]
+
+# признак конца потока в очереди
+_DONE = object()
+
+
+def create_ner(args):
+    if args.server:
+        from ner_server import NERClient
+        return NERClient(args.server, backend=args.backend)
+    if args.backend == "gazetteer":
+        from ner_gazetteer import DEFAULT_GAZETTEER_PATH, GazetteerNER
+        return GazetteerNER(args.gazetteer or DEFAULT_GAZETTEER_PATH)
+    from ner_server import create_backend
+    return create_backend(args.backend, spacy_model=args.model, spacy_profile=args.spacy_profile)
+
+
+class StreamingPipeline:
+    """
+    Производитель (поток NER) → очередь на queue_size порций по chunk ячеек → потребитель (NEL).
+    Если линкер отстаёт, очередь заполняется и NER ждёт — память ограничена.
+    """
+
+    def __init__(self, ner, linker: EntityLinker, chunk: int = 32, queue_size: int = 4):
+        self.ner = ner
+        self.linker = linker
+        self.chunk = max(1, chunk)
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self.error: Optional[BaseException] = None
+        self.stats = {
+            "chunk": self.chunk,
+            "queue_size": self.queue.maxsize,
+            "ner_s": 0.0,
+            "nel_s": 0.0,
+            "ner_wait_s": 0.0,   # NER ждал свободного места в очереди
+            "nel_wait_s": 0.0,   # NEL ждал готовой порции
+            "wall_s": 0.0,
+        }
+
+    def _produce(self, cells: List[Dict]):
+        try:
+            for start in range(0, len(cells), self.chunk):
+                part = cells[start:start + self.chunk]
+                t0 = time.perf_counter()
+                entities = self.ner.extract_entities_batch([c["text"] for c in part])
+                t1 = time.perf_counter()
+                self.queue.put((start, entities))
+                self.stats["ner_s"] += t1 - t0
+                self.stats["ner_wait_s"] += time.perf_counter() - t1
+        except BaseException as e:  # ошибка NER не должна подвесить потребителя
+            self.error = e
+        finally:
+            self.queue.put(_DONE)
+
+    def run(self, cells: List[Dict], index_base: int = 0) -> Tuple[List[Dict], Tuple[int, int, int]]:
+        t_start = time.perf_counter()
+        producer = threading.Thread(target=self._produce, args=(cells,), daemon=True)
+        producer.start()
+
+        results: List[Optional[Dict]] = [None] * len(cells)
+        linked = attempted = total = 0
+
+        while True:
+            t0 = time.perf_counter()
+            item = self.queue.get()
+            t1 = time.perf_counter()
+            self.stats["nel_wait_s"] += t1 - t0
+            if item is _DONE:
+                break
+
+            start, entities = item
+            if self.linker.controller is not None:
+                # уникальные запросы порции — параллельно, затем связывание из кэша
+                self.linker.prefetch(e.get("text") or "" for ents in entities for e in ents
+                                     if (e.get("label") or "").upper() in LINK_LABELS and is_russian(e.get("text") or ""))
+            for i, ents in enumerate(entities):
+                res = make_result(cells[start + i], ents, index_base)
+                l, a, t = link_entities(res["entities"], self.linker)
+                linked += l
+                attempted += a
+                total += t
+                results[start + i] = res
+            self.stats["nel_s"] += time.perf_counter() - t1
+
+        producer.join()
+        if self.error is not None:
+            raise self.error
+
+        self.stats["wall_s"] = time.perf_counter() - t_start
+        for key in ("ner_s", "nel_s", "ner_wait_s", "nel_wait_s", "wall_s"):
+            self.stats[key] = round(self.stats[key], 3)
+        return [r for r in results if r is not None], (linked, attempted, total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковый NER → NEL для таблицы RF-200 (CSV → *_nel.json)")
+    parser.add_argument("--tables_dir", required=True, help="Путь к директории с CSV-файлами")
+    parser.add_argument("--table_id", type=int, required=True, help="Номер таблицы (например 201)")
+    parser.add_argument("--out", required=True, help="Выходной JSON (NER+NEL)")
+
+    # --- NER ---
+    parser.add_argument("--backend", choices=BACKENDS, default="spacy", help="NER-бэкенд")
+    parser.add_argument("--model", default="ru_core_news_lg", help="spaCy модель (по умолчанию ru_core_news_lg)")
+    parser.add_argument("--spacy_profile", choices=["full", "ner"], default="full",
+                        help="full — все компоненты spaCy | ner — только NER")
+    parser.add_argument("--gazetteer", default=None, help="Путь к газеттиру для --backend gazetteer")
+    parser.add_argument("--server", default=None, help="URL запущенного ner_server.py")
+    parser.add_argument("--fast_path", action="store_true",
+                        help="Размечать числа/даты/проценты/деньги/время регулярками без вызова модели")
+
+    # --- NEL ---
+    parser.add_argument("--limit", type=int, default=1, help="сколько кандидатов брать из Wikidata")
+    parser.add_argument("--sleep", type=float, default=0.05, help="пауза между запросами (сек)")
+    parser.add_argument("--index", default=None, help="офлайн-индекс Wikidata (SQLite)")
+    parser.add_argument("--offline", action="store_true", help="не обращаться к wikidata.org, только офлайн-индекс")
+    parser.add_argument("--api_url", default=WIKIDATA_API_URL, help="URL Wikidata API")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Параллельные запросы к Wikidata с адаптивным (AIMD) лимитом вместо --sleep")
+    parser.add_argument("--max_concurrency", type=int, default=16, help="Верхняя граница лимита для --adaptive")
+    parser.add_argument("--cassette", default=None, help="Файл-кассета с ответами Wikidata API (JSON Lines)")
+    parser.add_argument("--cassette_mode", choices=["record", "replay", "auto"], default="replay",
+                        help="record — живые запросы с записью | replay — только кассета | auto — кассета, иначе запрос")
+    parser.add_argument("--replay_latency_ms", type=float, default=None,
+                        help="Имитируемая задержка ответа при воспроизведении (по умолчанию — записанная)")
+
+    # --- конвейер ---
+    parser.add_argument("--chunk", type=int, default=32, help="Ячеек в одной порции NER")
+    parser.add_argument("--queue_size", type=int, default=4, help="Сколько порций может ждать линкера")
+
+    # --- предобработка таблицы ---
+    parser.add_argument("--drop_first_col", choices=["auto", "true", "false"], default="auto",
+                        help="Удалять ли первый столбец (нумерацию): auto | true | false")
+    parser.add_argument("--drop_header", choices=["true", "false"], default="true",
+                        help="Удалять ли первую строку (заголовок): true | false")
+    parser.add_argument("--index_base", choices=["0", "1"], default="0",
+                        help="База индексации row/col в JSON: 0 (по умолчанию) или 1")
+    parser.add_argument("--quiet", action="store_true", help="Отключить вывод в консоль")
+    args = parser.parse_args()
+
+    if args.offline and not args.index:
+        parser.error("--offline требует --index")
+    if args.backend == "gazetteer" and args.server:
+        parser.error("--backend gazetteer работает локально, --server не нужен")
+
+    drop_first_col = parse_drop_first_col(args.drop_first_col)
+    drop_header = args.drop_header == "true"
+    index_base = int(args.index_base)
+
+    loader = RF200TableLoader(tables_dir=args.tables_dir, verbose=not args.quiet)
+    _, cells = loader.load_table_with_header(
+        table_id=args.table_id,
+        drop_first_col=drop_first_col,
+        drop_header=drop_header
+    )
+    if not cells:
+        print("[ERROR] Таблица не загружена или пуста")
+        return
+
+    base_ner = create_ner(args)
+    ner = base_ner
+    if args.fast_path:
+        from fast_path import FastPathNER
+        ner = FastPathNER(ner)
+
+    controller = None
+    if args.adaptive:
+        from aimd import AIMDController
+        controller = AIMDController(name="wikidata", max_limit=args.max_concurrency)
+
+    cassette = None
+    if args.cassette:
+        from cassette import Cassette
+        cassette = Cassette(args.cassette, mode=args.cassette_mode, latency_ms=args.replay_latency_ms)
+
+    linker = EntityLinker(limit=args.limit, sleep_s=args.sleep, index_path=args.index,
+                          offline_only=args.offline, api_url=args.api_url,
+                          controller=controller, cassette=cassette)
+
+    pipeline = StreamingPipeline(ner, linker, chunk=args.chunk, queue_size=args.queue_size)
+    results, (linked, attempted, total) = pipeline.run(cells, index_base)
+
+    table_file = loader._find_table_file(args.table_id)
+    output_obj = {
+        "table_name": os.path.basename(table_file) if table_file else f"{args.table_id}.csv",
+        "method": args.backend,
+        "meta": {
+            "drop_header": drop_header,
+            "drop_first_col": drop_first_col,
+            "index_base": index_base,
+            "pipeline": pipeline.stats,
+            **({"server": args.server} if args.server else {}),
+            **({"fast_path": ner.stats()} if args.fast_path else {}),
+            **({"llm_calls": base_ner.calls} if args.backend.startswith("gigachat") and not args.server else {}),
+        },
+        "results": results,
+        "nel": {
+            "kb": "wikidata",
+            "linked": linked,
+            "attempted": attempted,
+            "total": total,
+            "limit": args.limit,
+            "index": args.index,
+            "offline_hits": linker.stats["offline_hits"],
+            "online_requests": linker.stats["online_requests"],
+            **({"concurrency": controller.stats()} if controller is not None else {}),
+            **({"cassette": cassette.summary()} if cassette is not None else {}),
+        },
+    }
+
+    save_json(args.out, output_obj)
+
+    if not args.quiet:
+        st = pipeline.stats
+        print(f"[OK] Ячеек обработано: {len(results)}, связано {linked}/{attempted}, всего сущностей {total}")
+        print(f"[OK] NER {st['ner_s']} с, NEL {st['nel_s']} с, всего {st['wall_s']} с")
+        print(f"[OK] Результат сохранён: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# shard_worker.py
+# Воркер шардированного прогона: забирает задачи (job, table_id) из общей очереди work_queue.py,
+# запускает соответствующий run-скрипт (run.py / run_gigachat.py / run_nel.py) и пишет результат
+# в свою папку шарда. Воркеров можно запускать на нескольких машинах с одной очередью на общем диске;
+# потом aggregate_shards.py собирает обычную раскладку outputs/ и отчёты.
+#
+# python src/work_queue.py --add spacy --tables 201-225
+# python src/shard_worker.py --tables_dir .\data\all_tables     (на каждой машине)
+# python src/aggregate_shards.py --eval
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from output_writer import validate_output
+from work_queue import DEFAULT_QUEUE_PATH, DONE, FAILED, PENDING, RUNNING, WorkQueue
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_TABLES_DIR = r".\data\all_tables"
+DEFAULT_SHARD_DIR = r".\outputs\shards"
+DEFAULT_OUT_DIR = r".\outputs"
+
+# job → скрипт и фиксированные аргументы; <система>_nel — run_nel.py поверх выхода job <система>
+NER_JOBS: Dict[str, List[str]] = {
+    "spacy": ["run.py"],
+    "gigachat_zero": ["run_gigachat.py", "--mode", "zero"],
+    "gigachat_few": ["run_gigachat.py", "--mode", "few"],
+}
+
+
+class InputNotReady(Exception):
+    """
+    Для NEL ещё нет выхода NER этой таблицы — задача возвращается в очередь без штрафа.
+    """
+
+
+def job_command(job: str, table_id: int, out_path: str, args, queue: WorkQueue) -> List[str]:
+    if job in NER_JOBS:
+        script, *fixed = NER_JOBS[job]
+        return [
+            sys.executable, os.path.join(SRC_DIR, script),
+            "--tables_dir", args.tables_dir,
+            "--table_id", str(table_id),
+            "--out", out_path,
+            "--drop_first_col", "auto",
+            "--drop_header", "true",
+            "--index_base", "1",
+            "--quiet",
+            *fixed,
+        ]
+
+    if job.endswith("_nel") and job[:-len("_nel")] in NER_JOBS:
+        system = job[:-len("_nel")]
+        in_ner = queue.output_of(system, table_id) or os.path.join(args.out_dir, f"{table_id}_{system}.json")
+        if validate_output(in_ner) is not None:
+            upstream = queue.status_of(system, table_id)
+            # выхода не будет: NER-задача упала или её нет в очереди — ждать нечего
+            if upstream is None or upstream in (FAILED, DONE):
+                raise ValueError(f"нет выхода NER {system} для таблицы {table_id} "
+                                 f"(задача NER: {upstream or 'не в очереди'})")
+            raise InputNotReady(f"нет выхода NER {system} для таблицы {table_id}")
+        return [
+            sys.executable, os.path.join(SRC_DIR, "run_nel.py"),
+            "--in_ner", in_ner,
+            "--out", out_path,
+            "--quiet",
+        ]
+
+    raise ValueError(f"Неизвестный job: {job}")
+
+
+class ShardWorker:
+    def __init__(self, queue: WorkQueue, worker_id: str, args):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.args = args
+        self.shard_dir = os.path.join(args.shard_dir, worker_id)
+        self.stats = {"done": 0, "failed": 0, "lost": 0, "deferred": 0}
+
+    def _run(self, task: Dict, cmd: List[str]) -> subprocess.CompletedProcess:
+        """
+        Запуск run-скрипта с heartbeat: пока процесс работает, аренда продлевается.
+        Если задачу забрал другой воркер (мы считались умершими), процесс останавливается.
+        """
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, encoding="utf-8", errors="replace")
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def beat():
+            interval = max(1.0, self.queue.lease_s / 3)
+            while not stop.wait(interval):
+                if not self.queue.heartbeat(task, self.worker_id):
+                    lost.set()
+                    proc.terminate()
+                    return
+
+        t = threading.Thread(target=beat, daemon=True)
+        t.start()
+        try:
+            out, err = proc.communicate()
+        finally:
+            stop.set()
+            t.join()
+        res = subprocess.CompletedProcess(cmd, proc.returncode, out, err)
+        res.lost = lost.is_set()
+        return res
+
+    def process(self, task: Dict) -> str:
+        job, table_id = task["job"], int(task["table_id"])
+        final = os.path.join(self.shard_dir, f"{table_id}_{job}.json")
+        tmp = final + ".tmp"
+        os.makedirs(self.shard_dir, exist_ok=True)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+        try:
+            cmd = job_command(job, table_id, tmp, self.args, self.queue) + self.queue.job_args(job)
+        except InputNotReady as e:
+            self.queue.release(task, self.worker_id, str(e))
+            return "deferred"
+        except ValueError as e:
+            self.queue.fail(task, self.worker_id, str(e))
+            return "failed"
+
+        res = self._run(task, cmd)
+        if res.lost:
+            return "lost"
+
+        reason = validate_output(tmp)
+        if res.returncode != 0 or reason is not None:
+            tail = (res.stderr or res.stdout or "").strip().splitlines()[-3:]
+            self.queue.fail(task, self.worker_id,
+                            f"exit={res.returncode}; " + (" | ".join(tail) or reason or ""))
+            return "failed"
+
+        # выход появляется под итоговым именем только целиком
+        os.replace(tmp, final)
+        if not self.queue.complete(task, self.worker_id, os.path.abspath(final)):
+            return "lost"
+        return "done"
+
+    def run(self) -> Dict[str, int]:
+        jobs = [j.strip() for j in self.args.jobs.split(",") if j.strip()] if self.args.jobs else None
+        processed = 0
+        while self.args.max_tasks is None or processed < self.args.max_tasks:
+            task = self.queue.claim(self.worker_id, jobs)
+            if task is None:
+                if not self.args.wait or not self._unfinished(jobs):
+                    break
+                time.sleep(self.args.poll)
+                continue
+
+            t0 = time.time()
+            outcome = self.process(task)
+            self.stats[outcome] += 1
+            if outcome == "deferred":
+                # без --wait ждём только тех NER-задач, которые ещё можно забрать
+                if not self.args.wait and not self._unfinished(jobs, ner_only=True):
+                    break
+                time.sleep(self.args.poll)
+                continue
+            processed += 1
+            if not self.args.quiet:
+                print(f"[{'OK' if outcome == 'done' else 'WARN'}] {task['job']} {task['table_id']}: "
+                      f"{outcome} ({time.time() - t0:.1f} с, попытка {task['attempts']})")
+        return self.stats
+
+    def _unfinished(self, jobs: Optional[List[str]], ner_only: bool = False) -> bool:
+        """
+        Остались ли ожидающие или выполняемые кем-то задачи (их аренда может истечь).
+        ner_only — только задачи NER (ожидающие или с истёкшей арендой).
+        """
+        for job, counts in self.queue.stats().items():
+            if jobs and job not in jobs:
+                continue
+            if ner_only:
+                if job in NER_JOBS and (counts.get(PENDING) or counts.get("expired")):
+                    return True
+                continue
+            if counts.get(PENDING) or counts.get(RUNNING) or counts.get("expired"):
+                return True
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркер шардированного прогона NER/NEL по общей очереди задач")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="Файл очереди (SQLite на общем диске)")
+    parser.add_argument("--tables_dir", default=DEFAULT_TABLES_DIR, help="Путь к директории с CSV-файлами")
+    parser.add_argument("--shard_dir", default=DEFAULT_SHARD_DIR,
+                        help="Корень шардов: выходы воркера пишутся в <shard_dir>/<worker_id>/")
+    parser.add_argument("--out_dir", default=DEFAULT_OUT_DIR,
+                        help="Где искать выходы NER для задач *_nel, если их нет в очереди")
+    parser.add_argument("--worker_id", default=None, help="Имя воркера (по умолчанию host-pid)")
+    parser.add_argument("--jobs", default=None, help="Брать только эти job, через запятую")
+    parser.add_argument("--lease", type=float, default=600.0,
+                        help="Аренда задачи, с: без heartbeat дольше — задачу заберёт другой воркер")
+    parser.add_argument("--max_attempts", type=int, default=3, help="Попыток на задачу до статуса failed")
+    parser.add_argument("--max_tasks", type=int, default=None, help="Обработать не больше N задач")
+    parser.add_argument("--wait", action="store_true",
+                        help="Не выходить, пока в очереди есть невыполненные задачи (ждать чужие аренды)")
+    parser.add_argument("--poll", type=float, default=5.0, help="Пауза между попытками при --wait, с")
+    parser.add_argument("--quiet", action="store_true", help="Отключить вывод в консоль")
+    args = parser.parse_args()
+
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = WorkQueue(args.queue, lease_s=args.lease, max_attempts=args.max_attempts)
+    stats = ShardWorker(queue, worker_id, args).run()
+
+    if not args.quiet:
+        print(f"[OK] Воркер {worker_id}: готово {stats['done']}, ошибок {stats['failed']}, "
+              f"потеряно аренд {stats['lost']}")
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
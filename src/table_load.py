@@ -18,20 +18,18 @@ class RF200TableLoader:
                 return os.path.join(self.tables_dir, filename)
         return None
 
-    def _probe_delimiter(self, path: str, delimiters: List[str], probe_lines: int = 20) -> str:
+    def _probe_delimiter(self, lines: List[str], delimiters: List[str], probe_lines: int = 20) -> str:
         """
         Выбирает delimiter по максимуму "полезного разбиения":
         берём тот, где среднее число колонок на первых probe_lines строках максимальное.
+        Строки берутся из уже прочитанного текста — файл открывается один раз.
         """
         best_delim = delimiters[0]
         best_score = -1.0
+        head = lines[:probe_lines]
 
         for d in delimiters:
-            with open(path, encoding="utf-8", newline="") as f:
-                reader = csv.reader(f, delimiter=d)
-                rows = []
-                for _, row in zip(range(probe_lines), reader):
-                    rows.append(row)
+            rows = list(csv.reader(head, delimiter=d))
 
             if not rows:
                 continue
@@ -45,12 +43,11 @@ class RF200TableLoader:
 
         return best_delim
 
-    def _read_csv_auto(self, path: str) -> Tuple[str, List[List[str]]]:
+    def _parse_csv_text(self, text: str) -> Tuple[str, List[List[str]]]:
         candidates = ["|", "\t", ";", ","]  # у тебя реально '|' как разделитель колонок
-        delim = self._probe_delimiter(path, candidates)
-
-        with open(path, encoding="utf-8", newline="") as f:
-            rows = list(csv.reader(f, delimiter=delim))
+        lines = text.splitlines(keepends=True)
+        delim = self._probe_delimiter(lines, candidates)
+        rows = list(csv.reader(lines, delimiter=delim))
 
         if self.verbose:
             # приблизительная оценка колонок
@@ -60,6 +57,11 @@ class RF200TableLoader:
 
         return delim, rows
 
+    def _read_csv_auto(self, path: str) -> Tuple[str, List[List[str]]]:
+        with open(path, encoding="utf-8", newline="") as f:
+            text = f.read()
+        return self._parse_csv_text(text)
+
     def _auto_detect_drop_first_col(self, data_rows: List[List[str]]) -> bool:
         """
         True если >=80% непустых значений в первом столбце — числа вида 1 или 1.0
@@ -84,19 +86,69 @@ class RF200TableLoader:
         drop_first_col: Optional[bool] = None,  # None = auto
         drop_header: bool = True
     ) -> List[Dict]:
+        _, cells = self.load_table_with_header(table_id, drop_first_col, drop_header)
+        return cells
+
+    def load_table_with_header(
+        self,
+        table_id: int,
+        drop_first_col: Optional[bool] = None,  # None = auto
+        drop_header: bool = True
+    ) -> Tuple[Dict[int, str], List[Dict]]:
+        """
+        Как load_table, но дополнительно возвращает заголовки столбцов {col: header}
+        в тех же координатах col, что и у ячеек (пусто, если drop_header=False).
+        """
         path = self._find_table_file(table_id)
 
         if path is None:
             if self.verbose:
                 print(f"[WARN] Таблица {table_id} отсутствует — пропуск")
-            return []
+            return {}, []
 
         if self.verbose:
             print(f"[OK] Файл таблицы: {path}")
 
+        return self.load_file(path, table_id, drop_first_col, drop_header)
+
+    def load_file(
+        self,
+        path: str,
+        table_id: Optional[int] = None,
+        drop_first_col: Optional[bool] = None,  # None = auto
+        drop_header: bool = True
+    ) -> Tuple[Dict[int, str], List[Dict]]:
+        """
+        То же, что load_table_with_header, но по пути к CSV (файл может лежать вне tables_dir
+        и называться как угодно).
+        """
         delim, rows = self._read_csv_auto(path)
+        return self._rows_to_table(table_id, delim, rows, drop_first_col, drop_header)
+
+    def load_table_from_text(
+        self,
+        table_id: int,
+        text: str,
+        drop_first_col: Optional[bool] = None,  # None = auto
+        drop_header: bool = True
+    ) -> List[Dict]:
+        """
+        То же, что load_table, но CSV передаётся строкой (например, телом HTTP-запроса).
+        """
+        delim, rows = self._parse_csv_text(text)
+        _, cells = self._rows_to_table(table_id, delim, rows, drop_first_col, drop_header)
+        return cells
+
+    def _rows_to_table(
+        self,
+        table_id: int,
+        delim: str,
+        rows: List[List[str]],
+        drop_first_col: Optional[bool],
+        drop_header: bool
+    ) -> Tuple[Dict[int, str], List[Dict]]:
         if not rows:
-            return []
+            return {}, []
 
         # 1) убираем заголовок
         data_rows = rows[1:] if drop_header else rows
@@ -110,7 +162,15 @@ class RF200TableLoader:
             if self.verbose:
                 print(f"[INFO] drop_first_col = {drop_first_col} (forced)")
 
-        # 3) формируем плоский список ячеек
+        # 3) заголовки столбцов в координатах ячеек
+        headers: Dict[int, str] = {}
+        if drop_header:
+            for c_i, h in enumerate(rows[0]):
+                if drop_first_col and c_i == 0:
+                    continue
+                headers[c_i] = (h or "").strip()
+
+        # 4) формируем плоский список ячеек
         cells: List[Dict] = []
         start_row_idx = 1 if drop_header else 0
 
@@ -143,4 +203,4 @@ class RF200TableLoader:
                         "text": text
                     })
 
-        return cells
+        return headers, cells
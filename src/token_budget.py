@@ -0,0 +1,122 @@
+# token_budget.py
+# Учёт токенов GigaChat (по метаданным ответа или локальной оценке) и оценка стоимости таблицы
+# для планировщика бюджета в batch_run_gigachat.py.
+
+import math
+import threading
+from typing import Dict, List, Optional
+
+# грубая оценка для русского текста, если ответ не содержит usage
+CHARS_PER_TOKEN = 3.0
+
+# ожидаемый ответ на ячейку: JSON-список с сущностью примерно длины текста
+COMPLETION_OVERHEAD_CHARS = 40
+
+
+def estimate_tokens(text: str) -> int:
+    return int(math.ceil(len(text or "") / CHARS_PER_TOKEN))
+
+
+def _get(obj, key):
+    if isinstance(obj, dict):
+        return obj.get(key)
+    return getattr(obj, key, None)
+
+
+def usage_from_response(response) -> Optional[Dict[str, int]]:
+    """
+    Токены из ответа langchain: usage_metadata (input/output_tokens)
+    или response_metadata["token_usage"] (prompt/completion_tokens). None, если их нет.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage and _get(usage, "input_tokens") is not None:
+        return {"prompt": int(_get(usage, "input_tokens")), "completion": int(_get(usage, "output_tokens") or 0)}
+
+    token_usage = _get(getattr(response, "response_metadata", None) or {}, "token_usage")
+    if token_usage and _get(token_usage, "prompt_tokens") is not None:
+        return {"prompt": int(_get(token_usage, "prompt_tokens")),
+                "completion": int(_get(token_usage, "completion_tokens") or 0)}
+    return None
+
+
+class TokenMeter:
+    """
+    Счётчик токенов по вызовам (потокобезопасный — вызовы могут идти параллельно).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.per_call: List[List[int]] = []
+        self.estimated_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.max_call_tokens = 0
+
+    def add(self, prompt: int, completion: int, estimated: bool = False):
+        with self._lock:
+            self.per_call.append([prompt, completion])
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            self.max_call_tokens = max(self.max_call_tokens, prompt + completion)
+            if estimated:
+                self.estimated_calls += 1
+
+    @property
+    def total(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def summary(self, per_call: bool = False) -> Dict:
+        """
+        Итоги для meta.tokens; per_call=True — ещё и [prompt, completion] каждого вызова
+        (список растёт с числом ячеек, поэтому в выходной JSON он не пишется).
+        """
+        out = {
+            "calls": len(self.per_call),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total,
+            "estimated_calls": self.estimated_calls,
+            "max_call_tokens": self.max_call_tokens,
+        }
+        if per_call:
+            out["per_call"] = self.per_call
+        return out
+
+
+def estimate_table_tokens(cells: List[Dict], headers: Dict[int, str], mode: str,
+                          table_mode: bool = False, rows_per_call: int = 1) -> int:
+    """
+    Ожидаемые токены на таблицу (промпты + ответы) при обычном или табличном режиме.
+    """
+    from ner_gigachat import build_cell_prompt, build_table_prompt
+
+    completion_tokens = int(math.ceil(
+        sum(len(c["text"]) + COMPLETION_OVERHEAD_CHARS for c in cells) / CHARS_PER_TOKEN
+    ))
+
+    if not table_mode:
+        overhead = estimate_tokens(build_cell_prompt(mode, ""))
+        return len(cells) * overhead + sum(estimate_tokens(c["text"]) for c in cells) + completion_tokens
+
+    rows: Dict[int, List[Dict]] = {}
+    for cell in cells:
+        rows.setdefault(int(cell["row"]), []).append(cell)
+    ordered = [rows[r] for r in sorted(rows)]
+    step = max(1, rows_per_call)
+
+    prompt_tokens = 0
+    for start in range(0, len(ordered), step):
+        block = [c for row in ordered[start:start + step] for c in row]
+        prompt_tokens += estimate_tokens(build_table_prompt(mode, headers, block))
+    return prompt_tokens + completion_tokens
+
+
+def table_value(cells: List[Dict]) -> int:
+    """
+    Ожидаемая польза от LLM: ячейки, которые не размечаются правилами fast path
+    (числа/даты и так разметит любой бэкенд).
+    """
+    from fast_path import FastPathClassifier
+
+    classifier = FastPathClassifier()
+    return sum(1 for c in cells if c["text"].strip() and classifier.classify_label(c["text"]) is None)
@@ -0,0 +1,238 @@
+# train_spacy_ner.py
+# Дистилляция GigaChat few-shot в локальную spaCy-модель с полной схемой из 17 меток:
+# outputs/*_gigachat_few.json (серебряная разметка) + data/test_set (ручная, имеет приоритет)
+# → DocBin train/dev → обучение CPU-модели (tok2vec + ner) → models/spacy_ner_full/model-best.
+# Потом: python src/run.py --model full ...
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from ner_gigachat import LABELS_BLOCK
+
+# 17 меток проекта — те же, что в промпте GigaChat
+FULL_LABELS: List[str] = re.findall(r"^- (\w+) —", LABELS_BLOCK, flags=re.M)
+
+DEFAULT_SILVER_GLOB = r".\outputs\*_gigachat_few.json"
+DEFAULT_GOLD_DIR = r".\data\test_set"
+DEFAULT_OUT_DIR = os.path.join("models", "spacy_ner_full")
+
+TABLE_ID_RE = re.compile(r"(\d+)")
+
+# ключ в meta.json модели: таблицы train / dev / исключённые — run.py переносит их в meta выхода,
+# eval_ner.py предупреждает об оценке на таблицах, попавших в обучение
+TABLE_SPLIT_KEY = "table_split"
+
+Example = Tuple[str, List[Tuple[int, int, str]]]
+
+
+def table_id_of(path: str) -> Optional[int]:
+    m = TABLE_ID_RE.search(os.path.basename(path))
+    return int(m.group(1)) if m else None
+
+
+def parse_ids(value: Optional[str]) -> Set[int]:
+    """
+    "201,205-207" → {201, 205, 206, 207}
+    """
+    out: Set[int] = set()
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            out.update(range(int(a), int(b) + 1))
+        else:
+            out.add(int(part))
+    return out
+
+
+def gold_table_ids(gold_dir: Optional[str]) -> Set[int]:
+    if not gold_dir:
+        return set()
+    return {tid for tid in map(table_id_of, glob.glob(os.path.join(gold_dir, "*.json"))) if tid is not None}
+
+
+def char_spans(text: str, entities: Iterable[Dict], labels: Set[str]) -> List[Tuple[int, int, str]]:
+    """
+    Сущности (text, label) → непересекающиеся символьные интервалы в тексте ячейки.
+    Сущность ищется без учёта регистра после конца предыдущей; не найденные пропускаются.
+    """
+    low = text.lower()
+    spans: List[Tuple[int, int, str]] = []
+    pos = 0
+    for ent in entities:
+        label = (ent.get("label") or "").upper()
+        et = (ent.get("text") or "").strip()
+        if label not in labels or not et:
+            continue
+        start = low.find(et.lower(), pos)
+        if start < 0:
+            start = low.find(et.lower())
+        if start < 0:
+            continue
+        end = start + len(et)
+        if any(start < e and s < end for s, e, _ in spans):
+            continue
+        spans.append((start, end, label))
+        pos = end
+    return sorted(spans)
+
+
+def load_cells(path: str, labels: Set[str]) -> Dict[Tuple[int, int], Example]:
+    with open(path, encoding="utf-8") as f:
+        obj = json.load(f)
+    out: Dict[Tuple[int, int], Example] = {}
+    for cell in obj.get("results", []):
+        text = cell.get("text") or ""
+        if not text.strip():
+            continue
+        out[(int(cell["row"]), int(cell["col"]))] = (text, char_spans(text, cell.get("entities") or [], labels))
+    return out
+
+
+def collect_examples(silver_glob: Optional[str], gold_dir: Optional[str], exclude: Set[int],
+                     labels: Set[str]) -> Dict[int, List[Example]]:
+    """
+    Примеры по таблицам. Для ячейки, размеченной вручную, берётся ручная разметка.
+    """
+    by_table: Dict[int, Dict[Tuple[int, int], Example]] = {}
+
+    for path in sorted(glob.glob(silver_glob)) if silver_glob else []:
+        tid = table_id_of(path)
+        if tid is None or tid in exclude or "_nel" in os.path.basename(path):
+            continue
+        by_table.setdefault(tid, {}).update(load_cells(path, labels))
+
+    for path in sorted(glob.glob(os.path.join(gold_dir, "*.json"))) if gold_dir else []:
+        tid = table_id_of(path)
+        if tid is None or tid in exclude:
+            continue
+        by_table.setdefault(tid, {}).update(load_cells(path, labels))
+
+    return {tid: list(cells.values()) for tid, cells in sorted(by_table.items())}
+
+
+def to_docbin(nlp, examples: List[Example]):
+    from spacy.tokens import DocBin
+    from spacy.util import filter_spans
+
+    db = DocBin()
+    for text, spans in examples:
+        doc = nlp.make_doc(text)
+        ents = [doc.char_span(s, e, label=lb, alignment_mode="expand") for s, e, lb in spans]
+        doc.ents = filter_spans([sp for sp in ents if sp is not None])
+        db.add(doc)
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обучение spaCy NER с полной схемой меток на разметке GigaChat few-shot")
+    parser.add_argument("--silver_glob", default=DEFAULT_SILVER_GLOB,
+                        help="Выходы GigaChat few-shot (пусто — не использовать)")
+    parser.add_argument("--gold_dir", default=DEFAULT_GOLD_DIR, help="Ручная разметка (пусто — не использовать)")
+    parser.add_argument("--exclude_tables", default="",
+                        help="Ещё таблицы, не попадающие в обучение, например 221-225 "
+                             "(таблицы из --gold_dir исключаются всегда, кроме --train_on_gold)")
+    parser.add_argument("--train_on_gold", action="store_true",
+                        help="Обучать и на таблицах --gold_dir. eval_ner.py оценивает по той же разметке, "
+                             "поэтому F1 на этих таблицах будет завышен")
+    parser.add_argument("--dev_share", type=float, default=0.15, help="Доля таблиц в dev")
+    parser.add_argument("--out_dir", default=DEFAULT_OUT_DIR, help="Куда сохранить данные и модель")
+    parser.add_argument("--optimize", choices=["efficiency", "accuracy"], default="efficiency",
+                        help="Профиль конфигурации spaCy (CPU)")
+    parser.add_argument("--max_steps", type=int, default=4000, help="training.max_steps")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prepare_only", action="store_true", help="Только собрать train/dev .spacy")
+    args = parser.parse_args()
+
+    import spacy
+    from spacy.cli.init_config import init_config
+    from spacy.cli.train import train
+
+    labels = set(FULL_LABELS)
+    gold_ids = gold_table_ids(args.gold_dir or None)
+    # по умолчанию таблицы ручной разметки — отложенные: по ним считается eval_ner.py
+    exclude = parse_ids(args.exclude_tables) | (set() if args.train_on_gold else gold_ids)
+    by_table = collect_examples(args.silver_glob or None, args.gold_dir or None, exclude, labels)
+    if not by_table:
+        print("[ERROR] Нет данных для обучения (проверьте --silver_glob / --gold_dir)")
+        if gold_ids and not args.train_on_gold:
+            print(f"[INFO] Таблицы --gold_dir ({len(gold_ids)}) отложены для оценки. Нужна серебряная разметка "
+                  f"других таблиц или --train_on_gold --exclude_tables <таблицы для оценки>")
+        return
+
+    # разбиение по таблицам, чтобы dev не содержал соседних ячеек из train
+    tables = list(by_table)
+    random.Random(args.seed).shuffle(tables)
+    n_dev = max(1, int(round(len(tables) * args.dev_share))) if len(tables) > 1 else 0
+    dev_tables, train_tables = set(tables[:n_dev]), tables[n_dev:]
+
+    train_ex = [ex for t in train_tables for ex in by_table[t]]
+    dev_ex = [ex for t in dev_tables for ex in by_table[t]] or train_ex
+
+    nlp = spacy.blank("ru")
+    os.makedirs(args.out_dir, exist_ok=True)
+    train_path = os.path.join(args.out_dir, "train.spacy")
+    dev_path = os.path.join(args.out_dir, "dev.spacy")
+    to_docbin(nlp, train_ex).to_disk(train_path)
+    to_docbin(nlp, dev_ex).to_disk(dev_path)
+
+    n_ents = sum(len(spans) for _, spans in train_ex)
+    print(f"[OK] train: {len(train_ex)} ячеек, {n_ents} сущностей ({len(train_tables)} таблиц); "
+          f"dev: {len(dev_ex)} ячеек ({sorted(dev_tables)})")
+    if exclude:
+        print(f"[OK] Исключены из обучения: {sorted(exclude)}")
+    gold_in_train = sorted(gold_ids & set(tables))
+    if gold_in_train:
+        print("[WARN] " + "!" * 70)
+        print(f"[WARN] В обучении таблицы test_set: {gold_in_train}")
+        print("[WARN] eval_ner.py по ним меряет качество на обучающих данных — F1 завышен")
+        print("[WARN] " + "!" * 70)
+
+    table_split = {
+        "train": sorted(train_tables),
+        "dev": sorted(dev_tables),
+        "excluded": sorted(exclude),
+        "gold_in_train": gold_in_train,
+    }
+    with open(os.path.join(args.out_dir, "table_split.json"), "w", encoding="utf-8") as f:
+        json.dump(table_split, f, ensure_ascii=False, indent=2)
+    if args.prepare_only:
+        return
+
+    config = init_config(lang="ru", pipeline=["ner"], optimize=args.optimize, gpu=False)
+    config_path = os.path.join(args.out_dir, "config.cfg")
+    config.to_disk(config_path)
+
+    t0 = time.time()
+    train(
+        config_path,
+        args.out_dir,
+        overrides={
+            "paths.train": train_path,
+            "paths.dev": dev_path,
+            "training.max_steps": args.max_steps,
+            "training.seed": args.seed,
+        },
+    )
+    for model_dir in ("model-best", "model-last"):
+        meta_path = os.path.join(args.out_dir, model_dir, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            meta[TABLE_SPLIT_KEY] = table_split
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"[OK] Обучено за {time.time() - t0:.1f} с, модель: {os.path.join(args.out_dir, 'model-best')}")
+    print("[OK] Запуск: python src/run.py --model full ...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# wikidata_index.py
+# Офлайн-индекс меток Wikidata: русские метки и алиасы → QID (+ число sitelinks для ранжирования
+# и P31 / P279 для проверки типов). Хранится в SQLite, читается через mmap — NEL без сети.
+
+import bz2
+import gzip
+import json
+import os
+import re
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+SPACE_RE = re.compile(r"\s+")
+
+TYPE_PROPS = ("P31", "P279")
+
+# PRAGMA user_version файла индекса; индексы другой версии не открываются — их надо пересобрать
+INDEX_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    qid TEXT PRIMARY KEY,
+    label TEXT,
+    sitelinks INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS names (
+    name TEXT NOT NULL,
+    qid TEXT NOT NULL,
+    is_alias INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS types (
+    qid TEXT NOT NULL,
+    type_qid TEXT NOT NULL,
+    prop TEXT NOT NULL              -- P31 (экземпляр) | P279 (подкласс)
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS names_name ON names(name);
+CREATE INDEX IF NOT EXISTS types_qid ON types(qid);
+"""
+
+
+def norm_name(text: str) -> str:
+    t = (text or "").strip().lower().replace("ё", "е").replace("\u00A0", " ")
+    return SPACE_RE.sub(" ", t)
+
+
+def open_dump(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_dump_entities(path: str) -> Iterator[Dict]:
+    """
+    Потоково читает JSON-дамп Wikidata: "[", затем по одной сущности на строку с запятой в конце, "]".
+    Подходит и для JSON Lines (одна сущность на строку без обрамления).
+    """
+    with open_dump(path) as f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if not line or line in ("[", "]"):
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def entity_rows(entity: Dict, language: str) -> Optional[Tuple[Tuple[str, str, int], List[Tuple[str, str, int]], List[Tuple[str, str, str]]]]:
+    qid = entity.get("id")
+    if not qid or not qid.startswith("Q"):
+        return None
+
+    label = ((entity.get("labels") or {}).get(language) or {}).get("value")
+    aliases = [a.get("value") for a in (entity.get("aliases") or {}).get(language, []) if a.get("value")]
+    if not label and not aliases:
+        return None
+
+    sitelinks = len(entity.get("sitelinks") or {})
+
+    names = []
+    if label:
+        names.append((norm_name(label), qid, 0))
+    names += [(norm_name(a), qid, 1) for a in aliases]
+
+    # P279 нужен, чтобы подниматься по иерархии классов так же, как онлайн (EntityLinker._claim_types)
+    types = []
+    for prop in TYPE_PROPS:
+        for claim in (entity.get("claims") or {}).get(prop, []):
+            value = (((claim.get("mainsnak") or {}).get("datavalue") or {}).get("value") or {})
+            if isinstance(value, dict) and value.get("id"):
+                types.append((qid, value["id"], prop))
+
+    return (qid, label, sitelinks), names, types
+
+
+def build_index(
+    dump_paths: Iterable[str],
+    out_path: str,
+    language: str = "ru",
+    min_sitelinks: int = 0,
+    batch_size: int = 10000,
+    verbose: bool = True,
+) -> int:
+    """
+    Строит SQLite-индекс из одного или нескольких файлов дампа (.json / .json.gz / .json.bz2).
+    Возвращает число проиндексированных сущностей.
+    """
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+    con = sqlite3.connect(out_path)
+    con.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;")
+    con.executescript(SCHEMA)
+
+    ents: List[Tuple[str, str, int]] = []
+    names: List[Tuple[str, str, int]] = []
+    types: List[Tuple[str, str, str]] = []
+    total = 0
+
+    def flush():
+        con.executemany("INSERT OR REPLACE INTO entities VALUES (?, ?, ?)", ents)
+        con.executemany("INSERT INTO names VALUES (?, ?, ?)", names)
+        con.executemany("INSERT INTO types VALUES (?, ?, ?)", types)
+        ents.clear()
+        names.clear()
+        types.clear()
+
+    for path in dump_paths:
+        for entity in iter_dump_entities(path):
+            rows = entity_rows(entity, language)
+            if rows is None or rows[0][2] < min_sitelinks:
+                continue
+            ents.append(rows[0])
+            names.extend(rows[1])
+            types.extend(rows[2])
+            total += 1
+            if len(ents) >= batch_size:
+                flush()
+                if verbose:
+                    print(f"[INFO] проиндексировано {total} сущностей")
+
+    flush()
+    con.executescript(INDEXES)
+    con.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+    con.commit()
+    con.execute("VACUUM")
+    con.close()
+    return total
+
+
+class WikidataIndex:
+    """
+    Поиск по офлайн-индексу: точное совпадение нормализованной метки/алиаса,
+    сначала метки, затем алиасы, внутри — по убыванию sitelinks.
+    """
+
+    def __init__(self, path: str, mmap_mb: int = 1024):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.con = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self.con.execute(f"PRAGMA mmap_size={mmap_mb * 1024 * 1024}")
+        version = self.con.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            self.con.close()
+            raise ValueError(f"Индекс {path} версии {version}, нужна {INDEX_VERSION}: "
+                             f"пересоберите его build_wikidata_index.py")
+
+    def search(self, query: str, limit: int = 1) -> List[str]:
+        rows = self.con.execute(
+            """
+            SELECT n.qid FROM names n JOIN entities e ON e.qid = n.qid
+            WHERE n.name = ?
+            GROUP BY n.qid
+            ORDER BY MIN(n.is_alias), e.sitelinks DESC
+            LIMIT ?
+            """,
+            (norm_name(query), limit),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def types(self, qids: List[str]) -> Dict[str, List[str]]:
+        """
+        P31 ∪ P279 для каждого QID.
+        """
+        out: Dict[str, List[str]] = {q: [] for q in qids}
+        for start in range(0, len(qids), 500):
+            chunk = qids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            for qid, type_qid in self.con.execute(
+                f"SELECT qid, type_qid FROM types WHERE qid IN ({marks})", chunk
+            ):
+                out[qid].append(type_qid)
+        return out
+
+    def close(self):
+        self.con.close()
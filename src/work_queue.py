@@ -0,0 +1,303 @@
+# work_queue.py
+# Общая очередь задач для шардированного прогона (shard_worker.py на нескольких машинах):
+# SQLite-файл на общем диске, задача = (job, table_id). Воркер забирает задачу с арендой (lease)
+# и продлевает её heartbeat-ом; если воркер умер, по истечении аренды задачу заберёт другой.
+# Локально тот же файл на обычном диске — замена общего хранилища для отладки.
+#
+# python src/work_queue.py --queue .\outputs\queue.sqlite --add spacy --tables 201-225
+# python src/work_queue.py --queue .\outputs\queue.sqlite --status
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set
+
+DEFAULT_QUEUE_PATH = r".\outputs\queue.sqlite"
+
+# статусы задачи
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    args TEXT NOT NULL DEFAULT '[]'
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    job TEXT NOT NULL,
+    table_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    heartbeat REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output TEXT,
+    error TEXT,
+    updated REAL,
+    PRIMARY KEY (job, table_id)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, heartbeat);
+"""
+
+
+def parse_ids(value: Optional[str]) -> List[int]:
+    """
+    "201,205-207" → [201, 205, 206, 207]
+    """
+    out: Set[int] = set()
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            out.update(range(int(a), int(b) + 1))
+        else:
+            out.add(int(part))
+    return sorted(out)
+
+
+class WorkQueue:
+    """
+    lease_s — сколько секунд задача остаётся за воркером без heartbeat;
+    max_attempts — после стольких неудачных попыток задача получает статус failed.
+
+    Каждая операция — отдельная короткая транзакция (BEGIN IMMEDIATE), поэтому несколько
+    процессов и машин могут работать с одним файлом. WAL не включается: на сетевых
+    дисках он не работает.
+    """
+
+    def __init__(self, path: str, lease_s: float = 600.0, max_attempts: int = 3):
+        self.path = path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        con = sqlite3.connect(self.path, timeout=60)
+        try:
+            con.executescript(SCHEMA)
+        finally:
+            con.close()
+
+    @contextmanager
+    def _tx(self):
+        con = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            else:
+                con.execute("COMMIT")
+        finally:
+            con.close()
+
+    # ---------- постановка задач ----------
+
+    def add(self, job: str, table_ids: Iterable[int], args: Optional[List[str]] = None) -> int:
+        """
+        Ставит (job, table_id) в очередь; уже существующие задачи не трогаются.
+        args — дополнительные аргументы run-скрипта, одинаковые для всех воркеров.
+        """
+        with self._tx() as con:
+            if args is not None:
+                con.execute("INSERT INTO jobs (name, args) VALUES (?, ?) "
+                            "ON CONFLICT(name) DO UPDATE SET args = excluded.args",
+                            (job, json.dumps(args, ensure_ascii=False)))
+            else:
+                con.execute("INSERT OR IGNORE INTO jobs (name) VALUES (?)", (job,))
+            before = con.total_changes
+            now = time.time()
+            con.executemany("INSERT OR IGNORE INTO tasks (job, table_id, updated) VALUES (?, ?, ?)",
+                            [(job, int(t), now) for t in table_ids])
+            return con.total_changes - before
+
+    def job_args(self, job: str) -> List[str]:
+        with self._tx() as con:
+            row = con.execute("SELECT args FROM jobs WHERE name = ?", (job,)).fetchone()
+        return json.loads(row["args"]) if row else []
+
+    # ---------- воркер ----------
+
+    def claim(self, worker: str, jobs: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Забирает одну задачу: ожидающую или ту, чья аренда истекла (воркер умер).
+        NER раньше NEL (NEL читает выход NER, а отложенная NEL-задача не должна обгонять
+        повтор упавшей NER-задачи), внутри — задачи с меньшим числом попыток.
+        """
+        now = time.time()
+        job_filter = ""
+        params: List = [now - self.lease_s]
+        if jobs:
+            job_filter = f" AND job IN ({','.join('?' * len(jobs))})"
+            params += list(jobs)
+
+        with self._tx() as con:
+            # воркер умирал на задаче max_attempts раз — больше не раздаём
+            con.execute(
+                "UPDATE tasks SET status = 'failed', error = COALESCE(error, 'аренда истекла'), updated = ? "
+                "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                (now, now - self.lease_s, self.max_attempts),
+            )
+            row = con.execute(
+                "SELECT * FROM tasks WHERE (status = 'pending' OR (status = 'running' AND heartbeat < ?))"
+                f"{job_filter} ORDER BY job LIKE '%\\_nel' ESCAPE '\\', attempts, table_id, job LIMIT 1",
+                params,
+            ).fetchone()
+            if row is None:
+                return None
+            con.execute(
+                "UPDATE tasks SET status = 'running', worker = ?, heartbeat = ?, attempts = attempts + 1, "
+                "error = NULL, updated = ? WHERE job = ? AND table_id = ?",
+                (worker, now, now, row["job"], row["table_id"]),
+            )
+            task = dict(row)
+            task.update(status=RUNNING, worker=worker, heartbeat=now, attempts=row["attempts"] + 1)
+            return task
+
+    def heartbeat(self, task: Dict, worker: str) -> bool:
+        """
+        Продлевает аренду. False — задача уже не за этим воркером (аренда истекла и её забрали).
+        """
+        now = time.time()
+        with self._tx() as con:
+            cur = con.execute(
+                "UPDATE tasks SET heartbeat = ?, updated = ? "
+                "WHERE job = ? AND table_id = ? AND worker = ? AND status = 'running'",
+                (now, now, task["job"], task["table_id"], worker),
+            )
+            return cur.rowcount == 1
+
+    def complete(self, task: Dict, worker: str, output: str) -> bool:
+        with self._tx() as con:
+            cur = con.execute(
+                "UPDATE tasks SET status = 'done', output = ?, updated = ? "
+                "WHERE job = ? AND table_id = ? AND worker = ? AND status = 'running'",
+                (output, time.time(), task["job"], task["table_id"], worker),
+            )
+            return cur.rowcount == 1
+
+    def fail(self, task: Dict, worker: str, error: str) -> bool:
+        """
+        Неудачная попытка: задача возвращается в очередь, пока не исчерпан max_attempts.
+        """
+        with self._tx() as con:
+            cur = con.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, updated = ? "
+                "WHERE job = ? AND table_id = ? AND worker = ? AND status = 'running'",
+                (self.max_attempts, error[-2000:], time.time(), task["job"], task["table_id"], worker),
+            )
+            return cur.rowcount == 1
+
+    def release(self, task: Dict, worker: str, reason: str = "") -> bool:
+        """
+        Вернуть задачу без траты попытки (не готовы входные данные).
+        """
+        with self._tx() as con:
+            cur = con.execute(
+                "UPDATE tasks SET status = 'pending', worker = NULL, heartbeat = NULL, "
+                "attempts = MAX(0, attempts - 1), error = ?, updated = ? "
+                "WHERE job = ? AND table_id = ? AND worker = ? AND status = 'running'",
+                (reason or None, time.time(), task["job"], task["table_id"], worker),
+            )
+            return cur.rowcount == 1
+
+    # ---------- обслуживание ----------
+
+    def requeue(self, job: str, table_id: int, reason: str = "", reset_attempts: bool = False) -> bool:
+        """
+        Вернуть задачу в очередь (например, её выход оказался битым).
+        """
+        with self._tx() as con:
+            cur = con.execute(
+                "UPDATE tasks SET status = 'pending', worker = NULL, heartbeat = NULL, output = NULL, "
+                f"error = ?, updated = ?{', attempts = 0' if reset_attempts else ''} "
+                "WHERE job = ? AND table_id = ?",
+                (reason or None, time.time(), job, int(table_id)),
+            )
+            return cur.rowcount == 1
+
+    def tasks(self, job: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+        sql = "SELECT * FROM tasks WHERE 1 = 1"
+        params: List = []
+        if job:
+            sql += " AND job = ?"
+            params.append(job)
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        with self._tx() as con:
+            return [dict(r) for r in con.execute(sql + " ORDER BY job, table_id", params)]
+
+    def status_of(self, job: str, table_id: int) -> Optional[str]:
+        """
+        Статус задачи или None, если такой задачи в очереди нет.
+        """
+        with self._tx() as con:
+            row = con.execute("SELECT status FROM tasks WHERE job = ? AND table_id = ?",
+                              (job, int(table_id))).fetchone()
+        return row["status"] if row else None
+
+    def output_of(self, job: str, table_id: int) -> Optional[str]:
+        with self._tx() as con:
+            row = con.execute("SELECT output FROM tasks WHERE job = ? AND table_id = ? AND status = 'done'",
+                              (job, int(table_id))).fetchone()
+        return row["output"] if row else None
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        {job: {status: число задач}}; просроченные running считаются как expired.
+        """
+        out: Dict[str, Dict[str, int]] = {}
+        expired_before = time.time() - self.lease_s
+        for t in self.tasks():
+            status = t["status"]
+            if status == RUNNING and (t["heartbeat"] or 0) < expired_before:
+                status = "expired"
+            job = out.setdefault(t["job"], {})
+            job[status] = job.get(status, 0) + 1
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Очередь задач шардированного прогона (SQLite на общем диске)")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="Файл очереди (SQLite)")
+    parser.add_argument("--add", default=None,
+                        help="Поставить задачи job: spacy | gigachat_zero | gigachat_few | <система>_nel")
+    parser.add_argument("--tables", default="201-225", help="Номера таблиц для --add, например 201-225,230")
+    parser.add_argument("--job_args", default=None,
+                        help='Доп. аргументы run-скрипта для всех воркеров, через "=": --job_args="--fast_path"')
+    parser.add_argument("--requeue_failed", action="store_true", help="Вернуть failed-задачи в очередь")
+    parser.add_argument("--status", action="store_true", help="Показать состояние очереди")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+
+    if args.add:
+        extra = args.job_args.split() if args.job_args is not None else None
+        added = queue.add(args.add, parse_ids(args.tables), args=extra)
+        print(f"[OK] {args.add}: добавлено задач {added}")
+
+    if args.requeue_failed:
+        failed = queue.tasks(status=FAILED)
+        for t in failed:
+            queue.requeue(t["job"], t["table_id"], reason=t["error"] or "", reset_attempts=True)
+        print(f"[OK] Возвращено в очередь: {len(failed)}")
+
+    if args.status or not (args.add or args.requeue_failed):
+        stats = queue.stats()
+        if not stats:
+            print(f"[INFO] Очередь пуста: {args.queue}")
+        for job, counts in sorted(stats.items()):
+            print(f"{job:20} " + ", ".join(f"{k}: {v}" for k, v in sorted(counts.items())))
+
+
+if __name__ == "__main__":
+    main()